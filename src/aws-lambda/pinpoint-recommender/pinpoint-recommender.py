@@ -47,12 +47,28 @@ def lambda_handler(event, context):
                                                       EndpointId=key)
                 endpoint['Address'] = full_endpoint['EndpointResponse']['Address']
 
-            user_id = endpoint['User']['UserId']
-            recommendations_request = f'http://{recommendations_service_host}/recommendations?userID={user_id}&numResults=4&fullyQualifyImageUrls=1'
-            response = requests.get(recommendations_request)
+        # Retrieve recommendations for all endpoints' users in a single request.
+        user_ids = [endpoint['User']['UserId'] for endpoint in endpoints.values()]
+        recommendations_request = f'http://{recommendations_service_host}/recommendations/batch'
+        response = requests.post(recommendations_request, json={
+            'userIDs': user_ids,
+            'numResults': 4,
+            'fullyQualifyImageUrls': True
+        })
 
-            if response.ok:
-                recommended_items = response.json()
+        if response.ok:
+            # Results are returned as newline-delimited JSON with a line for each user.
+            recommended_items_by_user = {}
+            for line in response.iter_lines():
+                if line:
+                    result = json.loads(line)
+                    if 'error' in result:
+                        logger.error('Unable to get recommendations for user {}: {}'.format(result['userID'], result['error']))
+                    else:
+                        recommended_items_by_user[result['userID']] = result['items']
+
+            for key, endpoint in endpoints.items():
+                recommended_items = recommended_items_by_user.get(str(endpoint['User']['UserId']))
                 logger.debug(recommended_items)
 
                 if recommended_items:
@@ -80,8 +96,8 @@ def lambda_handler(event, context):
                     new_endpoints[key] = endpoint
                 else:
                     logger.error('Endpoint {} does not have any Recommendations'.format(key))
-            else:
-                logger.error(response)                                      
+        else:
+            logger.error(response)
     else:
         logger.error('Event is missing Endpoints document')
 
@@ -0,0 +1,138 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Structured, sampled access logging for the Flask services
+
+Each sampled request is logged as one JSON line with its method, path, status,
+duration, and the time spent in upstream calls wrapped with upstream(). Requests
+are sampled per path prefix so that high volume routes can be logged at a fraction
+of their traffic; server errors are always logged. The log line is only formatted
+if a handler emits it.
+
+ACCESS_LOG_SAMPLE_RATE sets the default rate (0 to 1) and ACCESS_LOG_SAMPLE_RATES
+overrides it for path prefixes, e.g. "/health=0,/recommendations=0.1".
+"""
+
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Dict
+from werkzeug.wsgi import ClosingIterator
+
+log = logging.getLogger('access_log')
+
+SAMPLE_RATE = float(os.environ.get('ACCESS_LOG_SAMPLE_RATE', 1.0))
+SAMPLE_RATES = os.environ.get('ACCESS_LOG_SAMPLE_RATES', '')
+
+# Milliseconds spent in upstream calls by name for the current request.
+_upstream_timings = contextvars.ContextVar('upstream_timings', default = None)
+_upstream_lock = threading.Lock()
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """ Parses "prefix=rate,prefix=rate" into a dictionary """
+    rates = {}
+    for entry in value.split(','):
+        if '=' in entry:
+            prefix, rate = entry.split('=', 1)
+            rates[prefix.strip()] = float(rate)
+    return rates
+
+@contextmanager
+def upstream(name: str):
+    """ Records the time spent in the enclosed block against the current request's upstream timings """
+    timings = _upstream_timings.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        with _upstream_lock:
+            timings[name] = timings.get(name, 0) + elapsed
+
+class _Entry:
+    """ Defers serializing an access log entry until a handler formats it """
+    __slots__ = ('fields',)
+
+    def __init__(self, fields: Dict):
+        self.fields = fields
+
+    def __str__(self):
+        return json.dumps(self.fields, separators = (',', ':'), default = str)
+
+class AccessLogMiddleware:
+    """ WSGI middleware that writes a structured access log for a sample of requests """
+    def __init__(self, app, sample_rate: float = SAMPLE_RATE, sample_rates: Dict[str, float] = None):
+        self._app = app
+        self.sample_rate = sample_rate
+        # Longest prefixes first so the most specific rate wins.
+        rates = parse_sample_rates(SAMPLE_RATES) if sample_rates is None else sample_rates
+        self.sample_rates = sorted(rates.items(), key = lambda rate: len(rate[0]), reverse = True)
+
+        # The services don't configure logging, so write entries to stderr unless the logger was set up elsewhere.
+        if log.level == logging.NOTSET:
+            log.setLevel(logging.INFO)
+        if not log.handlers:
+            handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            log.addHandler(handler)
+            log.propagate = False
+
+    def rate_for(self, path: str) -> float:
+        for prefix, rate in self.sample_rates:
+            if path.startswith(prefix):
+                return rate
+        return self.sample_rate
+
+    def __call__(self, environ, start_response):
+        start = time.perf_counter()
+        timings = {}
+        token = _upstream_timings.set(timings)
+        status = []
+
+        def log_start_response(response_status, headers, *args):
+            status.append(response_status)
+            return start_response(response_status, headers, *args)
+
+        def log_request():
+            status_code = int(status[-1].split(' ', 1)[0]) if status else 500
+            rate = self.rate_for(environ.get('PATH_INFO', ''))
+            if status_code < 500 and (rate <= 0 or (rate < 1 and random.random() >= rate)):
+                return
+            if not log.isEnabledFor(logging.INFO):
+                return
+
+            fields = {
+                'method': environ.get('REQUEST_METHOD'),
+                'path': environ.get('PATH_INFO'),
+                'query': environ.get('QUERY_STRING') or None,
+                'status': status_code,
+                'durationMs': round((time.perf_counter() - start) * 1000, 2)
+            }
+            if timings:
+                fields['upstreamMs'] = {name: round(elapsed, 2) for name, elapsed in timings.items()}
+            trace_id = environ.get('HTTP_X_AMZN_TRACE_ID')
+            if trace_id:
+                fields['traceId'] = trace_id
+            log.info('%s', _Entry(fields))
+
+        try:
+            response = self._app(environ, log_start_response)
+        except Exception:
+            log_request()
+            raise
+        finally:
+            _upstream_timings.reset(token)
+
+        # Log once the response body has been sent so that streamed responses are timed in full.
+        return ClosingIterator(response, log_request)
@@ -8,7 +8,7 @@ from flask_cors import CORS
 import boto3
 import json
 import os
-import pprint
+import access_log
 
 RESOURCE_BUCKET = os.environ.get('RESOURCE_BUCKET')
 
@@ -39,23 +39,6 @@ def load_s3_data():
     cstore_location = json.loads(route_file_obj.get()['Body'].read().decode('utf-8'))
 
 
-# -- Logging
-class LoggingMiddleware(object):
-    def __init__(self, app):
-        self._app = app
-
-    def __call__(self, environ, resp):
-        errorlog = environ['wsgi.errors']
-        pprint.pprint(('REQUEST', environ), stream=errorlog)
-
-        def log_response(status, headers, *args):
-            pprint.pprint(('RESPONSE', status, headers), stream=errorlog)
-            return resp(status, headers, *args)
-
-        return self._app(environ, log_response)
-# -- End Logging
-
-
 # -- Handlers
 app = Flask(__name__)
 corps = CORS(app)
@@ -87,7 +70,7 @@ def get_cstore_route():
 
 
 if __name__ == '__main__':
-    app.wsgi_app = LoggingMiddleware(app.wsgi_app)
+    app.wsgi_app = access_log.AccessLogMiddleware(app.wsgi_app)
     load_s3_data()
 
     app.run(debug=True, host='0.0.0.0', port=80)
@@ -6,7 +6,7 @@ from flask import abort, jsonify
 from flask_cors import CORS
 
 import json
-import pprint
+import access_log
 
 offers = []
 
@@ -17,23 +17,6 @@ def load_offers():
         offers = json.load(f)
 
 
-# -- Logging
-class LoggingMiddleware(object):
-    def __init__(self, app):
-        self._app = app
-
-    def __call__(self, environ, resp):
-        errorlog = environ['wsgi.errors']
-        pprint.pprint(('REQUEST', environ), stream=errorlog)
-
-        def log_response(status, headers, *args):
-            pprint.pprint(('RESPONSE', status, headers), stream=errorlog)
-            return resp(status, headers, *args)
-
-        return self._app(environ, log_response)
-# -- End Logging
-
-
 # -- Handlers
 app = Flask(__name__)
 corps = CORS(app)
@@ -58,7 +41,7 @@ def get_offer(offer_id):
 
 
 if __name__ == '__main__':
-    app.wsgi_app = LoggingMiddleware(app.wsgi_app)
+    app.wsgi_app = access_log.AccessLogMiddleware(app.wsgi_app)
 
     load_offers()
     app.run(debug=True, host='0.0.0.0', port=80)
\ No newline at end of file
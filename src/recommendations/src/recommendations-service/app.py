@@ -9,23 +9,37 @@ from aws_xray_sdk.core import patch_all
 
 from typing import Dict, List, Tuple, Union
 from flask import Flask, jsonify, Response
-from flask import request
+from flask import request, g, has_request_context
 
 from flask_cors import CORS
 from experimentation.experiment_manager import ExperimentManager
-from experimentation.resolvers import DefaultProductResolver, PersonalizeRecommendationsResolver, \
-    PersonalizeRankingResolver, RankingProductsNoOpResolver, PersonalizeContextComparePickResolver, RandomPickResolver
+from experimentation.evidently_feature_resolver import EvidentlyFeatureResolver
+from experimentation.resolvers import ResolverFactory
 from experimentation.utils import CompatEncoder
-from expiring_dict import ExpiringDict
+from experimentation.cache import TTLCache
+from experimentation.loading_cache import LoadingCache
+from experimentation.catalog import CatalogIndex
+from experimentation.offers import OfferCatalog, OfferIndex
+from experimentation.rate_limiter import RateLimitExceeded, TokenBucket
+from experimentation.aws_clients import client_config
+from experimentation.deadline import Deadline, DeadlineExceeded, HEADER as DEADLINE_HEADER, is_timeout, personalize_runtime_config
+from experimentation import concurrency, http_client, hydration, metrics, parameter_store, service_discovery, tracking
+from experimentation.counters import variation_counters
+from experimentation.evidently_events import event_buffer as evidently_event_buffer
+import access_log
 
 import json
 import os
-import pprint
 import boto3
 import requests
 import random
+import signal
+import sys
+import threading
+import time
 import logging
 from datetime import datetime
+from botocore.exceptions import BotoCoreError, ClientError
 
 # X-ray setup
 patch_all()
@@ -33,22 +47,63 @@ patch_all()
 NUM_DISCOUNTS = 2
 
 EXPERIMENTATION_LOGGING = True
-DEBUG_LOGGING = True
+# Level of the service's logs. At DEBUG, request and response payloads are logged for every request.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
 
 random.seed(42)  # Keep our demonstration deterministic
 
-# Since the DescribeRecommender/DescribeCampaign APIs easily throttles and we just
-# need the recipe from the recommender/campaign and it won't change often (if at all),
-# use a cache to help smooth out periods where we get throttled.
-personalize_meta_cache = ExpiringDict(2 * 60 * 60)
-
-servicediscovery = boto3.client('servicediscovery')
-personalize = boto3.client('personalize')
-personalize_runtime = boto3.client('personalize-runtime')
-ssm = boto3.client('ssm')
-codepipeline = boto3.client('codepipeline')
-sts = boto3.client('sts')
-cw_events = boto3.client('events')
+# Product details are requested for the same hot items over and over and rarely change,
+# so keep a bounded cache of them keyed by item ID and whether image URLs are fully qualified.
+product_cache = TTLCache(
+    max_size = int(os.environ.get('PRODUCT_CACHE_MAX_SIZE', 10000)),
+    ttl = int(os.environ.get('PRODUCT_CACHE_TTL', 300))
+)
+
+# Maximum number of product IDs the products service accepts in a single lookup.
+PRODUCT_LOOKUP_BATCH_SIZE = 100
+
+# Home page loads and the messaging/bot Lambda functions ask for the same user's recommendations
+# within seconds of each other, so results that aren't part of an experiment are cached briefly
+# to share a single Personalize inference. Endpoints opt in by passing a cache_ttl to get_products.
+# Entries are weighed by their serialized size so the cache is bounded by memory.
+result_cache = TTLCache(
+    max_size = int(os.environ.get('RESULT_CACHE_MAX_SIZE', 10000)),
+    ttl = 60,
+    max_weight = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+    weigher = lambda key, value: len(json.dumps(value, cls=CompatEncoder))
+)
+# Seconds that /recommendations and /popular results are cached; 0 disables caching.
+RECOMMENDATIONS_RESULT_CACHE_TTL = float(os.environ.get('RECOMMENDATIONS_RESULT_CACHE_TTL', 10))
+POPULAR_RESULT_CACHE_TTL = float(os.environ.get('POPULAR_RESULT_CACHE_TTL', 30))
+
+# Limits for /recommendations/batch. Recommendations for users in a batch are resolved by up to
+# BATCH_CONCURRENCY threads and Personalize calls for all batches are limited to BATCH_RATE_LIMIT per second.
+BATCH_MAX_USERS = int(os.environ.get('BATCH_MAX_USERS', 1000))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))
+BATCH_RATE_LIMIT_TIMEOUT = float(os.environ.get('BATCH_RATE_LIMIT_TIMEOUT', 30))
+batch_rate_limiter = TokenBucket(rate = float(os.environ.get('BATCH_RATE_LIMIT', 20)))
+# Errors for a single user that are reported in that user's line of a batch response. Any
+# other error is a bug and ends the response.
+BATCH_USER_ERRORS = (ClientError, BotoCoreError, requests.RequestException, RateLimitExceeded,
+                     DeadlineExceeded, TimeoutError, LookupError, ValueError)
+
+# Items last returned by DefaultProductResolver for each current item, served when resolving
+# items for a request runs out of time, and the seconds allowed for DefaultProductResolver when
+# it is used as a fallback without cached items.
+fallback_cache = TTLCache(
+    max_size = int(os.environ.get('FALLBACK_CACHE_MAX_SIZE', 1000)),
+    ttl = int(os.environ.get('FALLBACK_CACHE_TTL', 60 * 60))
+)
+FALLBACK_DEADLINE = float(os.environ.get('FALLBACK_DEADLINE', 1.0))
+
+# Return the time spent in each stage of a request in a Server-Timing response header.
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'false').lower() == 'true'
+
+personalize = boto3.client('personalize', config = client_config())
+personalize_runtime = boto3.client('personalize-runtime', config = personalize_runtime_config())
+codepipeline = boto3.client('codepipeline', config = client_config())
+sts = boto3.client('sts', config = client_config())
+cw_events = boto3.client('events', config = client_config())
 
 # SSM parameter name for the Personalize filter for purchased and c-store items
 filter_purchased_param_name = '/retaildemostore/personalize/filters/filter-purchased-arn'
@@ -61,68 +116,55 @@ offers_arn_param_name = '/retaildemostore/personalize/personalized-offers-arn'
 
 # -- Shared Functions
 
-def get_recipe(arn):
-    """ Returns the Amazon Personalize recipe ARN for the specified campaign/recommender ARN """
-    recipe = None
-
-    is_recommender = arn.split(':')[5].startswith('recommender/')
-
-    resource = personalize_meta_cache.get(arn)
-    if not resource:
-        if is_recommender:
-            response = personalize.describe_recommender(recommenderArn = arn)
-            if response.get('recommender'):
-                resource = response['recommender']
-                personalize_meta_cache[arn] = resource
-        else:
-            response = personalize.describe_campaign(campaignArn = arn)
-            if response.get('campaign'):
-                resource = response['campaign']
-                personalize_meta_cache[arn] = resource
-
-    if resource:
-        if is_recommender:
-            recipe = resource['recipeArn']
-        else:
-            solution_version = personalize_meta_cache.get(resource['solutionVersionArn'])
+def describe_recipe(arn):
+    """ Looks up the Amazon Personalize recipe ARN for the specified campaign/recommender ARN """
+    if arn.split(':')[5].startswith('recommender/'):
+        response = personalize.describe_recommender(recommenderArn = arn)
+        return response['recommender']['recipeArn']
 
-            if not solution_version:
-                response = personalize.describe_solution_version(solutionVersionArn = resource['solutionVersionArn'])
-                if response.get('solutionVersion'):
-                    solution_version = response['solutionVersion']
-                    personalize_meta_cache[resource['solutionVersionArn']] = solution_version
+    response = personalize.describe_campaign(campaignArn = arn)
+    solution_version_arn = response['campaign']['solutionVersionArn']
+    response = personalize.describe_solution_version(solutionVersionArn = solution_version_arn)
+    return response['solutionVersion']['recipeArn']
 
-            if solution_version:
-                recipe = solution_version['recipeArn']
+# Since the DescribeRecommender/DescribeCampaign APIs easily throttles and we just
+# need the recipe from the recommender/campaign and it won't change often (if at all),
+# cache recipes. When a recipe expires it is refreshed in the background while the
+# cached recipe is still served, and failed lookups aren't retried for a minute.
+recipe_cache = LoadingCache(
+    describe_recipe,
+    ttl = int(os.environ.get('RECIPE_CACHE_TTL', 2 * 60 * 60)),
+    negative_ttl = int(os.environ.get('RECIPE_CACHE_NEGATIVE_TTL', 60)),
+    name = 'recipe'
+)
+
+def get_recipe(arn):
+    """ Returns the Amazon Personalize recipe ARN for the specified campaign/recommender ARN or None if it can't be determined """
+    return recipe_cache.get(arn)
+
+def add_recipe_header(resp_headers: Dict, arn):
+    """ Adds the recipe for a campaign/recommender ARN to the X-Personalize-Recipe response header """
+    recipe_arn = get_recipe(arn)
+    if not recipe_arn:
+        return
+    if resp_headers.get('X-Personalize-Recipe'):
+        resp_headers['X-Personalize-Recipe'] = resp_headers['X-Personalize-Recipe'] + ',' + recipe_arn
+    else:
+        resp_headers['X-Personalize-Recipe'] = recipe_arn
 
-    return recipe
+def warm_recipe_cache():
+    """ Looks up recipes for all campaigns/recommenders configured in SSM so that requests don't wait on them """
+    try:
+        for value in parameter_store.get_all_parameters().values():
+            if value and value.startswith('arn:aws:personalize:') and value.split(':')[5].startswith(('campaign/', 'recommender/')):
+                get_recipe(value)
+    except Exception as e:
+        logger.warning('Unable to warm recipe cache: %s', e)
 
+@metrics.timed('parameters')
 def get_parameter_values(names):
     """ Returns values for SSM parameters or None for params that don't exist or that have value equal 'NONE' """
-    if isinstance(names, str):
-        names = [ names ]
-
-    response = ssm.get_parameters(Names = names)
-
-    values = []
-
-    for name in names:
-        found = False
-        for param in response['Parameters']:
-            if param['Name'] == name:
-                found = True
-                if param['Value'] != 'NONE':
-                    values.append(param['Value'])
-                else:
-                    values.append(None)
-                break
-
-        if not found:
-            values.append(None)
-
-    assert len(values) == len(names), 'mismatch in number of values returned for names'
-
-    return values
+    return parameter_store.get_parameter_values(names)
 
 def get_timestamp_from_request() -> datetime:
     timestamp_raw = request.args.get('timestamp')
@@ -148,29 +190,55 @@ def get_products_service_host_and_port() -> Tuple[str, int]:
 
     if not products_service_host:
         # Get product service instance. We'll need it rehydrate product info for recommendations.
-        response = servicediscovery.discover_instances(
-            NamespaceName='retaildemostore.local',
-            ServiceName='products',
-            MaxResults=1,
-            HealthStatus='HEALTHY'
-        )
-
-        products_service_host = response['Instances'][0]['Attributes']['AWS_INSTANCE_IPV4']
+        products_service_host = service_discovery.get_instance('products')
 
     return products_service_host, products_service_port
 
+@metrics.timed('products')
 def fetch_product_details(item_ids: Union[str, List[str]], fully_qualify_image_urls=False) -> List[Dict]:
-    """ Fetches details for one or more products from the products service """
+    """ Fetches details for one or more products from the product cache or the products service
+
+    Products that are not already cached are looked up from the products service using as
+    few bulk requests as possible. The returned products are copies of the cached products
+    so callers are free to modify them.
+    """
+    if isinstance(item_ids, str):
+        item_ids = [ item_ids ]
+
+    # Preserve the caller's order while dropping duplicate IDs.
+    item_ids = list(dict.fromkeys(item_ids))
+
+    products_by_id = {}
+    missing_ids = []
+    for item_id in item_ids:
+        product = product_cache.get((item_id, fully_qualify_image_urls))
+        if product is None:
+            missing_ids.append(item_id)
+        else:
+            products_by_id[item_id] = product
+
+    for i in range(0, len(missing_ids), PRODUCT_LOOKUP_BATCH_SIZE):
+        products = request_product_details(missing_ids[i:i + PRODUCT_LOOKUP_BATCH_SIZE], fully_qualify_image_urls)
+        for product in products:
+            product_cache.put((product['id'], fully_qualify_image_urls), product)
+            products_by_id[product['id']] = product
+        catalog_index.add(products)
+
+    return [dict(products_by_id[item_id]) for item_id in item_ids if item_id in products_by_id]
+
+def request_product_details(item_ids: List[str], fully_qualify_image_urls=False) -> List[Dict]:
+    """ Looks up details for a batch of products from the products service """
     products_service_host, products_service_port = get_products_service_host_and_port()
 
-    item_ids_csv = item_ids if isinstance(item_ids, str) else ','.join(item_ids)
+    item_ids_csv = ','.join(item_ids)
 
     url = f'http://{products_service_host}:{products_service_port}/products/id/{item_ids_csv}?fullyQualifyImageUrls={fully_qualify_image_urls}'
-    app.logger.debug(f"Asking for product info from {url}")
+    app.logger.debug("Asking for product info from %s", url)
 
     products = []
 
-    response = requests.get(url)
+    with service_discovery.evict_on_connection_error('products', products_service_host), access_log.upstream('products'):
+        response = http_client.get(url)
     if response.ok:
         products = response.json()
         if not isinstance(products, list):
@@ -178,9 +246,71 @@ def fetch_product_details(item_ids: Union[str, List[str]], fully_qualify_image_u
 
     return products
 
+def request_all_products() -> List[Dict]:
+    """ Retrieves the full catalog from the products service """
+    products_service_host, products_service_port = get_products_service_host_and_port()
+
+    url = f'http://{products_service_host}:{products_service_port}/products/all'
+    with service_discovery.evict_on_connection_error('products', products_service_host):
+        response = http_client.get(url)
+    response.raise_for_status()
+    return response.json()
+
+# Index of the category for every product so /related can filter by the current
+# item's category without a products service lookup.
+catalog_index = CatalogIndex(request_all_products)
+
+def hydrate_items(items: List[Dict], fully_qualify_image_urls=False, products: List[Dict] = None) -> List[Dict]:
+    """ Replaces the item ID of recommended items with the product details for the item
+
+    Product details are fetched for the items unless they were already fetched by the caller.
+    """
+    if products is None:
+        products = fetch_product_details([item['itemId'] for item in items], fully_qualify_image_urls)
+
+    return hydration.hydrate_items(items, products)
+
+def get_request_deadline() -> Deadline:
+    """ Returns the deadline for resolving items for the current request
+
+    Outside of a request, such as for each user of a batch, a new deadline is started.
+    """
+    if has_request_context() and 'deadline' in g:
+        return g.deadline
+    return Deadline()
+
+def get_default_items(current_item_id, num_results, deadline: Deadline = None) -> List[Dict]:
+    """ Returns items from DefaultProductResolver and keeps them to fall back on """
+    products_service_host, products_service_port = get_products_service_host_and_port()
+    resolver = ResolverFactory.get(ResolverFactory.TYPE_PRODUCT, products_service_host = products_service_host,
+                                   products_service_port = products_service_port)
+
+    with access_log.upstream('resolver'):
+        items = resolver.get_items(product_id = current_item_id, num_results = num_results, deadline = deadline)
+
+    fallback_cache.put(current_item_id, [dict(item) for item in items])
+    return items
+
+def get_fallback_items(stage, current_item_id, num_results, error) -> List[Dict]:
+    """ Returns default items for a request that ran out of time resolving items
+
+    Items last returned by DefaultProductResolver for the current item are served if
+    available. Otherwise DefaultProductResolver is called with a short deadline.
+    """
+    app.logger.warning('Ran out of time resolving items for %s; falling back to default items: %s', stage, error)
+
+    cached = fallback_cache.get(current_item_id)
+    if cached is not None:
+        metrics.registry.increment('fallbacks', stage = stage, source = 'cached')
+        return [dict(item) for item in cached[:num_results]]
+
+    items = get_default_items(current_item_id, num_results, Deadline(FALLBACK_DEADLINE))
+    metrics.registry.increment('fallbacks', stage = stage, source = 'default')
+    return items
+
 def get_products(feature, user_id, current_item_id, num_results, default_inference_arn_param_name,
                  default_filter_arn_param_name, filter_values=None, user_reqd_for_inference=False, fully_qualify_image_urls=False,
-                 promotion: Dict = None
+                 promotion: Dict = None, hydrate=True, cache_ttl: float = 0, deadline: Deadline = None
                  ):
     """ Returns products given a UI feature, user, item/product.
 
@@ -200,6 +330,9 @@ def get_products(feature, user_id, current_item_id, num_results, default_inferen
         user_reqd_for_inference: Require a user ID to use Personalze - otherwise default
         fully_qualify_image_urls: Fully qualify image URLs n here
         promotion: Personalize promotional filter configuration
+        hydrate: Add product details to items; when False, callers are expected to call hydrate_items
+        cache_ttl: Seconds to cache results for users that aren't in an experiment; 0 disables caching
+        deadline: Deadline for resolving items, after which default items are returned; defaults to the request's deadline
     Returns:
         A prepared HTTP response object.
     """
@@ -209,28 +342,51 @@ def get_products(feature, user_id, current_item_id, num_results, default_inferen
     experiment = None
     exp_manager = None
 
+    if deadline is None:
+        deadline = get_request_deadline()
+
     # Get active experiment if one is setup for feature and we have a user.
     if feature and user_id:
         exp_manager = ExperimentManager()
         experiment = exp_manager.get_active(feature, user_id)
 
+    # Users in an experiment are never served cached results so that every exposure is tracked.
+    cache_key = None
+    cached = None
+    if not experiment and cache_ttl > 0:
+        cache_key = (feature, user_id, current_item_id, default_inference_arn_param_name, default_filter_arn_param_name,
+                     json.dumps(filter_values, sort_keys=True), json.dumps(promotion, sort_keys=True),
+                     num_results, user_reqd_for_inference)
+        cached = result_cache.get(cache_key)
+
     if experiment:
         # Get items from experiment.
         tracker = exp_manager.default_tracker()
 
-        items = experiment.get_items(
-            user_id = user_id,
-            current_item_id = current_item_id,
-            num_results = num_results,
-            tracker = tracker,
-            filter_values = filter_values,
-            timestamp = get_timestamp_from_request(),
-            promotion = promotion
-        )
+        try:
+            with access_log.upstream('experiment'):
+                items = experiment.get_items(
+                    user_id = user_id,
+                    current_item_id = current_item_id,
+                    num_results = num_results,
+                    tracker = tracker,
+                    filter_values = filter_values,
+                    timestamp = get_timestamp_from_request(),
+                    promotion = promotion,
+                    deadline = deadline
+                )
 
-        resp_headers['X-Experiment-Name'] = experiment.name
-        resp_headers['X-Experiment-Type'] = experiment.type
-        resp_headers['X-Experiment-Id'] = experiment.id
+            resp_headers['X-Experiment-Name'] = experiment.name
+            resp_headers['X-Experiment-Type'] = experiment.type
+            resp_headers['X-Experiment-Id'] = experiment.id
+        except Exception as e:
+            if not is_timeout(e):
+                raise
+            items = get_fallback_items('experiment', current_item_id, num_results, e)
+    elif cached is not None:
+        # Copy cached items since hydration modifies them.
+        items = [dict(item) for item in cached[0]]
+        resp_headers.update(cached[1])
     else:
         # Fallback to default behavior of checking for campaign/recommender ARN parameter and
         # then the default product resolver.
@@ -241,69 +397,39 @@ def get_products(feature, user_id, current_item_id, num_results, default_inferen
 
         if inference_arn and (user_id or not user_reqd_for_inference):
 
-            logger.info(f"get_products: Supplied campaign/recommender: {inference_arn} (from {default_inference_arn_param_name}) Supplied filter: {filter_arn} (from {default_filter_arn_param_name}) Supplied user: {user_id}")
-
-            resolver = PersonalizeRecommendationsResolver(inference_arn = inference_arn, filter_arn = filter_arn)
-
-            items = resolver.get_items(
-                user_id = user_id,
-                product_id = current_item_id,
-                num_results = num_results,
-                filter_values = filter_values,
-                promotion = promotion
-            )
-
-            resp_headers['X-Personalize-Recipe'] = get_recipe(inference_arn)
+            logger.debug("get_products: Supplied campaign/recommender: %s (from %s) Supplied filter: %s (from %s) Supplied user: %s", inference_arn, default_inference_arn_param_name, filter_arn, default_filter_arn_param_name, user_id)
+
+            resolver = ResolverFactory.get(ResolverFactory.TYPE_PERSONALIZE_RECOMMENDATIONS, inference_arn = inference_arn, filter_arn = filter_arn)
+
+            try:
+                with access_log.upstream('resolver'):
+                    items = resolver.get_items(
+                        user_id = user_id,
+                        product_id = current_item_id,
+                        num_results = num_results,
+                        filter_values = filter_values,
+                        promotion = promotion,
+                        deadline = deadline
+                    )
+
+                add_recipe_header(resp_headers, inference_arn)
+            except Exception as e:
+                if not is_timeout(e):
+                    raise
+                items = get_fallback_items('personalize', current_item_id, num_results, e)
+                # Don't cache default items in place of personalized ones.
+                cache_key = None
         else:
-            products_service_host, products_service_port = get_products_service_host_and_port()
-            resolver = DefaultProductResolver(products_service_host = products_service_host, products_service_port = products_service_port)
-
-            items = resolver.get_items(product_id = current_item_id, num_results = num_results)
-
-    item_ids = [item['itemId'] for item in items]
-
-    products = fetch_product_details(item_ids, fully_qualify_image_urls)
-    for item in items:
-        item_id = item['itemId']
-
-        product = next((p for p in products if p['id'] == item_id), None)
-        if product is not None and 'experiment' in item and 'url' in product:
-            # Append the experiment correlation ID to the product URL so it gets tracked if used by client.
-            product_url = product.get('url')
-            if '?' in product_url:
-                product_url += '&'
-            else:
-                product_url += '?'
-
-            product_url += 'exp=' + item['experiment']['correlationId']
+            items = get_default_items(current_item_id, num_results)
 
-            product['url'] = product_url
+        if cache_key is not None:
+            result_cache.put(cache_key, ([dict(item) for item in items], dict(resp_headers)), ttl = cache_ttl)
 
-        item.update({
-            'product': product
-        })
-
-        item.pop('itemId')
+    if hydrate:
+        hydrate_items(items, fully_qualify_image_urls)
 
     return items, resp_headers
 
-# -- Logging
-class LoggingMiddleware(object):
-    def __init__(self, app):
-        self._app = app
-
-    def __call__(self, environ, resp):
-        errorlog = environ['wsgi.errors']
-        pprint.pprint(('REQUEST', environ), stream=errorlog)
-
-        def log_response(status, headers, *args):
-            pprint.pprint(('RESPONSE', status, headers), stream=errorlog)
-            return resp(status, headers, *args)
-
-        return self._app(environ, log_response)
-
-# -- End Logging
-
 # -- Exceptions
 class BadRequest(Exception):
     status_code = 400
@@ -343,6 +469,55 @@ def index():
 def health():
     return 'OK'
 
+@app.before_request
+def start_request_timing():
+    g.request_started = time.perf_counter()
+    g.deadline = Deadline.from_header(request.headers.get(DEADLINE_HEADER))
+    metrics.start_request()
+
+@app.after_request
+def finish_request_timing(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+
+    elapsed = time.perf_counter() - started
+    metrics.registry.observe('request', elapsed)
+    if SERVER_TIMING:
+        timings = dict(metrics.request_timings() or {})
+        timings['total'] = elapsed
+        response.headers['Server-Timing'] = metrics.server_timing(timings)
+    return response
+
+def get_cache_stats():
+    return {
+        'products': product_cache.stats(),
+        'results': result_cache.stats(),
+        'recipes': recipe_cache.stats(),
+        'experiments': ExperimentManager.cache_stats(),
+        'evidentlyEvaluations': EvidentlyFeatureResolver.cache_stats(),
+        'resolvers': ResolverFactory.pool_stats()
+    }
+
+def get_buffer_stats():
+    """ Returns the statistics of events and counters that are written in the background """
+    stats = {f'kinesis:{stream_name}': stream_stats for stream_name, stream_stats in tracking.record_buffer_stats().items()}
+    stats['experimentCounters'] = variation_counters.stats()
+    stats['evidentlyEvents'] = evidently_event_buffer.stats()
+    return stats
+
+@app.route('/cache/stats')
+def cache_stats():
+    """ Returns hit/miss counters for the in-process caches to help with sizing them """
+    return jsonify(get_cache_stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """ Returns stage latency histograms and cache and buffer counters in the Prometheus text format """
+    text = (metrics.registry.render() + metrics.render_cache_stats(get_cache_stats()) +
+            metrics.render_buffer_stats(get_buffer_stats()))
+    return Response(text, content_type = 'text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/related', methods=['GET'])
 def related():
     """ Returns related products given an item/product.
@@ -372,11 +547,13 @@ def related():
         filter_ssm = filter_cstore_param_name
     elif filter_ssm == 'purchased': 
         filter_ssm = filter_purchased_param_name
-    app.logger.info("Filter SSM for /related: %s", filter_ssm)
+    app.logger.debug("Filter SSM for /related: %s", filter_ssm)
 
     filter_values = None
     if filter_ssm == filter_include_categories_param_name:
         category = request.args.get('currentItemCategory')
+        if not category:
+            category = catalog_index.get_category(current_item_id)
         if not category:
             products = fetch_product_details(current_item_id)
             if products:
@@ -406,14 +583,19 @@ def related():
             default_inference_arn_param_name='/retaildemostore/personalize/related-items-arn',
             default_filter_arn_param_name=filter_ssm,
             filter_values=filter_values,
-            fully_qualify_image_urls = fully_qualify_image_urls
+            fully_qualify_image_urls = fully_qualify_image_urls,
+            hydrate = not rerank_items
         )
 
         if rerank_items:
+            # Prefetch product details for all candidates while they are being ranked.
+            products_future = concurrency.submit(fetch_product_details, [item['itemId'] for item in items], fully_qualify_image_urls)
+
             app.logger.info('Reranking related items to personalize order for user %s', user_id)
             items, resp_headers = get_ranking(user_id, items, feature = None, resp_headers = resp_headers)
 
             items = items[0:num_results]    # Trim back down to the requested number of items.
+            hydrate_items(items, fully_qualify_image_urls, products_future.result())
 
         resp = Response(json.dumps(items, cls=CompatEncoder), content_type = 'application/json', headers = resp_headers)
         return resp
@@ -456,7 +638,7 @@ def recommendations():
         filter_ssm = filter_cstore_param_name
     elif filter_ssm == 'purchased': 
         filter_ssm = filter_purchased_param_name
-    app.logger.info(f"Filter SSM for /recommendations: {filter_ssm}")
+    app.logger.debug("Filter SSM for /recommendations: %s", filter_ssm)
 
     fully_qualify_image_urls = request.args.get('fullyQualifyImageUrls', '0').lower() in [ 'true', 't', '1']
 
@@ -478,7 +660,8 @@ def recommendations():
             default_inference_arn_param_name='/retaildemostore/personalize/recommended-for-you-arn',
             default_filter_arn_param_name=filter_ssm,
             fully_qualify_image_urls = fully_qualify_image_urls,
-            promotion = promotion
+            promotion = promotion,
+            cache_ttl = RECOMMENDATIONS_RESULT_CACHE_TTL
         )
 
         response = Response(json.dumps(items, cls=CompatEncoder), content_type = 'application/json', headers = resp_headers)
@@ -490,6 +673,99 @@ def recommendations():
         app.logger.exception('Unexpected error generating recommendations', e)
         raise BadRequest(message = 'Unhandled error', status_code = 500)
 
+@app.route('/recommendations/batch', methods=['POST'])
+def recommendations_batch():
+    """ Returns item/product recommendations for many users in a single request.
+
+    Intended for messaging use cases (e.g. Pinpoint campaigns) that need recommendations
+    for a batch of users. Experiments are not used for batch requests. Recommendations
+    are resolved concurrently, subject to a service-wide rate limit on Personalize calls.
+    Results are streamed as newline-delimited JSON with one line per user as each user's
+    recommendations are ready, so lines are not in the order requested. Products for the
+    users whose recommendations are ready together are looked up at once, so each product
+    is fetched at most once per wave of users.
+    """
+    content = request.get_json(silent = True) or {}
+
+    user_ids = content.get('userIDs')
+    if not user_ids or not isinstance(user_ids, list):
+        raise BadRequest('userIDs is required')
+    if len(user_ids) > BATCH_MAX_USERS:
+        raise BadRequest(f'userIDs must contain no more than {BATCH_MAX_USERS} users')
+
+    # Drop duplicate users while preserving the caller's order.
+    user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+
+    num_results = content.get('numResults', 25)
+    if not isinstance(num_results, int) or num_results < 1:
+        raise BadRequest('numResults must be greater than zero')
+    if num_results > 100:
+        raise BadRequest('numResults must be less than 100')
+
+    # The default filter is the not-already-purchased filter
+    filter_ssm = content.get('filter', filter_purchased_param_name)
+    # We have short names for these filters
+    if filter_ssm == 'cstore':
+        filter_ssm = filter_cstore_param_name
+    elif filter_ssm == 'purchased':
+        filter_ssm = filter_purchased_param_name
+
+    fully_qualify_image_urls = str(content.get('fullyQualifyImageUrls', '0')).lower() in [ 'true', 't', '1']
+
+    promotion = None
+    promotion_filter_arn = get_parameter_values(promotion_filter_param_name)[0]
+    if promotion_filter_arn:
+        promotion = {
+            'name': 'promotedItem',
+            'percentPromotedItems': 25,
+            'filterArn': promotion_filter_arn
+        }
+
+    def user_recommendations(user_id):
+        if not batch_rate_limiter.acquire(timeout = BATCH_RATE_LIMIT_TIMEOUT):
+            raise RateLimitExceeded('Rate limit exceeded')
+
+        items, _ = get_products(
+            feature = None,
+            user_id = user_id,
+            current_item_id = None,
+            num_results = num_results,
+            default_inference_arn_param_name='/retaildemostore/personalize/recommended-for-you-arn',
+            default_filter_arn_param_name=filter_ssm,
+            promotion = promotion,
+            hydrate = False,
+            cache_ttl = RECOMMENDATIONS_RESULT_CACHE_TTL
+        )
+        return items
+
+    def generate():
+        for wave in concurrency.map_completed(user_recommendations, user_ids, BATCH_CONCURRENCY):
+            results = {}
+            for user_id, future in wave:
+                try:
+                    results[user_id] = future.result()
+                except BATCH_USER_ERRORS as e:
+                    app.logger.warning('Unable to get recommendations for user %s in batch: %s', user_id, e)
+                    results[user_id] = e
+
+            # Look up products for all users in the wave at once so each product is only fetched once.
+            item_ids = [item['itemId'] for items in results.values() if not isinstance(items, Exception) for item in items]
+            products = []
+            try:
+                products = fetch_product_details(item_ids, fully_qualify_image_urls)
+            except BATCH_USER_ERRORS as e:
+                app.logger.warning('Unable to look up products for users in batch: %s', e)
+                results = {user_id: result if isinstance(result, Exception) else e for user_id, result in results.items()}
+
+            for user_id, result in results.items():
+                if isinstance(result, Exception):
+                    line = {'userID': user_id, 'error': str(result)}
+                else:
+                    line = {'userID': user_id, 'items': hydrate_items(result, fully_qualify_image_urls, products)}
+                yield json.dumps(line, cls=CompatEncoder) + '\n'
+
+    return Response(generate(), content_type = 'application/x-ndjson')
+
 @app.route('/popular', methods=['GET'])
 def popular():
     """ Returns item/product recommendations for a given user in the context
@@ -524,7 +800,7 @@ def popular():
         filter_ssm = filter_cstore_param_name
     elif filter_ssm == 'purchased': 
         filter_ssm = filter_purchased_cstore_param_name
-    app.logger.info(f"Filter SSM for /recommendations: {filter_ssm}")
+    app.logger.debug("Filter SSM for /recommendations: %s", filter_ssm)
 
     fully_qualify_image_urls = request.args.get('fullyQualifyImageUrls', '0').lower() in [ 'true', 't', '1']
 
@@ -546,7 +822,8 @@ def popular():
             default_inference_arn_param_name='/retaildemostore/personalize/popular-items-arn',
             default_filter_arn_param_name=filter_ssm,
             fully_qualify_image_urls = fully_qualify_image_urls,
-            promotion = promotion
+            promotion = promotion,
+            cache_ttl = POPULAR_RESULT_CACHE_TTL
         )
 
         response = Response(json.dumps(items, cls=CompatEncoder), content_type = 'application/json', headers = resp_headers)
@@ -566,7 +843,7 @@ def ranking_request_params():
     """
 
     content = request.json
-    app.logger.info(f"JSON payload: {content}")
+    app.logger.debug("JSON payload: %s", content)
 
     user_id = content.get('userID')
     if not user_id:
@@ -581,10 +858,16 @@ def ranking_request_params():
     if not feature:
         feature = request.args.get('feature')
 
-    app.logger.info(f"Items pulled from json: {items}")
+    app.logger.debug("Items pulled from json: %s", items)
 
     return user_id, items, feature
 
+def get_unranked_fallback(stage, item_ids, error) -> List[Dict]:
+    """ Returns items in the order given for a request that ran out of time ranking them """
+    app.logger.warning('Ran out of time ranking items for %s; returning them unranked: %s', stage, error)
+    metrics.registry.increment('fallbacks', stage = stage, source = 'unranked')
+    return [{'itemId': item_id} for item_id in item_ids]
+
 def get_ranking(user_id, items, feature,
                 default_inference_arn_param_name='/retaildemostore/personalize/personalized-ranking-arn',
                 top_n=None, context=None, resp_headers=None):
@@ -606,23 +889,16 @@ def get_ranking(user_id, items, feature,
         Items as passed in, but ordered according to reranker - also might have experimentation metadata added.
     """
 
-    app.logger.info(f"Items given for ranking: {items}")
+    app.logger.debug("Items given for ranking: %s", items)
 
     # Extract item IDs from items supplied by caller. Note that unranked items
     # can be specified as a list of objects with just an 'itemId' key or as a
     # list of fully defined items/products (i.e. with an 'id' key).
-    item_map = {}
-    unranked_items = []
-    for item in items:
-        item_id = item.get('itemId')
-        if not item_id:
-            item_id = item.get('id')
-        if not item_id and item.get('product'):
-            item_id = item.get('product').get('id')
-        item_map[item_id] = item
-        unranked_items.append(item_id)
-
-    app.logger.info(f"Unranked items: {unranked_items}")
+    item_map, unranked_items = hydration.index_items(items)
+
+    app.logger.debug("Unranked items: %s", unranked_items)
+
+    deadline = get_request_deadline()
 
     if resp_headers is None:
         resp_headers = {}
@@ -641,72 +917,62 @@ def get_ranking(user_id, items, feature,
         # Get ranked items from experiment.
         tracker = exp_manager.default_tracker()
 
-        ranked_items = experiment.get_items(
-            user_id=user_id,
-            item_list=unranked_items,
-            tracker=tracker,
-            context=context,
-            timestamp=get_timestamp_from_request()
-        )
+        try:
+            with access_log.upstream('experiment'):
+                ranked_items = experiment.get_items(
+                    user_id=user_id,
+                    item_list=unranked_items,
+                    tracker=tracker,
+                    context=context,
+                    timestamp=get_timestamp_from_request(),
+                    deadline=deadline
+                )
 
-        app.logger.debug("Experiment ranking resolver gave us this ranking: %s", ranked_items)
+            app.logger.debug("Experiment ranking resolver gave us this ranking: %s", ranked_items)
 
-        resp_headers['X-Experiment-Name'] = experiment.name
-        resp_headers['X-Experiment-Type'] = experiment.type
-        resp_headers['X-Experiment-Id'] = experiment.id
+            resp_headers['X-Experiment-Name'] = experiment.name
+            resp_headers['X-Experiment-Type'] = experiment.type
+            resp_headers['X-Experiment-Id'] = experiment.id
+        except Exception as e:
+            if not is_timeout(e):
+                raise
+            ranked_items = get_unranked_fallback('ranking', unranked_items, e)
     else:
         # Fallback to default behavior of checking for campaign/recommender ARN parameter and
         # then the default product resolver.
         values = get_parameter_values([default_inference_arn_param_name, filter_purchased_param_name])
-        app.logger.info(f'Falling back to Personalize: {values}')
+        app.logger.debug('Falling back to Personalize: %s', values)
 
         inference_arn = values[0]
         filter_arn = values[1]
 
         if inference_arn:
-            resolver = PersonalizeRankingResolver(inference_arn=inference_arn, filter_arn=filter_arn)
-            recipe_arn = get_recipe(inference_arn)
-            if resp_headers.get('X-Personalize-Recipe'):
-                resp_headers['X-Personalize-Recipe'] = resp_headers['X-Personalize-Recipe'] + ',' + recipe_arn
-            else:
-                resp_headers['X-Personalize-Recipe'] = recipe_arn
+            resolver = ResolverFactory.get(ResolverFactory.TYPE_PERSONALIZE_RANKING, inference_arn=inference_arn, filter_arn=filter_arn)
+            add_recipe_header(resp_headers, inference_arn)
         else:
-            app.logger.info(f'Falling back to No-op: {values}')
-            resolver = RankingProductsNoOpResolver()
-
-        ranked_items = resolver.get_items(
-            user_id=user_id,
-            product_list=unranked_items,
-            context=context
-        )
+            app.logger.debug('Falling back to No-op: %s', values)
+            resolver = ResolverFactory.get(ResolverFactory.TYPE_RANKING_NO_OP)
+
+        try:
+            with access_log.upstream('resolver'):
+                ranked_items = resolver.get_items(
+                    user_id=user_id,
+                    product_list=unranked_items,
+                    context=context,
+                    deadline=deadline
+                )
+        except Exception as e:
+            if not is_timeout(e):
+                raise
+            ranked_items = get_unranked_fallback('ranking', unranked_items, e)
 
-    response_items = []
     if top_n is not None:
         # We may not want to return them all - for example in a "pick the top N" scenario.
         ranked_items = ranked_items[:top_n]
 
-    for ranked_item in ranked_items:
-        # Unlike with /recommendations and /related we are not hitting the products API to get product info back
-        # The caller may have left that info in there so in case they have we want to leave it in.
-        item = item_map.get(ranked_item.get('itemId'))
-
-        if 'experiment' in ranked_item:
-
-            item['experiment'] = ranked_item['experiment']
-
-            if 'url' in item:
-                # Append the experiment correlation ID to the product URL so it gets tracked if used by client.
-                product_url = item.get('url')
-                if '?' in product_url:
-                    product_url += '&'
-                else:
-                    product_url += '?'
-
-                product_url += 'exp=' + ranked_item['experiment']['correlationId']
-
-                item['url'] = product_url
-
-        response_items.append(item)
+    # Unlike with /recommendations and /related we are not hitting the products API to get product info back
+    # The caller may have left that info in there so in case they have we want to leave it in.
+    response_items = hydration.merge_ranked_items(ranked_items, item_map)
 
     return response_items, resp_headers
 
@@ -718,9 +984,8 @@ def rerank():
     items = []
     try:
         user_id, items, feature = ranking_request_params()
-        print('ITEMS', items)
         response_items, resp_headers = get_ranking(user_id, items, feature)
-        app.logger.debug(f"Response items for reranking: {response_items}")
+        app.logger.debug("Response items for reranking: %s", response_items)
         resp = Response(json.dumps(response_items, cls=CompatEncoder), content_type='application/json',
                         headers=resp_headers)
         return resp
@@ -747,19 +1012,16 @@ def get_top_n(user_id, items, feature, top_n,
         Items as passed in, but truncated according to picker - also might have experimentation metadata added.
     """
 
-    app.logger.info(f"Items given for top-n: {items}")
+    app.logger.debug("Items given for top-n: %s", items)
 
     # Extract item IDs from items supplied by caller. Note that unranked items
     # can be specified as a list of objects with just an 'itemId' key or as a
     # list of fully defined items/products (i.e. with an 'id' key).
-    item_map = {}
-    unranked_items = []
-    for item in items:
-        item_id = item.get('itemId') if item.get('itemId') else item.get('id')
-        item_map[item_id] = item
-        unranked_items.append(item_id)
+    item_map, unranked_items = hydration.index_items(items)
 
-    app.logger.info(f"Pre-selection items: {unranked_items}")
+    app.logger.debug("Pre-selection items: %s", unranked_items)
+
+    deadline = get_request_deadline()
 
     resp_headers = {}
     experiment = None
@@ -771,77 +1033,69 @@ def get_top_n(user_id, items, feature, top_n,
         experiment = exp_manager.get_active(feature, user_id)
 
     if experiment:
-        app.logger.info('Using experiment: ' + experiment.name)
+        app.logger.info('Using experiment: %s', experiment.name)
 
         # Get ranked items from experiment.
         tracker = exp_manager.default_tracker()
 
-        topn_items = experiment.get_items(
-            user_id=user_id,
-            item_list=unranked_items,
-            tracker=tracker,
-            num_results=top_n,
-            timestamp=get_timestamp_from_request()
-        )
+        try:
+            with access_log.upstream('experiment'):
+                topn_items = experiment.get_items(
+                    user_id=user_id,
+                    item_list=unranked_items,
+                    tracker=tracker,
+                    num_results=top_n,
+                    timestamp=get_timestamp_from_request(),
+                    deadline=deadline
+                )
 
-        app.logger.debug(f"Experiment ranking resolver gave us this ranking: {topn_items}")
+            app.logger.debug("Experiment ranking resolver gave us this ranking: %s", topn_items)
 
-        resp_headers['X-Experiment-Name'] = experiment.name
-        resp_headers['X-Experiment-Type'] = experiment.type
-        resp_headers['X-Experiment-Id'] = experiment.id
+            resp_headers['X-Experiment-Name'] = experiment.name
+            resp_headers['X-Experiment-Type'] = experiment.type
+            resp_headers['X-Experiment-Id'] = experiment.id
+        except Exception as e:
+            if not is_timeout(e):
+                raise
+            topn_items = get_unranked_fallback('top_n', unranked_items[:top_n], e)
     else:
         # Fallback to default behavior of checking for campaign/recommender ARN parameter and
         # then the default product resolver.
         values = get_parameter_values([default_inference_arn_param_name, filter_purchased_param_name])
-        app.logger.info(f'Falling back to Personalize: {values}')
+        app.logger.debug('Falling back to Personalize: %s', values)
 
         inference_arn = values[0]
         filter_arn = values[1]
 
         if inference_arn:
-            resolver = PersonalizeContextComparePickResolver(inference_arn=inference_arn, filter_arn=filter_arn,
-                                                             with_context={'Discount': 'Yes'},
-                                                             without_context={})
-            resp_headers['X-Personalize-Recipe'] = get_recipe(inference_arn)
+            resolver = ResolverFactory.get(ResolverFactory.TYPE_PERSONALIZE_PICK, inference_arn=inference_arn, filter_arn=filter_arn,
+                                           with_context={'Discount': 'Yes'},
+                                           without_context={})
+            add_recipe_header(resp_headers, inference_arn)
         else:
-            app.logger.info(f'Falling back to No-op: {values}')
-            resolver = RandomPickResolver()
-
-        topn_items = resolver.get_items(
-            user_id=user_id,
-            product_list=unranked_items,
-            num_results=top_n
-        )
-
-    logger.info(f"Sorted items: returned from resolver: {topn_items}")
-
-    response_items = []
-
-    for top_item in topn_items:
-        # Unlike with /recommendations and /related we are not hitting the products API to get product info back
-        # The caller may have left that info in there so in case they have we want to leave it in.
-        item_id = top_item['itemId']
-        item = item_map[item_id]
-
-        if 'experiment' in top_item:
-
-            item['experiment'] = top_item['experiment']
-
-            if 'url' in item:
-                # Append the experiment correlation ID to the product URL so it gets tracked if used by client.
-                product_url = item.get('url')
-                if '?' in product_url:
-                    product_url += '&'
-                else:
-                    product_url += '?'
-
-                product_url += 'exp=' + top_item['experiment']['correlationId']
+            app.logger.debug('Falling back to No-op: %s', values)
+            resolver = ResolverFactory.get(ResolverFactory.TYPE_RANDOM_PICK)
+
+        try:
+            with access_log.upstream('resolver'):
+                topn_items = resolver.get_items(
+                    user_id=user_id,
+                    product_list=unranked_items,
+                    num_results=top_n,
+                    deadline=deadline
+                )
+        except Exception as e:
+            if not is_timeout(e):
+                raise
+            topn_items = get_unranked_fallback('top_n', unranked_items[:top_n], e)
 
-                item['url'] = product_url
+    logger.debug("Sorted items: returned from resolver: %s", topn_items)
 
-        response_items.append(item)
+    # Unlike with /recommendations and /related we are not hitting the products API to get product info back
+    # The caller may have left that info in there so in case they have we want to leave it in.
+    response_items = hydration.merge_ranked_items(topn_items, item_map)
 
-    logger.info(f"Top-N response: with details added back in: {topn_items}")
+    logger.debug("Top-N response: with details added back in: %s", response_items)
 
     return response_items, resp_headers
 
@@ -901,54 +1155,96 @@ def get_offers_service():
     service_port = os.environ.get('OFFERS_SERVICE_PORT', 80)
 
     if not service_host or service_host.strip().lower() == 'offers.retaildemostore.local':
-        # Get product service instance. We'll need it rehydrate product info for recommendations.
-        response = servicediscovery.discover_instances(
-            NamespaceName='retaildemostore.local',
-            ServiceName='offers',
-            MaxResults=1,
-            HealthStatus='HEALTHY'
-        )
-
-        service_host = response['Instances'][0]['Attributes']['AWS_INSTANCE_IPV4']
+        # Get offers service instance.
+        service_host = service_discovery.get_instance('offers')
 
     return service_host, service_port
 
 
-def get_all_offers_by_id():
-    """We might wish to prepopulate all offers if we are going to be picking up multiple offers."""
+def get_all_offers() -> List[Dict]:
+    """ Retrieves all offers from the offers service """
     offers_service_host, offers_service_port = get_offers_service()
     url = f'http://{offers_service_host}:{offers_service_port}/offers'
-    logger.debug(f"Asking for offers info from {url}")
-    offers_response = requests.get(url)  # we let connection error propagate
-    logger.debug(f"Got offer info: {offers_response}")
+    logger.debug("Asking for offers info from %s", url)
+    with service_discovery.evict_on_connection_error('offers', offers_service_host), access_log.upstream('offers'):
+        offers_response = http_client.get(url)  # we let connection error propagate
+    logger.debug("Got offer info: %s", offers_response)
     if not offers_response.ok:
-        logger.error(f"Offers service not giving us offers: {offers_response.reason}")
+        logger.error('Offers service not giving us offers: %s', offers_response.reason)
         raise BadRequest(message='Cannot obtain offers', status_code=500)
-    offers = offers_response.json()['tasks']
-    offers_by_id = {str(offer['id']): offer for offer in offers}
-    return offers_by_id
+    return offers_response.json()['tasks']
+
+
+def get_all_offers_by_id():
+    """We might wish to prepopulate all offers if we are going to be picking up multiple offers."""
+    return {str(offer['id']): offer for offer in get_all_offers()}
+
+
+# The offers catalog held in memory and refreshed in the background.
+offer_index = OfferIndex(get_all_offers)
 
 
 def get_offer_by_id(offer_id):
     offers_service_host, offers_service_port = get_offers_service()
     url = f'http://{offers_service_host}:{offers_service_port}/offers/{offer_id}'
-    logger.debug(f"Asking for offer info from {url}")
-    offers_response = requests.get(url)  # we let connection error propagate
-    logger.debug(f"Got offer info: {offers_response}")
+    logger.debug("Asking for offer info from %s", url)
+    with service_discovery.evict_on_connection_error('offers', offers_service_host), access_log.upstream('offers'):
+        offers_response = http_client.get(url)  # we let connection error propagate
+    logger.debug("Got offer info: %s", offers_response)
     if not offers_response.ok:
-        logger.error(f"Offers service not giving us offers: {offers_response.reason}")
+        logger.error('Offers service not giving us offers: %s', offers_response.reason)
         raise BadRequest(message='Cannot obtain offers', status_code=500)
     offer = offers_response.json()['task']
     return offer
 
 
+def choose_offer(user_id: str, inference_arn: str, catalog: OfferCatalog) -> Dict:
+    """ Returns the offer with the highest preference-adjusted score from Amazon Personalize for a user
+
+    If there is no Personalize campaign for offers, an offer is chosen deterministically for the user.
+    """
+    if not inference_arn:
+        app.logger.warning('No campaign Arn set for offers - returning arbitrary')
+        # We deterministically choose an offer
+        # - random approach would have been chosen_offer_id = random.choice(offer_ids)
+        return catalog.get(catalog.offer_ids[int(user_id) % len(catalog)])
+
+    with access_log.upstream('personalize'):
+        get_recommendations_response = personalize_runtime.get_recommendations(
+            campaignArn=inference_arn,
+            userId=user_id,
+            numResults=len(catalog)
+        )
+
+    logger.debug('Recommendations returned: %s', get_recommendations_response['itemList'])
+
+    # Here is where might want to incorporate some business logic
+    # for more information on how these scores are used see
+    # https://aws.amazon.com/blogs/machine-learning/introducing-recommendation-scores-in-amazon-personalize/
+
+    # An alternative approach would be to train Personalize to produce recommendations based on objectives
+    # we specify rather than the default which is to maximise the target event. For more information, see
+    # https://docs.aws.amazon.com/personalize/latest/dg/optimizing-solution-for-objective.html
+
+    # We can do many other things here, like randomisation, normalisation in different dimensions,
+    # tracking per-user, offer, quotas, etc. Here, we just select the most promising adjusted score
+    chosen_offer_id, chosen_score, chosen_adjusted_score = catalog.choose(get_recommendations_response['itemList'])
+    if chosen_offer_id is None:
+        raise LookupError('None of the recommended offers are in the offers catalog')
+
+    chosen_offer = catalog.get(chosen_offer_id)
+    chosen_offer['score'] = chosen_score
+    chosen_offer['adjusted_score'] = chosen_adjusted_score
+    return chosen_offer
+
+
 @app.route('/coupon_offer', methods=['GET'])
 def coupon_offer():
     """
     Returns an offer recommendation for a given user.
 
-    Hits the offers endpoint to find what offers are available, get their preferences for adjusting scores.
-    Uses Amazon Personalize if available to score them.
+    Uses the offers catalog, which is held in memory and refreshed from the offers service, to find what offers
+    are available and their preferences for adjusting scores. Uses Amazon Personalize if available to score them.
     Returns the highest scoring offer.
 
     Experimentation is disabled because we are sending the offers through Pinpoint emails and for this
@@ -962,87 +1258,16 @@ def coupon_offer():
 
     resp_headers = {}
     try:
-
         inference_arn = get_parameter_values(offers_arn_param_name)[0]
-        offers_service_host, offers_service_port = get_offers_service()
-
-        url = f'http://{offers_service_host}:{offers_service_port}/offers'
-        app.logger.debug(f"Asking for offers info from {url}")
-        offers_response = requests.get(url)
-        app.logger.debug(f"Got offer info: {offers_response}")
-
-        if not offers_response.ok:
-            app.logger.exception('Offers service did not return happily', offers_response.reason())
-            raise BadRequest(message='Cannot obtain offers', status_code=500)
-        else:
-
-            offers = offers_response.json()['tasks']
-            offers_by_id = {str(offer['id']): offer for offer in offers}
-            offer_ids = sorted(list(offers_by_id.keys()))
-
-            if not inference_arn:
-                app.logger.warning('No campaign Arn set for offers - returning arbitrary')
-                # We deterministically choose an offer
-                # - random approach would have been chosen_offer_id = random.choice(offer_ids)
-                chosen_offer_id = offer_ids[int(user_id) % len(offer_ids)]
-                chosen_score = None
-            else:
-                resp_headers['X-Personalize-Recipe'] = get_recipe(inference_arn)
-                logger.info(f"Input to Personalized Ranking for offers: userId: {user_id}({type(user_id)}) "
-                            f"inputList: {offer_ids}")
-                get_recommendations_response = personalize_runtime.get_recommendations(
-                    campaignArn=inference_arn,
-                    userId=user_id,
-                    numResults=len(offer_ids)
-                )
+        if inference_arn:
+            add_recipe_header(resp_headers, inference_arn)
 
-                logger.info(f'Recommendations returned: {json.dumps(get_recommendations_response)}')
-
-                return_key = 'itemList'
-                # Here is where might want to incorporate some business logic
-                # for more information on how these scores are used see
-                # https://aws.amazon.com/blogs/machine-learning/introducing-recommendation-scores-in-amazon-personalize/
-
-                # An alternative approach would be to train Personalize to produce recommendations based on objectives
-                # we specify rather than the default which is to maximise the target event. For more information, see
-                # https://docs.aws.amazon.com/personalize/latest/dg/optimizing-solution-for-objective.html
-
-                user_scores = {item['itemId']: float(item['score']) for item in
-                               get_recommendations_response[return_key]}
-                # We assume we have pre-calculated the adjusting factor, can be a mix of probability when applicable,
-                # calculation of expected return per offer, etc.
-                adjusted_scores = {offer_id: score * offers_by_id[offer_id]['preference']
-                                   for offer_id, score in user_scores.items()}
-                logger.info(f"Scores after adjusting for preference parameters: {adjusted_scores}")
-
-                # Normalise these - makes it easier to do further adjustments
-                score_sum = sum(adjusted_scores.values())
-                adjusted_scores = {offer_id: score / score_sum
-                                   for offer_id, score in adjusted_scores.items()}
-                logger.info(f"Scores after normalising adjusted scores: {adjusted_scores}")
-
-                # Just one way we could add some randomness - adds serendipity though removes personalization a bit
-                # because we have the scores though we retain a lot of the personalization
-                random_factor = 0.0
-                adjusted_scores = {offer_id: score*(1-random_factor) + random_factor*random.random()
-                                   for offer_id, score in adjusted_scores.items()}
-                logger.info(f"Scores after adding randomness: {adjusted_scores}")
-
-                # We can do many other things here, like randomisation, normalisation in different dimensions,
-                # tracking per-user, offer, quotas, etc. Here, we just select the most promising adjusted score
-                chosen_offer_id = max(adjusted_scores, key=adjusted_scores.get)
-                chosen_score = user_scores[chosen_offer_id]
-                chosen_adjusted_score = adjusted_scores[chosen_offer_id]
-
-            chosen_offer = offers_by_id[chosen_offer_id]
-            if chosen_score is not None:
-                chosen_offer['score'] = chosen_score
-                chosen_offer['adjusted_score'] = chosen_adjusted_score
+        chosen_offer = choose_offer(user_id, inference_arn, offer_index.get())
 
         resp = Response(json.dumps({'offer': chosen_offer}, cls=CompatEncoder),
                         content_type='application/json', headers=resp_headers)
 
-        app.logger.debug(f"Recommendations response to be returned for offers: {resp}")
+        app.logger.debug("Recommendations response to be returned for offers: %s", resp)
         return resp
 
     except Exception as e:
@@ -1050,12 +1275,62 @@ def coupon_offer():
         raise BadRequest(message='Unhandled error', status_code=500)
 
 
+@app.route('/coupon_offer/batch', methods=['POST'])
+def coupon_offer_batch():
+    """
+    Returns an offer recommendation for each user in a batch.
+
+    Offers are chosen the same way as /coupon_offer using the in-memory offers catalog.
+    Personalize calls are made concurrently and are subject to the same rate limit as
+    /recommendations/batch. Results are streamed as newline-delimited JSON with one
+    line per user as each user's offer is chosen, so lines are not in the order requested.
+    """
+    content = request.get_json(silent = True) or {}
+
+    user_ids = content.get('userIDs')
+    if not user_ids or not isinstance(user_ids, list):
+        raise BadRequest('userIDs is required')
+    if len(user_ids) > BATCH_MAX_USERS:
+        raise BadRequest(f'userIDs must contain no more than {BATCH_MAX_USERS} users')
+
+    # Drop duplicate users while preserving the caller's order.
+    user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+
+    resp_headers = {}
+    try:
+        inference_arn = get_parameter_values(offers_arn_param_name)[0]
+        if inference_arn:
+            add_recipe_header(resp_headers, inference_arn)
+
+        catalog = offer_index.get()
+    except Exception as e:
+        app.logger.exception('Unexpected error loading offers', e)
+        raise BadRequest(message='Unhandled error', status_code=500)
+
+    def user_offer(user_id):
+        if inference_arn and not batch_rate_limiter.acquire(timeout = BATCH_RATE_LIMIT_TIMEOUT):
+            raise RateLimitExceeded('Rate limit exceeded')
+        return choose_offer(user_id, inference_arn, catalog)
+
+    def generate():
+        for wave in concurrency.map_completed(user_offer, user_ids, BATCH_CONCURRENCY):
+            for user_id, future in wave:
+                try:
+                    line = {'userID': user_id, 'offer': future.result()}
+                except BATCH_USER_ERRORS as e:
+                    app.logger.warning('Unable to choose offer for user %s in batch: %s', user_id, e)
+                    line = {'userID': user_id, 'error': str(e)}
+                yield json.dumps(line, cls=CompatEncoder) + '\n'
+
+    return Response(generate(), content_type = 'application/x-ndjson', headers = resp_headers)
+
+
 @app.route('/experiment/outcome', methods=['POST'])
 def experiment_outcome():
     """ Tracks an outcome/conversion for an experiment """
     if request.content_type.startswith('application/json'):
         content = request.json
-        app.logger.info(content)
+        app.logger.debug('Outcome payload: %s', content)
 
         correlation_id = content.get('correlationId')
     else:
@@ -1079,11 +1354,24 @@ def experiment_outcome():
         app.logger.exception('Unexpected error logging outcome', e)
         raise BadRequest(message='Unhandled error', status_code=500)
 
-if __name__ == '__main__':
+@app.route('/experiment/refresh', methods=['POST'])
+def experiment_refresh():
+    """ Discards cached active experiments so changes to experiments are picked up immediately
 
-    if DEBUG_LOGGING:
-        level = logging.DEBUG
-    else:
+    An optional feature can be specified to only refresh experiments for that feature.
+    """
+    feature = request.args.get('feature')
+    if not feature and request.is_json:
+        feature = request.json.get('feature')
+
+    ExperimentManager.invalidate(feature)
+
+    return jsonify(success=True)
+
+def configure_logging():
+    level = logging.getLevelName(LOG_LEVEL)
+    if not isinstance(level, int):
+        app.logger.warning('Unknown LOG_LEVEL %s; using INFO', LOG_LEVEL)
         level = logging.INFO
     app.logger.setLevel(level)
     if EXPERIMENTATION_LOGGING:
@@ -1094,6 +1382,16 @@ if __name__ == '__main__':
             logging.getLogger('experimentation.experiment_manager').addHandler(handler)
             handler.setLevel(level)  # this will get the main app logs to CloudWatch
 
-    app.wsgi_app = LoggingMiddleware(app.wsgi_app)
+if __name__ == '__main__':
+
+    configure_logging()
+
+    app.wsgi_app = access_log.AccessLogMiddleware(app.wsgi_app)
+
+    # ECS stops containers with SIGTERM; exit cleanly so buffered experiment counters are flushed by atexit hooks.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    # Look up recipes for configured campaigns/recommenders up front so the first requests don't wait on them.
+    threading.Thread(target = warm_recipe_cache, name = 'warm-recipes', daemon = True).start()
 
     app.run(debug=True, host='0.0.0.0', port=80)
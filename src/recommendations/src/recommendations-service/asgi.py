@@ -0,0 +1,43 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Serves the recommendations service from an asyncio (ASGI) server
+
+The routes and responses are the same as when running app.py directly. Connections
+are handled by uvicorn's event loop and each request is handled on a bounded thread
+pool (ASGI_MAX_THREADS). Requests still block their thread while they wait on
+Personalize, DynamoDB, and the other services.
+
+python asgi.py [--port 80] [--workers 1]
+or
+uvicorn asgi:application --host 0.0.0.0 --port 80
+"""
+
+import argparse
+import threading
+
+import access_log
+import app as service
+
+from experimentation.asgi_adapter import create_application
+
+def start():
+    # Look up recipes for configured campaigns/recommenders up front so the first requests don't wait on them.
+    threading.Thread(target = service.warm_recipe_cache, name = 'warm-recipes', daemon = True).start()
+
+service.configure_logging()
+
+application = create_application(access_log.AccessLogMiddleware(service.app.wsgi_app), on_startup = start)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--host', default = '0.0.0.0')
+    parser.add_argument('--port', type = int, default = 80)
+    parser.add_argument('--workers', type = int, default = 1)
+    args = parser.parse_args()
+
+    # Buffered experiment counters and events are flushed by atexit hooks when uvicorn shuts down.
+    uvicorn.run('asgi:application', host = args.host, port = args.port, workers = args.workers,
+                access_log = False, timeout_graceful_shutdown = 10)
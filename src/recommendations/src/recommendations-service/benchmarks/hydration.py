@@ -0,0 +1,61 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Measures the CPU cost of joining 25, 100, and 500 items with their product details
+
+Half of the items carry experiment metadata so that URL tagging is exercised, and the
+products are given in a different order than the items as they are by the products service.
+
+python benchmarks/hydration.py [--iterations 1000]
+"""
+
+import argparse
+import copy
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from experimentation import hydration  # noqa: E402
+
+def make_items(count):
+    items = []
+    for i in range(count):
+        item = {'itemId': str(i)}
+        if i % 2 == 0:
+            item['experiment'] = {'type': 'ab', 'feature': 'benchmark', 'name': 'benchmark', 'variationIndex': 0,
+                                  'correlationId': f'benchmark~{i}~0~{i}'}
+        items.append(item)
+    return items
+
+def make_products(count):
+    products = [{'id': str(i), 'name': f'Product {i}', 'category': 'benchmark', 'price': 9.99,
+                 'url': f'http://localhost/#/product/{i}'} for i in range(count)]
+    random.shuffle(products)
+    return products
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--iterations', type = int, default = 1000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    print(f'{"items":>8}{"hydrate (ms)":>16}{"rank merge (ms)":>18}')
+    for count in (25, 100, 500):
+        items = make_items(count)
+        products = make_products(count)
+        ranked_items = list(reversed(items))
+
+        # Items are modified in place so each iteration works on its own copies, made before timing starts.
+        copies = [copy.deepcopy(items) for _ in range(args.iterations)]
+        seconds = timeit.timeit(lambda: hydration.hydrate_items(copies.pop(), products), number = args.iterations)
+
+        item_maps = [hydration.index_items(copy.deepcopy(items))[0] for _ in range(args.iterations)]
+        merge_seconds = timeit.timeit(lambda: hydration.merge_ranked_items(ranked_items, item_maps.pop()), number = args.iterations)
+
+        print(f'{count:>8}{seconds / args.iterations * 1000:>16.3f}{merge_seconds / args.iterations * 1000:>18.3f}')
+
+if __name__ == '__main__':
+    main()
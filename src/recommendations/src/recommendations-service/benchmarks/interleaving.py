@@ -0,0 +1,56 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Measures the CPU cost of interleaving results from 2 to 5 variations
+
+Each variation returns num_results * 3 candidates (as InterleavingExperiment requests)
+drawn from an overlapping pool of items so that de-duplication is exercised.
+
+python benchmarks/interleaving.py [--num-results 100] [--iterations 200]
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from experimentation.experiment_interleaving import InterleavingExperiment  # noqa: E402
+
+def make_experiment(method, variation_count):
+    return InterleavingExperiment('ExperimentStrategy', **{
+        'id': 'benchmark',
+        'feature': 'benchmark',
+        'name': 'benchmark',
+        'type': 'interleaving',
+        'status': 'ACTIVE',
+        'method': method,
+        'variations': [{'type': 'product'} for _ in range(variation_count)]
+    })
+
+def make_item_lists(variation_count, candidates):
+    # Candidates are drawn from a pool smaller than the combined lists so variations overlap.
+    pool = [str(i) for i in range(candidates * 2)]
+    return [[{'itemId': item_id} for item_id in random.sample(pool, candidates)] for _ in range(variation_count)]
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--num-results', type = int, default = 100)
+    parser.add_argument('--iterations', type = int, default = 200)
+    args = parser.parse_args()
+
+    random.seed(42)
+    print(f'{"method":<12}{"variations":>12}{"mean (ms)":>12}')
+    for method in (InterleavingExperiment.METHOD_BALANCED, InterleavingExperiment.METHOD_TEAM_DRAFT):
+        for variation_count in range(2, 6):
+            experiment = make_experiment(method, variation_count)
+            item_lists = make_item_lists(variation_count, args.num_results * 3)
+            interleave = experiment._interleave_team_draft if method == InterleavingExperiment.METHOD_TEAM_DRAFT else experiment._interleave_balanced
+
+            seconds = timeit.timeit(lambda: interleave('user', item_lists, args.num_results), number = args.iterations)
+            print(f'{method:<12}{variation_count:>12}{seconds / args.iterations * 1000:>12.3f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Compares throughput and latency of running instances of the recommendations service
+
+Start the service under each server to compare, for example:
+
+    python app.py                     # Flask development server on port 80
+    python asgi.py --port 8080        # uvicorn on port 8080
+
+then run the same load against both:
+
+python benchmarks/load_test.py --target flask=http://localhost --target asgi=http://localhost:8080 \
+    [--path "/recommendations?userID=1"] [--concurrency 200] [--duration 30]
+"""
+
+import argparse
+import threading
+import time
+
+import requests
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def run_load(url, concurrency, duration, timeout):
+    """ Issues GET requests to url from concurrency threads for duration seconds """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = session.get(url, timeout = timeout).ok
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target = worker, daemon = True) for _ in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.5) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--target', action = 'append', required = True, help = 'name=base URL of a running service')
+    parser.add_argument('--path', default = '/recommendations?userID=1&feature=home_product_recs')
+    parser.add_argument('--concurrency', type = int, default = 200)
+    parser.add_argument('--duration', type = float, default = 30)
+    parser.add_argument('--timeout', type = float, default = 10)
+    args = parser.parse_args()
+
+    print(f'{"target":<12}{"requests":>10}{"errors":>8}{"req/s":>10}{"p50 (ms)":>10}{"p95 (ms)":>10}{"p99 (ms)":>10}')
+    for target in args.target:
+        name, base_url = target.split('=', 1)
+        result = run_load(base_url.rstrip('/') + args.path, args.concurrency, args.duration, args.timeout)
+        print(f'{name:<12}{result["requests"]:>10}{result["errors"]:>8}{result["rps"]:>10.1f}'
+              f'{result["p50"]:>10.1f}{result["p95"]:>10.1f}{result["p99"]:>10.1f}')
+
+if __name__ == '__main__':
+    main()
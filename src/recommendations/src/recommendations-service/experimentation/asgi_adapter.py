@@ -0,0 +1,113 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Serves a WSGI application from an asyncio (ASGI) server
+
+Requests are translated by a2wsgi's WSGIMiddleware, which calls the WSGI application
+on a bounded thread pool. Response chunks pass through a bounded queue, so a WSGI
+thread producing a response faster than the client reads it waits for the client
+(backpressure). This module adds what the middleware leaves out:
+
+- on_startup and on_shutdown hooks, called from the ASGI lifespan protocol.
+- Stopping a streamed response when the client disconnects. ASGI servers discard
+  messages sent after a disconnect, so without this a WSGI thread keeps producing
+  a long response (e.g. an NDJSON batch) that nobody will read.
+
+Route handlers still make blocking calls to AWS and other services, so each request
+in progress holds one of the max_threads threads.
+"""
+
+import asyncio
+import os
+import threading
+import logging
+
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator
+
+from a2wsgi import WSGIMiddleware
+
+log = logging.getLogger(__name__)
+
+# Maximum number of WSGI calls in progress at once; further requests wait on the event loop.
+MAX_THREADS = int(os.environ.get('ASGI_MAX_THREADS', 256))
+# Response chunks buffered for each request before its WSGI thread waits for the client.
+SEND_QUEUE_SIZE = int(os.environ.get('ASGI_SEND_QUEUE_SIZE', 10))
+
+# Set when the client of the current request disconnects. WSGIMiddleware runs the WSGI
+# call in a copy of the request's context, so the WSGI thread sees the request's event.
+_disconnected: ContextVar[threading.Event] = ContextVar('disconnected')
+
+def create_application(wsgi_app: Callable, max_threads: int = MAX_THREADS, send_queue_size: int = SEND_QUEUE_SIZE,
+                       on_startup: Callable = None, on_shutdown: Callable = None) -> Callable:
+    """ Returns an ASGI application that calls wsgi_app on a thread pool of max_threads threads """
+    middleware = WSGIMiddleware(stop_on_disconnect(wsgi_app), workers = max_threads, send_queue_size = send_queue_size)
+
+    async def application(scope: Dict, receive: Callable, send: Callable):
+        if scope['type'] == 'lifespan':
+            await _lifespan(receive, send, on_startup, on_shutdown)
+            return
+        if scope['type'] != 'http':
+            await middleware(scope, receive, send)
+            return
+
+        disconnected = threading.Event()
+        token = _disconnected.set(disconnected)
+        # The request body is read by the WSGI thread through this queue. Messages are read
+        # from the server as soon as the previous one is taken, so a disconnect is noticed
+        # while the response is being produced.
+        messages = asyncio.Queue(maxsize = 1)
+
+        async def read_messages():
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    disconnected.set()
+                await messages.put(message)
+                if message['type'] == 'http.disconnect':
+                    return
+
+        reader = asyncio.ensure_future(read_messages())
+        try:
+            await middleware(scope, messages.get, send)
+        finally:
+            reader.cancel()
+            _disconnected.reset(token)
+
+    return application
+
+def stop_on_disconnect(wsgi_app: Callable) -> Callable:
+    """ Wraps a WSGI application so its response stops being produced once the client disconnects """
+    def application(environ: Dict, start_response: Callable) -> Iterable[bytes]:
+        disconnected = _disconnected.get(None)
+        response = wsgi_app(environ, start_response)
+        if disconnected is None:
+            return response
+        return _until_disconnected(response, disconnected)
+
+    return application
+
+def _until_disconnected(response: Iterable[bytes], disconnected: threading.Event) -> Iterator[bytes]:
+    try:
+        for data in response:
+            if disconnected.is_set():
+                log.info('Client disconnected; stopped sending response')
+                return
+            yield data
+    finally:
+        # Closing the response also closes the generator producing it.
+        if hasattr(response, 'close'):
+            response.close()
+
+async def _lifespan(receive: Callable, send: Callable, on_startup: Callable, on_shutdown: Callable):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if on_startup:
+                on_startup()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if on_shutdown:
+                on_shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -0,0 +1,23 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Shared configuration for AWS SDK clients
+
+Each boto3 client is shared by every thread in the process and keeps its own pool
+of connections, which botocore limits to 10 by default. When more threads than that
+call a client at once, the extra calls open connections that are discarded afterwards.
+All clients should be created with client_config so the pool size is configurable.
+"""
+
+import os
+
+from botocore.config import Config
+
+# Maximum connections kept by each AWS SDK client. Raise this to the number of threads
+# that call AWS at once, e.g. when serving many concurrent requests.
+MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', 50))
+
+def client_config(**kwargs) -> Config:
+    """ Returns a client configuration with the configured connection pool size """
+    kwargs.setdefault('max_pool_connections', MAX_POOL_CONNECTIONS)
+    return Config(**kwargs)
@@ -0,0 +1,64 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import threading
+import logging
+
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+class PeriodicWorker:
+    """ Runs a function on a daemon thread at a fixed interval
+
+    The thread is started lazily by start() so that importing a module that defines
+    a worker does not spawn threads (e.g. in unit tests). Exceptions raised by the
+    function are logged and do not stop the worker.
+    """
+    def __init__(self, name: str, interval: float, target: Callable[[], None]):
+        self.name = name
+        self.interval = interval
+        self.target = target
+
+        self._thread = None
+        self._stopped = threading.Event()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """ Starts the worker thread if it is not already running """
+        if self.running:
+            return
+        with self._lock:
+            if not self.running:
+                self._stopped.clear()
+                self._thread = threading.Thread(target = self._run, name = self.name, daemon = True)
+                self._thread.start()
+                log.debug('Started background worker %s', self.name)
+
+    def wakeup(self):
+        """ Runs the function as soon as possible rather than waiting for the interval to elapse """
+        self._wakeup.set()
+
+    def stop(self, timeout: float = None):
+        """ Stops the worker, waiting up to timeout seconds for a run in progress to complete """
+        self._stopped.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self.target()
+            except Exception as e:
+                log.exception('Background worker %s failed: %s', self.name, e)
@@ -0,0 +1,109 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" In-process Thompson sampling posteriors for multi-armed bandit experiments
+
+The exposure and conversion counts behind a bandit's Beta posteriors are persisted
+in the experiment table, but experiment documents are cached and counter updates
+are written in the background, so the persisted counts lag behind the traffic this
+process has seen. Each process therefore keeps a live posterior per experiment.
+Local exposures and conversions are applied to it immediately, and whenever a newer
+experiment document is loaded the posterior is rebased on the document's counts
+plus the increments that this process has not written yet.
+"""
+
+import threading
+import logging
+import numpy as np
+
+from typing import Dict, List, Optional, Sequence, Tuple
+from experimentation.counters import variation_counters
+
+log = logging.getLogger(__name__)
+
+class BanditPosterior:
+    """ Thread-safe Beta posterior of the conversion rate of each variation of an experiment """
+
+    def __init__(self, experiment_id: str, exposures: Sequence[int], conversions: Sequence[int]):
+        self.experiment_id = experiment_id
+        self._lock = threading.Lock()
+        self._persisted: Optional[Tuple[Tuple[int, ...], Tuple[int, ...]]] = None
+        self.rebases = 0
+        self.reconcile(exposures, conversions)
+
+    def reconcile(self, exposures: Sequence[int], conversions: Sequence[int]) -> bool:
+        """ Rebases the posterior on persisted counts if they are newer than those it is based on
+
+        Counters only ever increase, so counts with a lower total than the current base
+        come from an older experiment document and are ignored. Returns True if rebased.
+        """
+        persisted = (tuple(exposures), tuple(conversions))
+        if self._persisted == persisted:
+            return False
+
+        with self._lock:
+            current = self._persisted
+            if current == persisted:
+                return False
+            if (current is not None and len(current[0]) == len(persisted[0])
+                    and sum(map(sum, current)) > sum(map(sum, persisted))):
+                return False
+
+            # Parameters of Beta(conversions + 1, exposures + 1) for each variation.
+            alpha = np.array(persisted[1], dtype = float) + 1
+            beta = np.array(persisted[0], dtype = float) + 1
+            for (variation, field_name), count in variation_counters.pending(self.experiment_id).items():
+                if variation < len(alpha):
+                    if field_name == 'conversions':
+                        alpha[variation] += count
+                    elif field_name == 'exposures':
+                        beta[variation] += count
+
+            self._alpha = alpha
+            self._beta = beta
+            self._persisted = persisted
+            self.rebases += 1
+
+        log.debug('Rebased bandit posterior for experiment %s on %s', self.experiment_id, persisted)
+        return True
+
+    def add_exposures(self, variation: int, count: int = 1):
+        with self._lock:
+            self._beta[variation] += count
+
+    def add_conversions(self, variation: int, count: int = 1):
+        with self._lock:
+            self._alpha[variation] += count
+
+    def parameters(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns copies of the alpha and beta parameters of each variation's posterior """
+        with self._lock:
+            return self._alpha.copy(), self._beta.copy()
+
+    def sample(self, size: int = None):
+        """ Selects a variation index, or an array of size indexes, by Thompson sampling
+
+        Each selection draws a conversion rate from every variation's posterior and picks
+        the variation with the highest draw, so variations with more uncertainty still get
+        explored. All draws for a batch are made in a single call.
+        """
+        alpha, beta = self.parameters()
+        if size is None:
+            return int(np.argmax(np.random.beta(alpha, beta)))
+        return np.argmax(np.random.beta(alpha, beta, size = (size, len(alpha))), axis = 1)
+
+_posteriors: Dict[str, BanditPosterior] = {}
+_posteriors_lock = threading.Lock()
+
+def get_posterior(experiment_id: str, exposures: List[int], conversions: List[int]) -> BanditPosterior:
+    """ Returns the posterior shared by all instances of an experiment, reconciled with persisted counts """
+    posterior = _posteriors.get(experiment_id)
+    if posterior is None:
+        with _posteriors_lock:
+            posterior = _posteriors.get(experiment_id)
+            if posterior is None:
+                posterior = _posteriors[experiment_id] = BanditPosterior(experiment_id, exposures, conversions)
+                return posterior
+
+    posterior.reconcile(exposures, conversions)
+    return posterior
@@ -0,0 +1,130 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Base class for buffering entries in memory and sending them to an AWS API in batches
+
+Requests queue entries without waiting on the API. A background worker drains the
+queue, groups entries into batches that fit the API's limits, and sends each batch
+with a single call. Subclasses define how entries are batched and sent.
+"""
+
+import queue
+import threading
+import time
+import logging
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Hashable, Iterator, List, Tuple
+from botocore.exceptions import BotoCoreError, ClientError
+from experimentation.background import PeriodicWorker
+
+log = logging.getLogger(__name__)
+
+# Seconds before the first retry of a batch; doubled for each further retry.
+RETRY_BACKOFF = 0.1
+
+class BufferedSender(ABC):
+    """ Buffers entries and sends them in batches from a background worker
+
+    Each batch is sent to a destination, such as a stream or project, with _send_batch,
+    which returns the entries that the API reports as failed. Only those entries are
+    retried, with exponential backoff, up to max_retries times. If the call itself fails,
+    the whole batch is retried. When the buffer is full, callers wait up to block_timeout
+    seconds for space (backpressure) and then the entry is dropped and counted.
+    """
+    # Names of the entries and their destinations in log messages.
+    entry_name = 'entries'
+    destination_name = 'destination'
+
+    def __init__(self, name: str, buffer_size: int, flush_interval: float, max_retries: int,
+                 batch_size: int, block_timeout: float = 0):
+        self.name = name
+        self.max_retries = max_retries
+        self.block_timeout = block_timeout
+        self._batch_size = batch_size
+
+        self._queue = queue.Queue(maxsize = buffer_size)
+        self._flush_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._worker = PeriodicWorker(name, flush_interval, self.flush)
+
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def flush(self):
+        """ Sends all buffered entries """
+        with self._flush_lock:
+            for destination, entries in self._batches():
+                self._send(destination, entries)
+
+    def stop(self):
+        """ Stops the background worker and sends any buffered entries """
+        self._worker.stop()
+        self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            'buffered': self._queue.qsize(),
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'failed': self.failed
+        }
+
+    def _put(self, entry: Any):
+        """ Queues an entry and wakes the worker once a full batch is buffered """
+        try:
+            if self.block_timeout > 0:
+                self._queue.put(entry, timeout = self.block_timeout)
+            else:
+                self._queue.put_nowait(entry)
+        except queue.Full:
+            self._count('dropped', 1)
+            log.debug('Buffer of %s is full; dropped entry', self.name)
+            return
+
+        self._worker.start()
+        if self._queue.qsize() >= self._batch_size:
+            self._worker.wakeup()
+
+    def _drain(self) -> Iterator[Any]:
+        """ Removes and yields the queued entries """
+        while True:
+            try:
+                yield self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    @abstractmethod
+    def _batches(self) -> Iterator[Tuple[Hashable, List]]:
+        """ Removes the queued entries and yields (destination, entries) batches that fit the API's limits """
+        pass
+
+    @abstractmethod
+    def _send_batch(self, destination: Hashable, entries: List) -> List:
+        """ Sends a batch with a single API call and returns the entries that failed """
+        pass
+
+    def _send(self, destination: Hashable, entries: List):
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                time.sleep(RETRY_BACKOFF * (2 ** (attempt - 1)))
+
+            try:
+                failed_entries = self._send_batch(destination, entries)
+            except (ClientError, BotoCoreError) as e:
+                log.warning('Error sending %s %s to %s %s: %s', len(entries), self.entry_name, self.destination_name, destination, e)
+                continue
+
+            self._count('sent', len(entries) - len(failed_entries))
+            if not failed_entries:
+                return
+            # Only retry the entries that failed.
+            entries = failed_entries
+
+        self._count('failed', len(entries))
+        log.error('Unable to send %s %s to %s %s', len(entries), self.entry_name, self.destination_name, destination)
+
+    def _count(self, counter: str, count: int):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + count)
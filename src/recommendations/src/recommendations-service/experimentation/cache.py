@@ -0,0 +1,113 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+_MISSING = object()
+
+class TTLCache:
+    """ Thread-safe, size-bounded cache with per-entry expiration
+
+    Entries are evicted when they are older than ttl seconds or, once the cache
+    holds max_size entries, in least recently used order. Hit, miss, and eviction
+    counters are maintained so that the cache can be sized based on observed traffic.
+
+    To bound memory rather than entry count, pass a weigher that returns the
+    approximate size of an entry and a max_weight for the total of all entries.
+    """
+    def __init__(self, max_size: int = 1024, ttl: float = 300, max_weight: int = None,
+                 weigher: Callable[[Hashable, Any], int] = None):
+        if max_size < 1:
+            raise ValueError('max_size must be greater than zero')
+        if (max_weight is None) != (weigher is None):
+            raise ValueError('max_weight and weigher must be specified together')
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self.weigher = weigher
+
+        # Key to (expires, value, weight)
+        self._entries = OrderedDict()
+        self._weight = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """ Returns the value for key or default if key is missing or expired """
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires, value, weight = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self._weight -= weight
+                self.evictions += 1
+
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any, ttl: float = None):
+        """ Adds or replaces the value for key, evicting the least recently used entries if full
+
+        ttl overrides the cache's default time to live for this entry.
+        """
+        weight = self.weigher(key, value) if self.weigher else 0
+        if self.max_weight is not None and weight > self.max_weight:
+            # Caching this entry would evict everything else.
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, _MISSING)
+            if previous is not _MISSING:
+                self._weight -= previous[2]
+
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value, weight)
+            self._weight += weight
+            while len(self._entries) > self.max_size or (self.max_weight is not None and self._weight > self.max_weight):
+                _, evicted = self._entries.popitem(last=False)
+                self._weight -= evicted[2]
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            self._weight -= entry[2]
+            return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._weight = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        """ Returns counters describing the effectiveness of this cache """
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'size': len(self._entries),
+                'maxSize': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRatio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+            if self.max_weight is not None:
+                stats['weight'] = self._weight
+                stats['maxWeight'] = self.max_weight
+            return stats
@@ -0,0 +1,62 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" In-memory index of product attributes for the whole catalog
+
+Some requests only need a single attribute of a product (e.g. the category of the
+current product for /related) and shouldn't wait on a products service round trip
+to get it. The index is loaded with the full catalog in the background, refreshed
+periodically, and topped up with products as they are looked up by the service.
+"""
+
+import os
+import threading
+import logging
+
+from typing import Callable, Dict, Iterable, List, Optional
+from experimentation.background import PeriodicWorker
+
+log = logging.getLogger(__name__)
+
+# Seconds between reloads of the full catalog.
+REFRESH_INTERVAL = float(os.environ.get('CATALOG_INDEX_REFRESH_INTERVAL', 300))
+
+class CatalogIndex:
+    """ Index of product ID to category loaded from the full catalog and refreshed in the background """
+
+    def __init__(self, loader: Callable[[], List[Dict]], refresh_interval: float = REFRESH_INTERVAL):
+        self._loader = loader
+        self._categories: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._worker = PeriodicWorker('catalog-index', refresh_interval, self.refresh)
+        self.loaded = False
+
+    def get_category(self, item_id: str) -> Optional[str]:
+        """ Returns the category of a product or None if the product is not in the index yet
+
+        The first call starts loading the catalog in the background rather than waiting for it.
+        """
+        if not self._worker.running:
+            self._worker.start()
+            if not self.loaded:
+                self._worker.wakeup()
+        return self._categories.get(item_id)
+
+    def add(self, products: Iterable[Dict]):
+        """ Adds or updates products that were looked up outside of the index """
+        with self._lock:
+            for product in products:
+                if product.get('category'):
+                    self._categories[product['id']] = product['category']
+
+    def refresh(self):
+        """ Reloads the index from the full catalog """
+        products = self._loader()
+        categories = {product['id']: product['category'] for product in products if product.get('category')}
+        with self._lock:
+            self._categories = categories
+        self.loaded = True
+        log.debug('Loaded catalog index with %s products', len(categories))
+
+    def stop(self):
+        self._worker.stop()
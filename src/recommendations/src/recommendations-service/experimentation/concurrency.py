@@ -0,0 +1,123 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Shared bounded thread pool for running resolvers and other I/O bound calls concurrently
+
+Calls submitted through this module run with the caller's X-Ray trace entity so that
+AWS SDK and HTTP calls made on pool threads are recorded as subsegments of the request.
+They also run in a copy of the caller's context variables so that request scoped state,
+such as upstream call timings, is visible on pool threads.
+"""
+
+import contextvars
+import os
+import threading
+import logging
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, Future, wait
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+from aws_xray_sdk.core import xray_recorder
+
+log = logging.getLogger(__name__)
+
+# Maximum number of threads shared by all concurrent resolver calls.
+POOL_SIZE = int(os.environ.get('RESOLVER_POOL_SIZE', 32))
+# Maximum number of threads shared by the users of all batch requests. Work for each user may itself
+# use the resolver pool, so it runs on a separate pool rather than waiting on threads it occupies.
+BATCH_POOL_SIZE = int(os.environ.get('BATCH_POOL_SIZE', 32))
+
+_executor = None
+_batch_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> ThreadPoolExecutor:
+    """ Returns the thread pool shared by all concurrent calls in this process """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers = POOL_SIZE, thread_name_prefix = 'resolver')
+    return _executor
+
+def get_batch_executor() -> ThreadPoolExecutor:
+    """ Returns the thread pool shared by the users of all batch requests in this process """
+    global _batch_executor
+    if _batch_executor is None:
+        with _executor_lock:
+            if _batch_executor is None:
+                _batch_executor = ThreadPoolExecutor(max_workers = BATCH_POOL_SIZE, thread_name_prefix = 'batch')
+    return _batch_executor
+
+def _current_trace_entity():
+    # Read the thread local directly since get_trace_entity() reports a missing
+    # context when called outside of a request (e.g. in tests and background threads).
+    entities = getattr(xray_recorder.context._local, 'entities', None)
+    return entities[-1] if entities else None
+
+def submit(fn: Callable, *args, **kwargs) -> Future:
+    """ Runs fn on the shared pool with the caller's X-Ray trace entity and context variables """
+    return _submit(get_executor(), fn, args, kwargs)
+
+def _submit(executor: ThreadPoolExecutor, fn: Callable, args: tuple, kwargs: dict) -> Future:
+    trace_entity = _current_trace_entity()
+    context = contextvars.copy_context()
+
+    def run():
+        if trace_entity is not None:
+            xray_recorder.set_trace_entity(trace_entity)
+        try:
+            return context.run(fn, *args, **kwargs)
+        finally:
+            if trace_entity is not None:
+                xray_recorder.clear_trace_entities()
+
+    return executor.submit(run)
+
+def gather(calls: List[Tuple[Callable, dict]], timeout: float = None) -> List[Tuple[bool, Any]]:
+    """ Runs (fn, kwargs) calls concurrently and waits up to timeout seconds for all of them
+
+    Returns a (succeeded, result) tuple for each call in order. For calls that raised an
+    exception, result is the exception. For calls that did not complete within the
+    timeout, result is a TimeoutError; these calls are left to finish in the background.
+    """
+    futures = [submit(fn, **kwargs) for fn, kwargs in calls]
+    wait(futures, timeout = timeout)
+
+    results = []
+    for future in futures:
+        if not future.done():
+            future.cancel()
+            results.append((False, TimeoutError(f'Call did not complete within {timeout} seconds')))
+        elif future.exception() is not None:
+            results.append((False, future.exception()))
+        else:
+            results.append((True, future.result()))
+    return results
+
+def map_completed(fn: Callable, args: Iterable, max_concurrency: int) -> Iterator[List[Tuple[Any, Future]]]:
+    """ Calls fn for each argument on the batch pool and yields the calls as they complete
+
+    Each yielded wave is a list of (argument, future) for the calls that completed since the
+    previous wave, so callers can process the results of a wave together. At most
+    max_concurrency calls are in progress at once, so a large batch won't monopolize the
+    batch pool and delay other batches. Calls are started as waves are yielded; calls in
+    progress are left to finish if iteration stops early.
+    """
+    executor = get_batch_executor()
+    remaining = iter(args)
+    in_progress = {}
+
+    def start_next():
+        for arg in remaining:
+            in_progress[_submit(executor, fn, (arg,), {})] = arg
+            return
+
+    for _ in range(max_concurrency):
+        start_next()
+
+    while in_progress:
+        done, _ = wait(in_progress, return_when = FIRST_COMPLETED)
+        wave = [(in_progress.pop(future), future) for future in done]
+        for _ in wave:
+            start_next()
+        yield wave
@@ -0,0 +1,161 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Batched exposure and conversion counters for built-in experiments
+
+Writing a counter update to DynamoDB for every exposure puts a write, and a hot
+partition conflict, on the critical path of every request in an experiment. Instead,
+increments are accumulated in process and periodically written by a background
+worker as a single update per experiment that adds all pending counts for all of
+its variations.
+
+Pending increments are lost if the process is killed, so a flush is triggered early
+whenever more than EXPERIMENT_COUNTER_MAX_PENDING increments are pending and
+pending increments are flushed when the process exits. Counts that cannot be
+written are retried on later flushes, up to EXPERIMENT_COUNTER_MAX_RETRIES times.
+"""
+
+import atexit
+import os
+import threading
+import logging
+
+from typing import Dict, Tuple
+from botocore.exceptions import BotoCoreError, ClientError
+from experimentation.background import PeriodicWorker
+
+log = logging.getLogger(__name__)
+
+# Seconds between writes of pending counts.
+FLUSH_INTERVAL = float(os.environ.get('EXPERIMENT_COUNTER_FLUSH_INTERVAL', 5))
+# Upper bound on pending increments; reaching it triggers an immediate flush.
+MAX_PENDING = int(os.environ.get('EXPERIMENT_COUNTER_MAX_PENDING', 1000))
+# Number of consecutive failed flushes after which an experiment's pending counts are dropped.
+MAX_RETRIES = int(os.environ.get('EXPERIMENT_COUNTER_MAX_RETRIES', 10))
+
+class _PendingCounts:
+    def __init__(self, table):
+        self.table = table
+        # (variation index, field name) to pending count
+        self.counts: Dict[Tuple[int, str], int] = {}
+        # Number of times writing these counts has failed.
+        self.failures = 0
+
+class VariationCounterBuffer:
+    """ Accumulates variation counter increments and writes them to the experiment table in batches """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, max_pending: int = MAX_PENDING, max_retries: int = MAX_RETRIES):
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+
+        self._pending: Dict[str, _PendingCounts] = {}
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._worker = PeriodicWorker('experiment-counters', flush_interval, self.flush)
+
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+
+    def increment(self, table, experiment_id: str, variation: int, field_name: str, count: int = 1):
+        """ Adds count to a variation's counter; the update is written to table in the background """
+        flush_now = self._add(table, experiment_id, variation, field_name, count)
+
+        self._worker.start()
+        if flush_now:
+            self._worker.wakeup()
+
+    def pending(self, experiment_id: str) -> Dict[Tuple[int, str], int]:
+        """ Returns counts for an experiment that have not been written yet """
+        with self._lock:
+            pending = self._pending.get(experiment_id)
+            return dict(pending.counts) if pending else {}
+
+    def flush(self):
+        """ Writes all pending counts to their experiment tables """
+        with self._flush_lock:
+            with self._lock:
+                batch = self._pending
+                self._pending = {}
+                self._pending_total = 0
+
+            experiments = list(batch.items())
+            for index, (experiment_id, pending) in enumerate(experiments):
+                try:
+                    self._write(pending.table, experiment_id, pending.counts)
+                    self.flushes += 1
+                except (ClientError, BotoCoreError) as e:
+                    self.failed_flushes += 1
+                    self._retry(experiment_id, pending, e)
+                except Exception:
+                    # Keep the counts that have not been written before the error reaches the worker.
+                    for unwritten_id, unwritten in experiments[index:]:
+                        self._requeue(unwritten_id, unwritten, unwritten.failures)
+                    raise
+
+    def stop(self):
+        """ Stops the background worker and writes any pending counts """
+        self._worker.stop()
+        self.flush()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = self._pending_total
+        return {
+            'pending': pending,
+            'flushes': self.flushes,
+            'failedFlushes': self.failed_flushes,
+            'dropped': self.dropped
+        }
+
+    def _retry(self, experiment_id: str, pending: _PendingCounts, error: Exception):
+        """ Puts counts that could not be written back so they are retried on the next flush """
+        failures = pending.failures + 1
+        if failures > self.max_retries:
+            dropped = sum(pending.counts.values())
+            self.dropped += dropped
+            log.error('Dropping %s counts for experiment %s after %s failed writes: %s', dropped, experiment_id, failures, error)
+            return
+
+        log.error('Unable to write counters for experiment %s; will retry: %s', experiment_id, error)
+        self._requeue(experiment_id, pending, failures)
+
+    def _requeue(self, experiment_id: str, pending: _PendingCounts, failures: int):
+        for (variation, field_name), count in pending.counts.items():
+            self._add(pending.table, experiment_id, variation, field_name, count)
+        with self._lock:
+            requeued = self._pending.get(experiment_id)
+            if requeued is not None:
+                requeued.failures = max(requeued.failures, failures)
+
+    def _add(self, table, experiment_id: str, variation: int, field_name: str, count: int) -> bool:
+        """ Adds count to pending counts and returns True if the pending limit has been reached """
+        with self._lock:
+            pending = self._pending.get(experiment_id)
+            if pending is None:
+                pending = self._pending[experiment_id] = _PendingCounts(table)
+            key = (variation, field_name)
+            pending.counts[key] = pending.counts.get(key, 0) + count
+            self._pending_total += count
+            return self._pending_total >= self.max_pending
+
+    def _write(self, table, experiment_id: str, counts: Dict[Tuple[int, str], int]):
+        actions = []
+        values = {}
+        for i, ((variation, field_name), count) in enumerate(sorted(counts.items())):
+            actions.append(f'variations[{variation}].{field_name} :incr{i}')
+            values[f':incr{i}'] = count
+
+        log.debug('Adding counts for experiment %s: %s', experiment_id, counts)
+
+        table.update_item(
+            Key={'id': experiment_id},
+            UpdateExpression='ADD ' + ', '.join(actions),
+            ExpressionAttributeValues=values
+        )
+
+variation_counters = VariationCounterBuffer()
+
+# Write pending counts on a clean shutdown.
+atexit.register(variation_counters.stop)
@@ -0,0 +1,139 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Per-request deadlines for resolving items
+
+A request gets a time budget, from the X-Request-Deadline-Ms header or the
+REQUEST_DEADLINE configuration, which is passed down through experiments and
+resolvers as a Deadline. Resolvers do not start calls once the deadline has
+passed and bound their HTTP calls by the time remaining. Calls to Personalize
+are made with a client whose timeouts and retries fit in the time remaining
+(see personalize_runtime_client). Callers catch the resulting errors (see
+is_timeout) and fall back to default results.
+"""
+
+import math
+import os
+import threading
+import time
+
+import boto3
+import requests
+
+from typing import Dict, Tuple
+from botocore.config import Config
+from botocore.exceptions import ConnectTimeoutError, ReadTimeoutError
+from experimentation.aws_clients import client_config
+
+# Default and maximum seconds a request may spend resolving items before falling back.
+DEFAULT_BUDGET = float(os.environ.get('REQUEST_DEADLINE', 2.0))
+MAX_BUDGET = float(os.environ.get('REQUEST_DEADLINE_MAX', 10.0))
+
+# Header with the caller's budget for the request in milliseconds.
+HEADER = 'X-Request-Deadline-Ms'
+
+# Timeouts in seconds and attempts for Amazon Personalize runtime calls.
+PERSONALIZE_CONNECT_TIMEOUT = float(os.environ.get('PERSONALIZE_CONNECT_TIMEOUT', 1.0))
+PERSONALIZE_READ_TIMEOUT = float(os.environ.get('PERSONALIZE_READ_TIMEOUT', 2.0))
+PERSONALIZE_MAX_ATTEMPTS = int(os.environ.get('PERSONALIZE_MAX_ATTEMPTS', 2))
+# Personalize calls bounded by a deadline only retry if each attempt can get at least this many seconds.
+PERSONALIZE_MIN_ATTEMPT_TIME = float(os.environ.get('PERSONALIZE_MIN_ATTEMPT_TIME', 1.0))
+# Timeouts for deadlines are rounded down to multiples of this many seconds, which limits
+# the number of clients created for them.
+PERSONALIZE_TIMEOUT_STEP = 0.1
+
+class DeadlineExceeded(Exception):
+    pass
+
+class Deadline:
+    """ Point in time by which a request's items must be resolved """
+    def __init__(self, budget: float = DEFAULT_BUDGET):
+        self.budget = budget
+        self.expires = time.monotonic() + budget
+
+    @classmethod
+    def from_header(cls, value: str = None, default: float = DEFAULT_BUDGET, maximum: float = MAX_BUDGET) -> 'Deadline':
+        """ Returns a deadline for a budget in milliseconds from a request header, capped at maximum seconds """
+        budget = default
+        if value:
+            try:
+                budget = float(value) / 1000
+            except ValueError:
+                pass
+        return cls(min(max(budget, 0), maximum))
+
+    def remaining(self) -> float:
+        """ Returns the seconds remaining before the deadline, or zero if it has passed """
+        return max(self.expires - time.monotonic(), 0)
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
+
+    def check(self):
+        """ Raises DeadlineExceeded if the deadline has passed """
+        if self.expired():
+            raise DeadlineExceeded(f'Deadline of {self.budget} seconds exceeded')
+
+    def timeout(self, limit: float) -> float:
+        """ Returns the smaller of limit and the seconds remaining, raising DeadlineExceeded if none remain """
+        self.check()
+        return min(limit, self.remaining())
+
+def is_timeout(error: Exception) -> bool:
+    """ Returns True if an error means the deadline or a call's timeout ran out """
+    return isinstance(error, (DeadlineExceeded, TimeoutError, ConnectTimeoutError, ReadTimeoutError, requests.Timeout))
+
+def personalize_runtime_config(connect_timeout: float = PERSONALIZE_CONNECT_TIMEOUT, read_timeout: float = PERSONALIZE_READ_TIMEOUT,
+                               max_attempts: int = PERSONALIZE_MAX_ATTEMPTS) -> Config:
+    """ Returns the client configuration for Amazon Personalize runtime calls """
+    return client_config(
+        connect_timeout = connect_timeout,
+        read_timeout = read_timeout,
+        retries = {'max_attempts': max_attempts, 'mode': 'standard'}
+    )
+
+def personalize_runtime_settings(remaining: float) -> Tuple[float, float, int]:
+    """ Returns the connect timeout, read timeout, and attempts for a Personalize call that must complete within remaining seconds
+
+    Each attempt may take up to its connect and read timeouts, and botocore's standard retry
+    mode waits up to 2 ** (n - 1) seconds before retry n, so the remaining time less the
+    backoff is split between the attempts. Fewer attempts are made if each would get less
+    than PERSONALIZE_MIN_ATTEMPT_TIME. Connections are usually reused, so the connect timeout
+    gets at most a quarter of an attempt's time. Timeouts are never more than the configured
+    timeouts or less than PERSONALIZE_TIMEOUT_STEP.
+    """
+    for attempts in range(PERSONALIZE_MAX_ATTEMPTS, 0, -1):
+        attempt_time = (remaining - (2 ** (attempts - 1) - 1)) / attempts
+        if attempt_time >= PERSONALIZE_MIN_ATTEMPT_TIME:
+            break
+
+    def round_down(timeout):
+        return max(math.floor(round(timeout / PERSONALIZE_TIMEOUT_STEP, 6)) * PERSONALIZE_TIMEOUT_STEP, PERSONALIZE_TIMEOUT_STEP)
+
+    connect_timeout = round_down(min(PERSONALIZE_CONNECT_TIMEOUT, attempt_time / 4))
+    read_timeout = round_down(min(PERSONALIZE_READ_TIMEOUT, attempt_time - connect_timeout))
+    return round(connect_timeout, 1), round(read_timeout, 1), attempts
+
+_personalize_runtime_clients: Dict[Tuple[float, float, int], object] = {}
+_personalize_runtime_clients_lock = threading.Lock()
+
+def personalize_runtime_client(deadline: Deadline = None):
+    """ Returns a Personalize runtime client whose timeouts and retries fit in the time remaining before a deadline
+
+    Without a deadline, the client uses the configured timeouts and attempts. Clients are shared
+    by all calls with the same settings.
+    """
+    if deadline is None:
+        settings = (PERSONALIZE_CONNECT_TIMEOUT, PERSONALIZE_READ_TIMEOUT, PERSONALIZE_MAX_ATTEMPTS)
+    else:
+        deadline.check()
+        settings = personalize_runtime_settings(deadline.remaining())
+
+    client = _personalize_runtime_clients.get(settings)
+    if client is None:
+        with _personalize_runtime_clients_lock:
+            client = _personalize_runtime_clients.get(settings)
+            if client is None:
+                client = _personalize_runtime_clients[settings] = boto3.client('personalize-runtime',
+                                                                               config = personalize_runtime_config(*settings))
+    return client
@@ -0,0 +1,88 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Buffers Amazon CloudWatch Evidently metric events and sends them in batches
+
+Exposure and outcome events are queued in memory by the request that produces
+them and sent with PutProjectEvents by a background worker, grouped by project
+in batches of up to the API limit of 50 events.
+"""
+
+import atexit
+import json
+import os
+import logging
+import boto3
+
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+from experimentation.aws_clients import client_config
+from experimentation.buffered_sender import BufferedSender
+
+log = logging.getLogger(__name__)
+
+evidently = boto3.client('evidently', config = client_config())
+
+# Limit of the Evidently PutProjectEvents API.
+PUT_PROJECT_EVENTS_MAX_EVENTS = 50
+
+# Maximum number of events held in memory before new events are dropped.
+BUFFER_SIZE = int(os.environ.get('EVIDENTLY_EVENTS_BUFFER_SIZE', 10000))
+# Seconds between sends of buffered events.
+FLUSH_INTERVAL = float(os.environ.get('EVIDENTLY_EVENTS_FLUSH_INTERVAL', 1))
+# Number of times events that Evidently failed to record are retried.
+MAX_RETRIES = int(os.environ.get('EVIDENTLY_EVENTS_MAX_RETRIES', 3))
+
+def metric_event(user_id: str, metric_name: str, metric_value: float, timestamp: datetime) -> Dict:
+    """ Returns a custom Evidently event recording a metric value for a user """
+    return {
+        'type': 'aws.evidently.custom',
+        'timestamp': timestamp,
+        'data': json.dumps({
+            'details': {
+                metric_name: metric_value
+            },
+            'userDetails': {
+                'userId': str(user_id)
+            }
+        })
+    }
+
+class EvidentlyEventBuffer(BufferedSender):
+    """ Buffers Evidently events and sends them with PutProjectEvents from a background worker
+
+    Events for the same project are sent together in batches of up to 50 events. When the
+    buffer is full, new events are dropped and counted rather than slowing down requests.
+    """
+    entry_name = 'events'
+    destination_name = 'Evidently project'
+
+    def __init__(self, buffer_size: int = BUFFER_SIZE, flush_interval: float = FLUSH_INTERVAL,
+                 max_retries: int = MAX_RETRIES, client = None):
+        super().__init__('evidently-events', buffer_size, flush_interval, max_retries,
+                         batch_size = PUT_PROJECT_EVENTS_MAX_EVENTS)
+        self._client = client if client else evidently
+
+    def put(self, project: str, user_id: str, metric_name: str, metric_value: float, timestamp: datetime):
+        """ Queues a metric event for a project; the event is built on the background worker """
+        self._put((project, user_id, metric_name, metric_value, timestamp))
+
+    def _batches(self) -> Iterator[Tuple[str, List[Dict]]]:
+        events_by_project: Dict[str, List[Dict]] = {}
+        for project, *event in self._drain():
+            events_by_project.setdefault(project, []).append(metric_event(*event))
+
+        for project, events in events_by_project.items():
+            for start in range(0, len(events), PUT_PROJECT_EVENTS_MAX_EVENTS):
+                yield project, events[start:start + PUT_PROJECT_EVENTS_MAX_EVENTS]
+
+    def _send_batch(self, project: str, events: List[Dict]) -> List[Dict]:
+        response = self._client.put_project_events(project = project, events = events)
+        if response.get('failedEventCount', 0) == 0:
+            return []
+        return [event for event, result in zip(events, response['eventResults']) if result.get('errorCode')]
+
+event_buffer = EvidentlyEventBuffer()
+
+# Send buffered events on a clean shutdown.
+atexit.register(event_buffer.stop)
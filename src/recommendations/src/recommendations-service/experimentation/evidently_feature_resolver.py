@@ -5,16 +5,30 @@ import boto3
 import os
 import json
 import logging
-from typing import Dict,List
-from expiring_dict import ExpiringDict
+from typing import Dict
+from experimentation.aws_clients import client_config
+from experimentation.cache import TTLCache
 from experimentation.features import FEATURE_NAMES
 from experimentation.experiment_evidently import EvidentlyExperiment
 
 log = logging.getLogger(__name__)
 
-evidently = boto3.client('evidently')
-# Cache feature evals for 30 seconds to balance latency and timeliness of picking up experiments
-eval_features_by_user_cache = ExpiringDict(30)
+evidently = boto3.client('evidently', config = client_config())
+
+def _weigh_evaluations(user_id: str, evaluated: Dict[str, Dict]) -> int:
+    """ Approximates the memory used by a user's feature evaluations by their serialized size """
+    return len(user_id) + len(json.dumps(evaluated, default=str))
+
+# Cache feature evals for 30 seconds to balance latency and timeliness of picking up experiments.
+# Every anonymous shopper gets an entry, so the cache is bounded by entry count and approximate
+# memory, evicting the least recently used users first. Entries are the user's evaluations
+# indexed by feature name.
+eval_features_by_user_cache = TTLCache(
+    max_size = int(os.environ.get('EVIDENTLY_EVAL_CACHE_MAX_SIZE', 50000)),
+    ttl = float(os.environ.get('EVIDENTLY_EVAL_CACHE_TTL', 30)),
+    max_weight = int(os.environ.get('EVIDENTLY_EVAL_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+    weigher = _weigh_evaluations
+)
 
 project_name = os.environ['EVIDENTLY_PROJECT_NAME']
 
@@ -33,43 +47,39 @@ class EvidentlyFeatureResolver:
         evaluated = eval_features_by_user_cache.get(cache_key)
         if evaluated is None:
             evaluated = self._call_evidently_evaluate_features(user_id)
-            eval_features_by_user_cache[cache_key] = evaluated
+            eval_features_by_user_cache.put(cache_key, evaluated)
 
             log.debug('Eval feature results for user/feature %s/%s: %s', user_id, feature, evaluated)
         else:
             log.debug('Found cached eval feature result for user/feature %s/%s: %s', user_id, feature, evaluated)
 
         experiment = None
-        feature_found = False
-
-        for eval_feature in evaluated:
-            if eval_feature.get('feature').split('/')[-1] == feature:
-                feature_found = True
-                log.debug('Found matching feature in evaluated with reason %s', eval_feature.get('reason'))
-                if eval_feature.get('reason') == 'EXPERIMENT_RULE_MATCH':
-                    variation_config = json.loads(eval_feature['value']['stringValue'])
-                    # Config convenience check allowing ARN to be expressed as 'arn' in Evidently feature.
-                    if 'inference_arn' not in variation_config and 'arn' in variation_config:
-                        variation_config['inference_arn'] = variation_config.pop('arn')
-
-                    details = json.loads(eval_feature['details'])
-
-                    experiment_config = {
-                        'id': details['experiment'],
-                        'name': details['experiment'],
-                        'feature': feature,
-                        'project': eval_feature['project'].split('/')[-1],
-                        'status': 'ACTIVE',
-                        'type': 'evidently',
-                        'variations': [ variation_config ],
-                        'variation_name': eval_feature['variation']
-                    }
-
-                    experiment = EvidentlyExperiment(**experiment_config)
-
-                break
-
-        if not feature_found:
+        eval_feature = evaluated.get(feature)
+
+        if eval_feature is not None:
+            log.debug('Found matching feature in evaluated with reason %s', eval_feature.get('reason'))
+            if eval_feature.get('reason') == 'EXPERIMENT_RULE_MATCH':
+                variation_config = json.loads(eval_feature['value']['stringValue'])
+                # Config convenience check allowing ARN to be expressed as 'arn' in Evidently feature.
+                if 'inference_arn' not in variation_config and 'arn' in variation_config:
+                    variation_config['inference_arn'] = variation_config.pop('arn')
+
+                details = json.loads(eval_feature['details'])
+
+                experiment_config = {
+                    'id': details['experiment'],
+                    'name': details['experiment'],
+                    'feature': feature,
+                    'project': eval_feature['project'].split('/')[-1],
+                    'status': 'ACTIVE',
+                    'type': 'evidently',
+                    'variations': [ variation_config ],
+                    'variation_name': eval_feature['variation']
+                }
+
+                experiment = EvidentlyExperiment(**experiment_config)
+
+        else:
             log.warning('Feature "%s" not found in Evidently for project "%s"', feature, project_name)
 
         return experiment
@@ -97,7 +107,13 @@ class EvidentlyFeatureResolver:
 
         return EvidentlyExperiment(**experiment_config)
 
-    def _call_evidently_evaluate_features(self, user_id: str) -> List[Dict]:
+    @staticmethod
+    def cache_stats() -> Dict:
+        """ Returns counters for the per-user feature evaluation cache """
+        return eval_features_by_user_cache.stats()
+
+    def _call_evidently_evaluate_features(self, user_id: str) -> Dict[str, Dict]:
+        """ Evaluates all storefront features for a user and returns the evaluations by feature name """
         requests = []
         for feature in FEATURE_NAMES:
             requests.append({
@@ -110,4 +126,5 @@ class EvidentlyFeatureResolver:
             requests=requests
         )
 
-        return response['results']
\ No newline at end of file
+        # Features are returned as ARNs (.../feature/<name>); index them by name once per user.
+        return {result['feature'].split('/')[-1]: result for result in response['results']}
\ No newline at end of file
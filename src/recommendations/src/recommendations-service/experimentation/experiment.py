@@ -5,9 +5,10 @@ import logging
 
 from datetime import datetime
 from typing import Dict
-from botocore.exceptions import ClientError
 from abc import ABC, abstractmethod
 from experimentation.resolvers import ResolverFactory
+from experimentation.counters import variation_counters
+from experimentation.deadline import Deadline
 
 log = logging.getLogger(__name__)
 
@@ -32,12 +33,12 @@ class Experiment(ABC):
             self.variations.append(Variation(**v))
 
     @abstractmethod
-    def get_items(self, user_id, current_item_id=None, item_list=None, num_results=10, tracker=None, filter_values = None, context = None, timestamp: datetime = None, promotion: Dict = None):
+    def get_items(self, user_id, current_item_id=None, item_list=None, num_results=10, tracker=None, filter_values = None, context = None, timestamp: datetime = None, promotion: Dict = None, deadline: Deadline = None):
         """ For a given user, returns item recommendations for this experiment along with experiment tracking/correlation information """
         pass
 
     @abstractmethod
-    def track_conversion(self, correlation_id: str, timestamp: datetime) -> int:
+    def track_conversion(self, correlation_id: str, timestamp: datetime) -> None:
         """ Call this method to track a conversion/outcome for an experiment """
         pass
 
@@ -55,7 +56,7 @@ class BuiltInExperiment(Experiment):
         super().__init__(**data)
         self._table = table
 
-    def track_conversion(self, correlation_id: str, timestamp: datetime) -> int:
+    def track_conversion(self, correlation_id: str, timestamp: datetime) -> None:
         """ Call this method to track a conversion/outcome for an experiment """
         correlation_bits = correlation_id.split('~')
         user_id = correlation_bits[1]
@@ -65,39 +66,18 @@ class BuiltInExperiment(Experiment):
         if variation_index < 0 or variation_index >= len(self.variations):
             raise Exception('variation_index is out of bounds')
 
-        log.debug(f'Incrementing conversion count for variation {variation_index}, rank {result_rank}, based on user {user_id}')
+        log.debug('Incrementing conversion count for variation %s, rank %s, based on user %s', variation_index, result_rank, user_id)
 
-        return self._increment_convert_count(variation_index)
+        self._increment_convert_count(variation_index)
 
-    def _increment_exposure_count(self, variation: int, count: int = 1) -> int:
+    def _increment_exposure_count(self, variation: int, count: int = 1) -> None:
         """ Call this method when a user is exposed to a variation of an experiment """
-        return self.__increment_variation_count('exposures', variation, count)
+        self.__increment_variation_count('exposures', variation, count)
 
-    def _increment_convert_count(self, variation: int, count: int = 1) -> int:
+    def _increment_convert_count(self, variation: int, count: int = 1) -> None:
         """ Call this method when a user converts for a variation of an experiment """
-        return self.__increment_variation_count('conversions', variation, count)
-
-    def __increment_variation_count(self, field_name: str, variation: int, count: int = 1) -> int:
-        try:
-            response = self._table.update_item(
-                Key={'id': self.id},
-                UpdateExpression=f'SET variations[{variation}].{field_name} = variations[{variation}].{field_name} + :incr',
-                ExpressionAttributeValues={
-                    ':incr': count
-                },
-                ReturnValues='UPDATED_NEW'
-            )
-            return int(response['Attributes']['variations'][0][field_name])
-        except ClientError as e:
-            if e.response['Error']['Code'] == 'ValidationException':
-                response = self._table.update_item(
-                    Key={'id': self.id},
-                    UpdateExpression=f'SET variations[{variation}].{field_name} = :incr',
-                    ExpressionAttributeValues={
-                        ':incr': count
-                    },
-                    ReturnValues='UPDATED_NEW'
-                )
-                return int(response['Attributes']['variations'][0][field_name])
-            else:
-                raise e
\ No newline at end of file
+        self.__increment_variation_count('conversions', variation, count)
+
+    def __increment_variation_count(self, field_name: str, variation: int, count: int = 1) -> None:
+        # Counts are accumulated in process and written to the experiment table in the background.
+        variation_counters.increment(self._table, self.id, variation, field_name, count)
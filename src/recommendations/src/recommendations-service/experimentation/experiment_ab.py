@@ -3,18 +3,37 @@
 
 import hashlib
 import logging
+import os
+import numpy as np
 from datetime import datetime
-from typing import Dict
+from functools import lru_cache
+from typing import Dict, Iterable
 
 from experimentation.experiment import BuiltInExperiment
 from experimentation.tracking import Tracker
+from experimentation.deadline import Deadline
 
 log = logging.getLogger(__name__)
 
+# Number of user to variation assignments remembered by each experiment.
+ASSIGNMENT_CACHE_SIZE = int(os.environ.get('AB_ASSIGNMENT_CACHE_SIZE', 10000))
+
 class ABExperiment(BuiltInExperiment):
-    """ Implements a traditional A/B/n test across 2 or more variations where users are randomly and consistently partitioned across n groups """
+    """ Implements a traditional A/B/n test across 2 or more variations where users are randomly and consistently partitioned across n groups
+
+    Users are assigned by the SHA-1 hash of the user ID salted with the experiment's feature
+    and name. The salt is hashed once per experiment and assignments are memoized, so
+    repeat requests from a user don't hash again.
+    """
+
+    def __init__(self, table, **data):
+        super().__init__(table, **data)
 
-    def get_items(self, user_id, current_item_id=None, item_list=None, num_results=10, tracker: Tracker = None, filter_values=None, context=None, timestamp: datetime = None, promotion: Dict = None):
+        # Hash the salt once and copy the hasher's state for each user.
+        self._sha1_salted = hashlib.sha1(f'experiments.{self.feature}.{self.name}.'.encode('ascii'))
+        self._variation_index = lru_cache(maxsize = ASSIGNMENT_CACHE_SIZE)(self._calculate_variation_index)
+
+    def get_items(self, user_id, current_item_id=None, item_list=None, num_results=10, tracker: Tracker = None, filter_values=None, context=None, timestamp: datetime = None, promotion: Dict = None, deadline: Deadline = None):
         if not user_id:
             raise Exception('user_id is required')
         if len(self.variations) < 2:
@@ -22,7 +41,7 @@ class ABExperiment(BuiltInExperiment):
 
         # Determine which variation to use for the user.
         variation_idx = self.calculate_variation_index(user_id)
-        log.debug(f'{self._getClassName()} - assigned user {user_id} to variation {variation_idx} for experiment {self.feature}.{self.name}')
+        log.debug('%s - assigned user %s to variation %s for experiment %s.%s', self._getClassName(), user_id, variation_idx, self.feature, self.name)
 
         # Increment exposure counter for variation for this experiment.
         self._increment_exposure_count(variation_idx)
@@ -37,7 +56,8 @@ class ABExperiment(BuiltInExperiment):
             'num_results': num_results,
             'filter_values': filter_values,
             'context': context,
-            'promotion': promotion
+            'promotion': promotion,
+            'deadline': deadline
         }
         items = variation.resolver.get_items(**resolve_params)
 
@@ -94,8 +114,23 @@ class ABExperiment(BuiltInExperiment):
         if len(self.variations) == 0:
             return -1
 
-        hash_str = f'experiments.{self.feature}.{self.name}.{user_id}'.encode('ascii')
-        hash_int = int(hashlib.sha1(hash_str).hexdigest()[:15], 16)
-        index = hash_int % len(self.variations)
+        return self._variation_index(user_id)
+
+    def calculate_variation_indexes(self, user_ids: Iterable[str]) -> np.ndarray:
+        """ Returns the variation of each of a batch of users, e.g. for batch scoring or auditing assignments
+
+        The variation of each user is the same as calculate_variation_index returns.
+        """
+        hashes = np.fromiter((self._hash_user(user_id) for user_id in user_ids), dtype = np.uint64)
+        if len(self.variations) == 0:
+            return np.full(len(hashes), -1)
+        return (hashes % np.uint64(len(self.variations))).astype(np.int64)
+
+    def _calculate_variation_index(self, user_id) -> int:
+        return self._hash_user(user_id) % len(self.variations)
 
-        return index
+    def _hash_user(self, user_id) -> int:
+        """ Returns the first 15 hex digits (60 bits) of the SHA-1 digest of the salted user ID """
+        hasher = self._sha1_salted.copy()
+        hasher.update(str(user_id).encode('ascii'))
+        return int.from_bytes(hasher.digest()[:8], 'big') >> 4
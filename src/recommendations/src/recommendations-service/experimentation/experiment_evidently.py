@@ -1,18 +1,16 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
-import boto3
-import json
 import logging
 import os
 from datetime import datetime
 from typing import Dict, List
 from . import experiment
+from .deadline import Deadline
+from .evidently_events import event_buffer
 
 log = logging.getLogger(__name__)
 
-evidently = boto3.client('evidently')
-
 EXPOSURE_METRIC_VALUE = 0.0000001
 CONVERSION_METRIC_VALUE = 1.0000001
 
@@ -23,7 +21,7 @@ class EvidentlyExperiment(experiment.Experiment):
         self.variation_name = data.get('variation_name')
         self.project = data.get('project', os.environ.get('EVIDENTLY_PROJECT_NAME'))
 
-    def get_items(self, user_id: str, current_item_id: str = None, item_list: List = None, num_results: int = 10, tracker=None, filter_values=None, context=None, timestamp: datetime = None, promotion: Dict = None):
+    def get_items(self, user_id: str, current_item_id: str = None, item_list: List = None, num_results: int = 10, tracker=None, filter_values=None, context=None, timestamp: datetime = None, promotion: Dict = None, deadline: Deadline = None):
         if not user_id:
             raise Exception('user_id is required')
         if len(self.variations) != 1:
@@ -38,7 +36,8 @@ class EvidentlyExperiment(experiment.Experiment):
             'num_results': num_results,
             'filter_values': filter_values,
             'context': context,
-            'promotion': promotion
+            'promotion': promotion,
+            'deadline': deadline
         }
 
         items = variation.resolver.get_items(**resolve_params)
@@ -82,24 +81,8 @@ class EvidentlyExperiment(experiment.Experiment):
         # We convert the feature name from snake case to camel case for the metric value key.
         metric_name = f'{self._snake_to_camel_case(self.feature)}Clicked'
 
-        response = evidently.put_project_events(
-            project = self.project,
-            events = [
-                {
-                    'type': 'aws.evidently.custom',
-                    'timestamp': timestamp,
-                    'data': json.dumps({
-                        'details': {
-                            metric_name: metric_value
-                        },
-                        'userDetails': {
-                            'userId': str(user_id)
-                        }
-                    })
-                }
-            ]
-        )
-        log.debug(response)
+        # Events are sent to Evidently in batches by a background worker.
+        event_buffer.put(self.project, user_id, metric_name, metric_value, timestamp)
 
     def _create_evidently_correlation_id(self, user_id: str) -> str:
         """ Returns an identifier representing a recommended item for an experiment """
@@ -1,15 +1,21 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
+import os
 import random
 from datetime import datetime
-from typing import Dict
+from typing import Dict, List
 import logging
 
+from experimentation import concurrency
 from experimentation.experiment import BuiltInExperiment
+from experimentation.deadline import Deadline
 
 log = logging.getLogger(__name__)
 
+# Seconds to wait for each variation's resolver. Variations that miss the deadline are left out of the interleaved results.
+VARIATION_TIMEOUT = float(os.environ.get('INTERLEAVING_VARIATION_TIMEOUT', 2.0))
+
 class InterleavingExperiment(BuiltInExperiment):
     """ Implements interleaving technique described in research paper by
     Chapelle et al http://olivier.chapelle.cc/pub/interleaving.pdf
@@ -20,16 +26,14 @@ class InterleavingExperiment(BuiltInExperiment):
     def __init__(self, table, **data):
         super(InterleavingExperiment, self).__init__(table, **data)
         self.method = data.get('method', InterleavingExperiment.METHOD_BALANCED)
+        self.variation_timeout = float(data.get('variation_timeout', VARIATION_TIMEOUT))
 
-    def get_items(self, user_id, current_item_id=None, item_list=None, num_results=10, tracker=None, filter_values=None, context=None, timestamp: datetime = None, promotion: Dict = None):
+    def get_items(self, user_id, current_item_id=None, item_list=None, num_results=10, tracker=None, filter_values=None, context=None, timestamp: datetime = None, promotion: Dict = None, deadline: Deadline = None):
         if not user_id:
             raise Exception('user_id is required')
         if len(self.variations) < 2:
             raise Exception(f'Experiment {self.id} does not have 2 or more variations')
 
-        # Initialize array structure to hold item recommendations for each variation
-        variations_data = [[] for x in range(len(self.variations))]
-
         resolve_params = {
             'user_id': user_id,
             'product_id': current_item_id,
@@ -37,24 +41,39 @@ class InterleavingExperiment(BuiltInExperiment):
             'num_results': num_results * 3,  # account for overlaps
             'filter_values': filter_values,
             'context': context,
-            'promotion': promotion
+            'promotion': promotion,
+            'deadline': deadline
         }
 
-        # Get recomended items for each variation
-        for i in range(len(self.variations)):
-            variation = self.variations[i]
-            items = variation.resolver.get_items(**resolve_params)
-            variations_data[i] = items
+        timeout = self.variation_timeout if deadline is None else min(self.variation_timeout, deadline.remaining())
+
+        # Get recommended items for all variations concurrently so latency is that of the slowest variation
+        results = concurrency.gather(
+            [(variation.resolver.get_items, resolve_params) for variation in self.variations],
+            timeout = timeout
+        )
+
+        # Interleave items from the variations that responded in time
+        variation_indexes = []
+        variations_data = []
+        for i, (succeeded, result) in enumerate(results):
+            if succeeded:
+                variation_indexes.append(i)
+                variations_data.append(result)
+            else:
+                log.warning('Variation %s of experiment %s did not return items; excluding it from interleaving: %s', i, self.id, result)
+
+        if not variations_data:
+            raise results[0][1]
 
-        # Interleave items to produce result
         interleaved = []
         if self.method == InterleavingExperiment.METHOD_TEAM_DRAFT:
-            interleaved = self._interleave_team_draft(user_id, variations_data, num_results)
+            interleaved = self._interleave_team_draft(user_id, variations_data, num_results, variation_indexes)
         else:
-            interleaved = self._interleave_balanced(user_id, variations_data, num_results)
+            interleaved = self._interleave_balanced(user_id, variations_data, num_results, variation_indexes)
 
-        # Increment exposure for each variation (can be optimized)
-        for i in range(len(self.variations)):
+        # Increment exposure for each variation that contributed
+        for i in variation_indexes:
             self._increment_exposure_count(i)
 
         if tracker is not None:
@@ -109,52 +128,45 @@ class InterleavingExperiment(BuiltInExperiment):
 
     Output: list of interleaved results from all rankings
     """
-    def _interleave_balanced(self, user_id, list_of_item_lists, count):
-        """ Returns interleaved list of items following the balanced method """
+    def _interleave_balanced(self, user_id, list_of_item_lists, count, variation_indexes: List[int] = None):
+        """ Returns interleaved list of items following the balanced method
+
+        variation_indexes maps each list to the index of the variation it came from and
+        defaults to the position of the list.
+        """
+        if variation_indexes is None:
+            variation_indexes = list(range(len(list_of_item_lists)))
+
         # Randomize selection order of lists
         selection_order = list(range(len(list_of_item_lists)))
         random.shuffle(selection_order)
+        ordered_lists = [list_of_item_lists[i] for i in selection_order]
+        lengths = [len(items) for items in ordered_lists]
 
         # Holds next selection offset into each variation list
-        offsets = [0] * len(list_of_item_lists)
+        offsets = [0] * len(ordered_lists)
 
+        seen = set()
         result = []
         while len(result) < count:
             # Find lowest offset to determine which variation list to pull next result
             next_idx = 0
             for i in range(len(offsets)):
-                if (offsets[i] < offsets[next_idx] and
-                        offsets[i] < len(list_of_item_lists[selection_order[i]])):
+                if offsets[i] < offsets[next_idx] and offsets[i] < lengths[i]:
                     next_idx = i
 
             # As soon as we reach end of a variation list, we're done
-            if offsets[next_idx] >= len(list_of_item_lists[selection_order[next_idx]]):
+            if offsets[next_idx] >= lengths[next_idx]:
                 break
 
             # Add value to result if not already there
-            item = list_of_item_lists[selection_order[next_idx]][offsets[next_idx]]
-            if not any(i['itemId'] == item['itemId'] for i in result):
-                variation_idx = selection_order[next_idx]
-                correlation_id = self._create_correlation_id(user_id, variation_idx, len(result) + 1)
-
-                item_experiment = {
-                    'id': self.id,
-                    'feature': self.feature,
-                    'name': self.name,
-                    'type': self.type,
-                    'method': self.method,
-                    'variationIndex': variation_idx,
-                    'resultRank': len(result) + 1,
-                    'correlationId': correlation_id
-                }
-
-                item.update({
-                    'experiment': item_experiment
-                })
-
-                result.append(item)
+            item = ordered_lists[next_idx][offsets[next_idx]]
+            if item['itemId'] not in seen:
+                seen.add(item['itemId'])
+                variation_idx = variation_indexes[selection_order[next_idx]]
+                result.append(self._tag_item(item, user_id, variation_idx, len(result) + 1))
 
-            offsets[next_idx] = offsets[next_idx] + 1
+            offsets[next_idx] += 1
 
         return result
 
@@ -183,29 +195,27 @@ class InterleavingExperiment(BuiltInExperiment):
 
     Output: list of interleaved results from all rankings
     """
-    def _interleave_team_draft(self, user_id, list_of_item_lists, count):
-        """ Returns interleaved list of items following the team draft method """
-        # List of team rosters
-        teams = [[] for x in range(len(list_of_item_lists))]
+    def _interleave_team_draft(self, user_id, list_of_item_lists, count, variation_indexes: List[int] = None):
+        """ Returns interleaved list of items following the team draft method
+
+        variation_indexes maps each list to the index of the variation it came from and
+        defaults to the position of the list.
+        """
+        if variation_indexes is None:
+            variation_indexes = list(range(len(list_of_item_lists)))
+
+        # Size of each team's roster as players/items are selected
+        team_sizes = [0] * len(list_of_item_lists)
 
         # Offsets into list of item lists
         offsets = [0] * len(list_of_item_lists)
 
+        seen = set()
         result = []
         while len(result) < count:
-            # Team offsets keyed by team size
-            size_teams = {}
-            for i in range(len(teams)):
-                team_size = len(teams[i])
-                teams_at_size = size_teams.get(team_size, [])
-                teams_at_size.append(i)
-                size_teams[team_size] = teams_at_size
-
-            # List of team offsets with smallest size
-            ordered_keys = sorted(size_teams.keys())
-            smallest_teams = size_teams.get(ordered_keys[0])
-
-            # Choose an offset at random from smallest team offsets
+            # Choose at random from the teams with the smallest size
+            smallest_size = min(team_sizes)
+            smallest_teams = [i for i, size in enumerate(team_sizes) if size == smallest_size]
             team_index = random.choice(smallest_teams)
 
             next_offset = offsets[team_index]
@@ -215,27 +225,13 @@ class InterleavingExperiment(BuiltInExperiment):
                 offsets[team_index] = next_offset + 1
 
                 item = items[next_offset]
-                if not any(i['itemId'] == item['itemId'] for i in result):
-                    correlation_id = self._create_correlation_id(user_id, team_index, len(result) + 1)
-
-                    item_experiment = {
-                        'id': self.id,
-                        'feature': self.feature,
-                        'name': self.name,
-                        'type': self.type,
-                        'method': self.method,
-                        'variationIndex': team_index,
-                        'resultRank': len(result) + 1,
-                        'correlationId': correlation_id
-                    }
-
-                    item.update({
-                        'experiment': item_experiment
-                    })
+                if item['itemId'] not in seen:
+                    seen.add(item['itemId'])
+                    variation_idx = variation_indexes[team_index]
 
                     # Add item to result and team roster
-                    result.append(item)
-                    teams[team_index].append(item)
+                    result.append(self._tag_item(item, user_id, variation_idx, len(result) + 1))
+                    team_sizes[team_index] += 1
                     break
 
                 next_offset += 1
@@ -244,4 +240,18 @@ class InterleavingExperiment(BuiltInExperiment):
             if next_offset >= len(items):
                 break
 
-        return result
\ No newline at end of file
+        return result
+
+    def _tag_item(self, item, user_id, variation_idx, rank):
+        """ Adds experiment details for the variation and result rank to an interleaved item """
+        item['experiment'] = {
+            'id': self.id,
+            'feature': self.feature,
+            'name': self.name,
+            'type': self.type,
+            'method': self.method,
+            'variationIndex': variation_idx,
+            'resultRank': rank,
+            'correlationId': self._create_correlation_id(user_id, variation_idx, rank)
+        }
+        return item
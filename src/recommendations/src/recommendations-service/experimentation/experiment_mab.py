@@ -1,21 +1,26 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
-import numpy as np
 import logging
+import numpy as np
 from datetime import datetime
 from typing import Dict
 
 from experimentation.experiment import BuiltInExperiment
+from experimentation.deadline import Deadline
+from experimentation.bandit import BanditPosterior, get_posterior
 
 log = logging.getLogger(__name__)
 
 class MultiArmedBanditExperiment(BuiltInExperiment):
     """ Implementation of the multi-armed bandit problem using the Thompson Sampling approach
     to exploring variations to identify and exploit the best performing variation
+
+    Variations are selected from a posterior kept in process and shared by all instances
+    of the experiment, which is updated as exposures and conversions are counted.
     """
 
-    def get_items(self, user_id, current_item_id=None, item_list=None, num_results=10, tracker=None, filter_values=None, context=None, timestamp: datetime = None, promotion: Dict = None):
+    def get_items(self, user_id, current_item_id=None, item_list=None, num_results=10, tracker=None, filter_values=None, context=None, timestamp: datetime = None, promotion: Dict = None, deadline: Deadline = None):
         if not user_id:
             raise Exception('user_id is required')
         if len(self.variations) < 2:
@@ -23,7 +28,7 @@ class MultiArmedBanditExperiment(BuiltInExperiment):
 
         # Determine the variation to use.
         variation_idx = self._select_variation_index()
-        log.debug(f'{self._getClassName()} - assigned user {user_id} to variation {variation_idx} for experiment {self.feature}.{self.name}')
+        log.debug('%s - assigned user %s to variation %s for experiment %s.%s', self._getClassName(), user_id, variation_idx, self.feature, self.name)
 
         # Increment exposure count for variation
         self._increment_exposure_count(variation_idx)
@@ -38,7 +43,8 @@ class MultiArmedBanditExperiment(BuiltInExperiment):
             'num_results': num_results,
             'filter_values': filter_values,
             'context': context,
-            'promotion': promotion
+            'promotion': promotion,
+            'deadline': deadline
         }
         items = variation.resolver.get_items(**resolve_params)
 
@@ -86,20 +92,30 @@ class MultiArmedBanditExperiment(BuiltInExperiment):
 
         return items
 
-    def _select_variation_index(self):
-        """ Selects the variation using Thompson Sampling """
-        variation_count = len(self.variations)
-        exposures = np.zeros(variation_count)
-        conversions = np.zeros(variation_count)
+    def select_variation_indexes(self, count: int) -> np.ndarray:
+        """ Selects variations for count users at once, e.g. to assign a batch of users """
+        return self._posterior().sample(count)
 
-        for i in range(variation_count):
-            variation = self.variations[i]
-            exposures[i] = int(variation.config.get('exposures', 0))
-            conversions[i] = int(variation.config.get('conversions', 0))
-
-        # Sample from posterior (this is the Thompson Sampling approach)
-        # This leads to more exploration because variations with > uncertainty can then be selected
-        theta = np.random.beta(conversions + 1, exposures + 1)
-
-        # Select variation index with highest posterior p of converting
-        return np.argmax(theta)
+    def _select_variation_index(self) -> int:
+        """ Selects the variation using Thompson Sampling """
+        return self._posterior().sample()
+
+    def _increment_exposure_count(self, variation: int, count: int = 1) -> None:
+        # Look up the posterior first so that this increment is not also counted as pending when it is created.
+        posterior = self._posterior()
+        super()._increment_exposure_count(variation, count)
+        posterior.add_exposures(variation, count)
+
+    def _increment_convert_count(self, variation: int, count: int = 1) -> None:
+        posterior = self._posterior()
+        super()._increment_convert_count(variation, count)
+        posterior.add_conversions(variation, count)
+
+    def _posterior(self) -> BanditPosterior:
+        """ Returns the experiment's posterior, reconciled with the counts currently in the variations' config
+
+        ExperimentManager refreshes the config of a built experiment when its persisted counters change.
+        """
+        exposures = [int(variation.config.get('exposures', 0)) for variation in self.variations]
+        conversions = [int(variation.config.get('conversions', 0)) for variation in self.variations]
+        return get_posterior(self.id, exposures, conversions)
@@ -2,6 +2,8 @@
 # SPDX-License-Identifier: MIT-0
 
 import boto3
+import json
+import os
 import logging
 
 from boto3.dynamodb.conditions import Key
@@ -10,12 +12,29 @@ from experimentation.experiment_interleaving import InterleavingExperiment
 from experimentation.experiment_mab import MultiArmedBanditExperiment
 from experimentation.evidently_feature_resolver import EvidentlyFeatureResolver
 from experimentation.experiment_optimizely import OptimizelyFeatureTest, optimizely_sdk, optimizely_configured
-from experimentation.tracking import KinesisTracker
+from experimentation.tracking import KinesisTracker, BufferedKinesisTracker
+from experimentation import metrics, parameter_store
+from experimentation.aws_clients import client_config
+from experimentation.cache import TTLCache
+from experimentation.utils import CompatEncoder
 
 log = logging.getLogger(__name__)
 
-ssm = boto3.client('ssm')
-dynamodb = boto3.resource('dynamodb')
+ssm = boto3.client('ssm', config = client_config())
+dynamodb = boto3.resource('dynamodb', config = client_config())
+
+# Seconds that active built-in experiments for a feature are cached before the experiment table is queried again.
+EXPERIMENT_CACHE_TTL = float(os.environ.get('EXPERIMENT_CACHE_TTL', 60))
+
+# By default experiment events are buffered in memory and written to Kinesis in the background, which is
+# at-most-once: events are dropped if the buffer is full or Kinesis keeps failing, and lost if the process is
+# killed (see the buffer counters on /metrics). Set to 'sync' to write events within the request instead.
+TRACKER_MODE = os.environ.get('EXPERIMENT_TRACKER_MODE', 'buffered')
+
+# Variation fields that are updated as an experiment runs and do not affect how it is built.
+VARIATION_COUNTER_FIELDS = ('exposures', 'conversions')
+
+_NOT_CACHED = object()
 
 class ExperimentManager:
     """ Provides access to retrieving active experiments for features """
@@ -26,8 +45,14 @@ class ExperimentManager:
     TYPE_OPTIMIZELY = 'optimizely'
 
     __table_name = None
+    __table = None
     __experiments = {}
 
+    # Active built-in experiment (or None) by feature.
+    __active_by_feature = TTLCache(max_size = 256, ttl = EXPERIMENT_CACHE_TTL)
+    # Most recently built experiment by feature so it can be reused when its configuration has not changed.
+    __built_by_feature = {}
+
     @staticmethod
     def register_experiment(type, experiment):
         """ Registers an experiment implementation for the given type """
@@ -40,6 +65,7 @@ class ExperimentManager:
     def is_optimizely_configured(self):
         return optimizely_configured
 
+    @metrics.timed('experiment_lookup')
     def get_active(self, feature, user_id):
         """ Returns the active experiment for the given feature """
         # 1. If Optimizely is configured for this deployment, check for active Optimizely experiment.
@@ -71,30 +97,76 @@ class ExperimentManager:
         table = self.__get_table()
 
         if table:
-            log.debug(f'ExperimentManager - querying {table.table_name} for active experiments for {feature}')
+            experiment = ExperimentManager.__active_by_feature.get(feature, _NOT_CACHED)
+            if experiment is _NOT_CACHED:
+                experiment = self.__query_active(table, feature)
+                ExperimentManager.__active_by_feature.put(feature, experiment)
 
-            # Get active experiments for the feature.
-            response = table.query(
-                IndexName='feature-name-index',
-                KeyConditionExpression=Key('feature').eq(feature),
-                FilterExpression=Key('status').eq('ACTIVE')
-            )
+        return experiment
 
-            experiment_count = response['Count']
-            if experiment_count > 0:
-                experiment_config = response['Items'][0]
-                log.debug(f'ExperimentManager - {experiment_count} active experiments found for feature {feature}')
+    @staticmethod
+    def invalidate(feature: str = None):
+        """ Discards cached active experiments so they are looked up again on next use
 
-                experiment_type = experiment_config['type']
-                experiment_class = ExperimentManager.__experiments.get(experiment_type)
-                if not experiment_class:
-                    raise ValueError(f'Experiment class for type {experiment_type} could not be found')
-                experiment = experiment_class(table, **experiment_config)
-            else:
-                log.debug(f'ExperimentManager - no active experiments for feature {feature}')
+        Call this when experiments have been changed to pick up changes before the
+        cached experiments expire. If feature is not specified, all features are invalidated.
+        """
+        if feature:
+            ExperimentManager.__active_by_feature.pop(feature)
+        else:
+            ExperimentManager.__active_by_feature.clear()
 
+    @staticmethod
+    def cache_stats():
+        """ Returns counters for the active experiment cache """
+        return ExperimentManager.__active_by_feature.stats()
+
+    def __query_active(self, table, feature):
+        """ Queries the experiment table for the active built-in experiment for a feature """
+        log.debug('ExperimentManager - querying %s for active experiments for %s', table.table_name, feature)
+
+        # Get active experiments for the feature.
+        response = table.query(
+            IndexName='feature-name-index',
+            KeyConditionExpression=Key('feature').eq(feature),
+            FilterExpression=Key('status').eq('ACTIVE')
+        )
+
+        experiment_count = response['Count']
+        if experiment_count == 0:
+            log.debug('ExperimentManager - no active experiments for feature %s', feature)
+            ExperimentManager.__built_by_feature.pop(feature, None)
+            return None
+
+        experiment_config = response['Items'][0]
+        log.debug('ExperimentManager - %s active experiments found for feature %s', experiment_count, feature)
+
+        # Reuse the previously built experiment, along with its variations and resolvers, if only its counters changed.
+        signature = self.__config_signature(experiment_config)
+        built = ExperimentManager.__built_by_feature.get(feature)
+        if built and built[0] == signature:
+            experiment = built[1]
+            for variation, variation_config in zip(experiment.variations, experiment_config['variations']):
+                variation.config = variation_config
+            return experiment
+
+        experiment_type = experiment_config['type']
+        experiment_class = ExperimentManager.__experiments.get(experiment_type)
+        if not experiment_class:
+            raise ValueError(f'Experiment class for type {experiment_type} could not be found')
+        experiment = experiment_class(table, **experiment_config)
+
+        ExperimentManager.__built_by_feature[feature] = (signature, experiment)
         return experiment
 
+    @staticmethod
+    def __config_signature(experiment_config) -> str:
+        """ Returns a string identifying an experiment's configuration excluding its counters """
+        config = dict(experiment_config)
+        config['variations'] = [{k: v for k, v in variation.items() if k not in VARIATION_COUNTER_FIELDS}
+                                for variation in experiment_config.get('variations', [])]
+        return json.dumps(config, sort_keys = True, cls = CompatEncoder)
+
     def get_by_correlation_id(self, correlation_id: str):
         """ Returns an experiment based on a correlation ID """
         id_bits = correlation_id.split('~')
@@ -111,6 +183,11 @@ class ExperimentManager:
         if not table:
             raise Exception('Experiment strategy table has not been configured')
 
+        # Outcomes are usually tracked for active experiments which have already been built.
+        for _, experiment in list(ExperimentManager.__built_by_feature.values()):
+            if experiment.id == id:
+                return experiment
+
         experiment = None
 
         response = table.get_item(Key={'id': id})
@@ -130,16 +207,13 @@ class ExperimentManager:
         """
         tracker = None
 
-        try:
-            response = ssm.get_parameter(Name='retaildemostore-kinesis-event-stream-name')
-            if response['Parameter']['Value'] != 'NONE':
-                stream_name = response['Parameter']['Value']
-                tracker = KinesisTracker(
-                    exposure_stream_name = stream_name,
-                    outcome_stream_name = stream_name
-                )
-        except ssm.exceptions.ParameterNotFound:
-            pass
+        stream_name = parameter_store.get_parameter('retaildemostore-kinesis-event-stream-name')
+        if stream_name and stream_name != 'NONE':
+            tracker_class = KinesisTracker if TRACKER_MODE == 'sync' else BufferedKinesisTracker
+            tracker = tracker_class(
+                exposure_stream_name = stream_name,
+                outcome_stream_name = stream_name
+            )
 
         return tracker
 
@@ -154,9 +228,15 @@ class ExperimentManager:
             else:
                 ExperimentManager.__table_name = 'NONE'
 
-            log.debug(f'ExperimentManager - resolved experiment strategy table name to: {ExperimentManager.__table_name}')
+            log.debug('ExperimentManager - resolved experiment strategy table name to: %s', ExperimentManager.__table_name)
+
+        if ExperimentManager.__table_name == 'NONE':
+            return None
+
+        if ExperimentManager.__table is None:
+            ExperimentManager.__table = dynamodb.Table(ExperimentManager.__table_name)
 
-        return dynamodb.Table(ExperimentManager.__table_name) if ExperimentManager.__table_name != 'NONE' else None
+        return ExperimentManager.__table
 
 # Register built-in experiment types here only.
 ExperimentManager.register_experiment(ExperimentManager.TYPE_AB, ABExperiment)
@@ -8,12 +8,13 @@ from typing import Dict
 from optimizely import optimizely
 
 from . import experiment, resolvers
+from .deadline import Deadline
 
 optimizely_configured = os.environ.get('OPTIMIZELY_SDK_KEY', 'NONE') != 'NONE'
 optimizely_sdk = optimizely.Optimizely(sdk_key=os.environ.get('OPTIMIZELY_SDK_KEY'))
 
 class OptimizelyFeatureTest(experiment.Experiment):
-    def get_items(self, user_id, current_item_id=None, item_list=None, num_results=10, tracker=None, filter_values=None, context=None, timestamp: datetime = None, promotion: Dict = None):
+    def get_items(self, user_id, current_item_id=None, item_list=None, num_results=10, tracker=None, filter_values=None, context=None, timestamp: datetime = None, promotion: Dict = None, deadline: Deadline = None):
         assert user_id, "`user_id` is required"
 
         # All the kwargs that are passed to ResolverFactory.get will be stored as a JSON feature variable.
@@ -27,7 +28,8 @@ class OptimizelyFeatureTest(experiment.Experiment):
                                    num_results=num_results,
                                    filter_values=filter_values,
                                    context=context,
-                                   promotion=promotion)
+                                   promotion=promotion,
+                                   deadline=deadline)
 
         config = optimizely_sdk.get_optimizely_config()
 
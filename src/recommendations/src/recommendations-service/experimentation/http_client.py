@@ -0,0 +1,73 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Shared HTTP session for calls to other Retail Demo Store services
+
+All calls to the products, search, offers, and other HTTP services should go
+through this module so that connections are kept alive and reused across requests
+rather than establishing a new TCP connection for every call. Pooling, timeouts,
+and retries are configurable with environment variables.
+"""
+
+import os
+import threading
+import logging
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from experimentation.deadline import Deadline
+
+log = logging.getLogger(__name__)
+
+# Number of per-host connection pools to keep and the max connections kept alive per host.
+POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 10))
+POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 50))
+# Timeouts in seconds.
+CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 1.0))
+READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 5.0))
+# Retries for connection errors and transient gateway errors (idempotent methods only).
+MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 2))
+RETRY_BACKOFF = float(os.environ.get('HTTP_RETRY_BACKOFF', 0.1))
+RETRY_STATUS_CODES = (502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+def create_session(pool_connections: int = POOL_CONNECTIONS, pool_maxsize: int = POOL_MAXSIZE,
+                   max_retries: int = MAX_RETRIES, retry_backoff: float = RETRY_BACKOFF) -> requests.Session:
+    """ Creates a session with keep-alive connection pools and retry with backoff """
+    retry = Retry(
+        total = max_retries,
+        backoff_factor = retry_backoff,
+        status_forcelist = RETRY_STATUS_CODES,
+        allowed_methods = frozenset(['GET', 'HEAD']),
+        raise_on_status = False
+    )
+    adapter = HTTPAdapter(pool_connections = pool_connections, pool_maxsize = pool_maxsize, max_retries = retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    log.debug('Created HTTP session with %s pools of up to %s connections', pool_connections, pool_maxsize)
+    return session
+
+def get_session() -> requests.Session:
+    """ Returns the session shared by all service calls in this process """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+def get(url: str, deadline: Deadline = None, **kwargs) -> requests.Response:
+    """ Issues a GET request using the shared session and default timeouts
+
+    If a deadline is given, the timeouts are limited to the time remaining before it.
+    """
+    if deadline is not None and 'timeout' not in kwargs:
+        kwargs['timeout'] = (deadline.timeout(CONNECT_TIMEOUT), deadline.timeout(READ_TIMEOUT))
+    kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+    return get_session().get(url, **kwargs)
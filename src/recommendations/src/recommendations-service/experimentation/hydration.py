@@ -0,0 +1,66 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Joins recommended or ranked items with their product details
+
+Resolvers return item IDs, optionally with experiment metadata. These helpers merge
+them with product details (or the items a caller supplied for ranking) through an
+ID index in a single pass, appending the experiment correlation ID to product URLs
+so that the experiment is tracked if the client follows the URL.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+def item_id_of(item: Dict) -> Optional[str]:
+    """ Returns the ID of an item given as {'itemId': ...}, a product, or a hydrated item """
+    item_id = item.get('itemId')
+    if not item_id:
+        item_id = item.get('id')
+    if not item_id and item.get('product'):
+        item_id = item['product'].get('id')
+    return item_id
+
+def index_items(items: List[Dict]) -> Tuple[Dict[str, Dict], List[str]]:
+    """ Returns the items by ID and the item IDs in the order given """
+    item_map = {}
+    item_ids = []
+    for item in items:
+        item_id = item_id_of(item)
+        item_map[item_id] = item
+        item_ids.append(item_id)
+    return item_map, item_ids
+
+def tag_url(url: str, correlation_id: str) -> str:
+    """ Appends the experiment correlation ID to a URL """
+    return f'{url}{"&" if "?" in url else "?"}exp={correlation_id}'
+
+def hydrate_items(items: List[Dict], products: List[Dict]) -> List[Dict]:
+    """ Replaces the item ID of each item with its product details
+
+    Items without product details get a product of None.
+    """
+    products_by_id = {product['id']: product for product in products}
+    for item in items:
+        product = products_by_id.get(item.pop('itemId'))
+        if product is not None and 'experiment' in item and 'url' in product:
+            # Copy rather than modify since the same product may be shared between responses.
+            product = dict(product, url = tag_url(product['url'], item['experiment']['correlationId']))
+        item['product'] = product
+    return items
+
+def merge_ranked_items(ranked_items: List[Dict], item_map: Dict[str, Dict]) -> List[Dict]:
+    """ Returns the caller's items in ranked order with experiment metadata from the ranking added
+
+    Unlike hydrate_items, the caller's items are updated in place since callers such as
+    /choose_discounted hold on to them.
+    """
+    response_items = []
+    for ranked_item in ranked_items:
+        item = item_map.get(ranked_item.get('itemId'))
+        experiment = ranked_item.get('experiment')
+        if item is not None and experiment is not None:
+            item['experiment'] = experiment
+            if 'url' in item:
+                item['url'] = tag_url(item['url'], experiment['correlationId'])
+        response_items.append(item)
+    return response_items
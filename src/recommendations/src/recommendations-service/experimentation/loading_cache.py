@@ -0,0 +1,127 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import threading
+import time
+import logging
+
+from typing import Any, Callable, Dict, Hashable
+
+log = logging.getLogger(__name__)
+
+class _Entry:
+    def __init__(self):
+        self.value = None
+        self.has_value = False
+        self.loaded = 0.0
+        self.failed = 0.0
+        self.refreshing = False
+        self.lock = threading.Lock()
+
+class LoadingCache:
+    """ Cache that loads missing values with a loader function and protects it from stampedes
+
+    - Single-flight: concurrent misses for the same key wait for one call to the loader.
+    - Stale-while-revalidate: once a value is older than ttl it is still returned while a
+      single background refresh replaces it. Values are kept until they are replaced.
+    - Negative caching: if the loader raises (e.g. because it was throttled), default is
+      returned and the loader is not called again for the key for negative_ttl seconds.
+      A value that fails to refresh keeps being served.
+    """
+    def __init__(self, loader: Callable[[Hashable], Any], ttl: float, negative_ttl: float = 60, name: str = 'cache'):
+        self.loader = loader
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.name = name
+
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.failures = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """ Returns the value for key, loading it if it isn't cached """
+        entry = self._get_entry(key)
+        now = time.monotonic()
+
+        if entry.has_value:
+            value = entry.value
+            if now - entry.loaded > self.ttl and now - entry.failed > self.negative_ttl:
+                self.stale_hits += 1
+                self._refresh_in_background(key, entry)
+            else:
+                self.hits += 1
+            return value
+
+        if now - entry.failed <= self.negative_ttl:
+            self.hits += 1
+            return default
+
+        with entry.lock:
+            # Another thread may have loaded the value while we waited for the lock.
+            if not entry.has_value and time.monotonic() - entry.failed > self.negative_ttl:
+                self.misses += 1
+                self._load(key, entry)
+            return entry.value if entry.has_value else default
+
+    def put(self, key: Hashable, value: Any):
+        entry = self._get_entry(key)
+        entry.value = value
+        entry.has_value = True
+        entry.loaded = time.monotonic()
+
+    def invalidate(self, key: Hashable = None):
+        """ Removes the entry for key or all entries if key is None """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict:
+        return {
+            'size': len(self._entries),
+            'ttl': self.ttl,
+            'negativeTtl': self.negative_ttl,
+            'hits': self.hits,
+            'staleHits': self.stale_hits,
+            'misses': self.misses,
+            'failures': self.failures
+        }
+
+    def _get_entry(self, key: Hashable) -> _Entry:
+        entry = self._entries.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._entries.setdefault(key, _Entry())
+        return entry
+
+    def _load(self, key: Hashable, entry: _Entry):
+        try:
+            value = self.loader(key)
+        except Exception as e:
+            self.failures += 1
+            entry.failed = time.monotonic()
+            log.warning('Unable to load %s for %s; will retry in %ss: %s', self.name, key, self.negative_ttl, e)
+            return
+
+        entry.value = value
+        entry.has_value = True
+        entry.loaded = time.monotonic()
+
+    def _refresh_in_background(self, key: Hashable, entry: _Entry):
+        with entry.lock:
+            if entry.refreshing:
+                return
+            entry.refreshing = True
+
+        def refresh():
+            try:
+                self._load(key, entry)
+            finally:
+                entry.refreshing = False
+
+        threading.Thread(target = refresh, name = f'{self.name}-refresh', daemon = True).start()
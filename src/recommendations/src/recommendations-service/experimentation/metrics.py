@@ -0,0 +1,179 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Lightweight in-process latency histograms and counters for the stages of a request
+
+Code that makes up a stage of a request (parameter lookups, experiment lookups,
+resolvers, product lookups, tracking) is wrapped with timed(). Each stage has a
+histogram of its durations that can be rendered in the Prometheus text format.
+The time spent in each stage by the current request is also kept so that it can
+be returned to the caller, e.g. as a Server-Timing header. Counters track how often
+notable events, such as falling back to default results, occur.
+"""
+
+import bisect
+import contextvars
+import re
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+# Upper bounds in seconds of the histogram buckets.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIX = 'recommendations'
+
+# Stage durations in seconds for the current request.
+_request_timings = contextvars.ContextVar('request_timings', default = None)
+_request_lock = threading.Lock()
+
+class Histogram:
+    """ Thread-safe histogram of durations in seconds """
+    def __init__(self, buckets: Iterable[float] = BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self) -> Dict:
+        """ Returns the cumulative count for each bucket upper bound, the total count, and the sum """
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+
+        cumulative = []
+        running = 0
+        for bound, count in zip(self.buckets, counts):
+            running += count
+            cumulative.append((bound, running))
+        return {'buckets': cumulative, 'count': running + counts[-1], 'sum': total}
+
+class Registry:
+    """ Histograms of stage durations by stage name and counters by name and labels """
+    def __init__(self, buckets: Iterable[float] = BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple], int] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage: str) -> Histogram:
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, Histogram(self.buckets))
+        return histogram
+
+    def observe(self, stage: str, seconds: float):
+        self.histogram(stage).observe(seconds)
+
+    def increment(self, name: str, count: int = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + count
+
+    def counter(self, name: str, **labels) -> int:
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self) -> str:
+        """ Returns the histograms and counters in the Prometheus text exposition format """
+        name = f'{PREFIX}_stage_duration_seconds'
+        lines = [
+            f'# HELP {name} Time spent in each stage of handling requests.',
+            f'# TYPE {name} histogram'
+        ]
+        for stage, histogram in sorted(self._histograms.items()):
+            snapshot = histogram.snapshot()
+            for bound, count in snapshot['buckets']:
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {snapshot["count"]}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {snapshot["sum"]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {snapshot["count"]}')
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+        counter_names = set()
+        for (counter, labels), value in counters:
+            counter_name = f'{PREFIX}_{counter}_total'
+            if counter not in counter_names:
+                lines.append(f'# TYPE {counter_name} counter')
+                counter_names.add(counter)
+            label_text = ','.join(f'{label}="{label_value}"' for label, label_value in labels)
+            lines.append(f'{counter_name}{{{label_text}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+@contextmanager
+def timed(stage: str):
+    """ Records the duration of the enclosed block (or decorated function) against a stage """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe(stage, elapsed)
+
+        timings = _request_timings.get()
+        if timings is not None:
+            with _request_lock:
+                timings[stage] = timings.get(stage, 0) + elapsed
+
+def start_request():
+    """ Starts collecting stage timings for the current request """
+    _request_timings.set({})
+
+def request_timings() -> Optional[Dict[str, float]]:
+    """ Returns the seconds spent in each stage by the current request """
+    return _request_timings.get()
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """ Formats stage timings as a Server-Timing header value """
+    return ', '.join(f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in timings.items())
+
+def _snake_case(name: str) -> str:
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
+
+# Cache statistics that only ever increase.
+_CACHE_COUNTERS = {'hits', 'staleHits', 'misses', 'evictions', 'failures'}
+# Buffer statistics that only ever increase.
+_BUFFER_COUNTERS = {'sent', 'dropped', 'failed', 'flushes', 'failedFlushes'}
+
+def render_cache_stats(caches: Dict[str, Dict]) -> str:
+    """ Returns the numeric statistics of caches in the Prometheus text exposition format
+
+    caches maps a cache name to the statistics returned by its stats() method.
+    """
+    return _render_stats('cache', caches, _CACHE_COUNTERS)
+
+def render_buffer_stats(buffers: Dict[str, Dict]) -> str:
+    """ Returns the numeric statistics of buffers of events written in the background, like render_cache_stats """
+    return _render_stats('buffer', buffers, _BUFFER_COUNTERS)
+
+def _render_stats(kind: str, components: Dict[str, Dict], counters: Set[str]) -> str:
+    series: Dict[str, list] = {}
+    for component, stats in sorted(components.items()):
+        for key, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            series.setdefault(key, []).append((component, value))
+
+    lines = []
+    for key, values in series.items():
+        counter = key in counters
+        name = f'{PREFIX}_{kind}_{_snake_case(key)}{"_total" if counter else ""}'
+        lines.append(f'# TYPE {name} {"counter" if counter else "gauge"}')
+        lines.extend(f'{name}{{{kind}="{component}"}} {value}' for component, value in values)
+    return '\n'.join(lines) + '\n' if lines else ''
@@ -0,0 +1,120 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" In-memory index of the offers catalog and vectorized offer scoring
+
+The offers catalog is small and rarely changes, so rather than fetching it from the
+offers service on every request it is held in memory as an immutable, versioned
+snapshot that is refreshed in the background. Each snapshot precomputes the vector
+of offer preferences so that choosing an offer for a user is a handful of array
+operations over the scores returned by Amazon Personalize.
+"""
+
+import json
+import os
+import threading
+import logging
+import numpy as np
+
+from typing import Callable, Dict, List, Optional, Tuple
+from experimentation.background import PeriodicWorker
+
+log = logging.getLogger(__name__)
+
+# Seconds between reloads of the offers catalog.
+REFRESH_INTERVAL = float(os.environ.get('OFFERS_REFRESH_INTERVAL', 60))
+
+class OfferCatalog:
+    """ Immutable snapshot of all offers with their preferences as a vector """
+
+    def __init__(self, offers: List[Dict], version: int):
+        self.version = version
+        self.offers_by_id = {str(offer['id']): offer for offer in offers}
+        self.offer_ids = sorted(self.offers_by_id.keys())
+        self.index_by_id = {offer_id: i for i, offer_id in enumerate(self.offer_ids)}
+        self.preferences = np.array([float(self.offers_by_id[offer_id].get('preference', 1)) for offer_id in self.offer_ids])
+
+    def __len__(self):
+        return len(self.offer_ids)
+
+    def get(self, offer_id: str) -> Optional[Dict]:
+        """ Returns a copy of an offer that callers are free to modify """
+        offer = self.offers_by_id.get(str(offer_id))
+        return dict(offer) if offer is not None else None
+
+    def choose(self, recommendations: List[Dict], random_factor: float = 0.0) -> Tuple[Optional[str], float, float]:
+        """ Returns the offer ID, score, and adjusted score of the most promising recommended offer
+
+        Scores are adjusted by each offer's preference, normalized, and optionally blended
+        with randomness. Ties go to the offer recommended first. Recommended offers that
+        are not in the catalog are ignored.
+        """
+        offer_ids = []
+        indexes = []
+        scores = []
+        for item in recommendations:
+            index = self.index_by_id.get(item['itemId'])
+            if index is not None:
+                offer_ids.append(item['itemId'])
+                indexes.append(index)
+                scores.append(float(item['score']))
+
+        if not offer_ids:
+            return None, 0.0, 0.0
+
+        scores = np.array(scores)
+        # We assume we have pre-calculated the adjusting factor, can be a mix of probability when applicable,
+        # calculation of expected return per offer, etc.
+        adjusted_scores = scores * self.preferences[indexes]
+
+        # Normalise these - makes it easier to do further adjustments
+        score_sum = adjusted_scores.sum()
+        if score_sum > 0:
+            adjusted_scores /= score_sum
+
+        # Just one way we could add some randomness - adds serendipity though removes personalization a bit
+        if random_factor:
+            adjusted_scores = adjusted_scores * (1 - random_factor) + random_factor * np.random.random(len(adjusted_scores))
+
+        best = int(np.argmax(adjusted_scores))
+        return offer_ids[best], float(scores[best]), float(adjusted_scores[best])
+
+class OfferIndex:
+    """ Holds the current offers catalog snapshot and refreshes it in the background
+
+    A new snapshot, with a new version, is only built when the offers have changed.
+    """
+
+    def __init__(self, loader: Callable[[], List[Dict]], refresh_interval: float = REFRESH_INTERVAL):
+        self._loader = loader
+        self._catalog: Optional[OfferCatalog] = None
+        self._fingerprint = None
+        self._load_lock = threading.Lock()
+        self._worker = PeriodicWorker('offers-index', refresh_interval, self.refresh)
+
+    def get(self) -> OfferCatalog:
+        """ Returns the current catalog, loading it on first use """
+        catalog = self._catalog
+        if catalog is None:
+            # Only a single caller loads the catalog while others wait for it.
+            with self._load_lock:
+                if self._catalog is None:
+                    self.refresh()
+                    self._worker.start()
+                catalog = self._catalog
+        return catalog
+
+    def refresh(self):
+        """ Reloads offers and swaps in a new catalog if they have changed """
+        offers = self._loader()
+        fingerprint = json.dumps(offers, sort_keys = True, default = str)
+        if fingerprint == self._fingerprint:
+            return
+
+        version = self._catalog.version + 1 if self._catalog else 1
+        self._catalog = OfferCatalog(offers, version)
+        self._fingerprint = fingerprint
+        log.info('Loaded version %s of offers catalog with %s offers', version, len(offers))
+
+    def stop(self):
+        self._worker.stop()
@@ -0,0 +1,131 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" In-memory snapshot of the Retail Demo Store SSM parameters
+
+Reading SSM parameters on every request is the leading source of throttling under
+load. Instead, all parameters under /retaildemostore/personalize are loaded with
+GetParametersByPath on first use and then refreshed by a background thread.
+Parameters outside of that path (e.g. the Kinesis stream name) are looked up once
+the first time they are requested and then refreshed along with the rest of the snapshot.
+Readers only ever see a complete snapshot and are never blocked by a refresh.
+"""
+
+import os
+import threading
+import logging
+import boto3
+
+from typing import Dict, List, Optional, Union
+from experimentation.aws_clients import client_config
+from experimentation.background import PeriodicWorker
+
+log = logging.getLogger(__name__)
+
+PARAMETER_PATH = '/retaildemostore/personalize'
+REFRESH_INTERVAL = float(os.environ.get('SSM_PARAMETER_REFRESH_INTERVAL', 60))
+
+# Maximum number of names accepted by the GetParameters API.
+GET_PARAMETERS_MAX_NAMES = 10
+
+ssm = boto3.client('ssm', config = client_config())
+
+class ParameterSnapshot:
+    """ Snapshot of SSM parameters that is refreshed in the background """
+
+    def __init__(self, path: str = PARAMETER_PATH, refresh_interval: float = REFRESH_INTERVAL, client = None):
+        self.path = path.rstrip('/')
+        self._client = client if client else ssm
+
+        # Parameter name to value. Parameters that were requested but do not exist map to None.
+        self._values: Dict[str, Optional[str]] = {}
+        self._extra_names = set()
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._worker = PeriodicWorker('ssm-parameters', refresh_interval, self.refresh)
+
+    def get(self, name: str) -> Optional[str]:
+        """ Returns the value of a parameter or None if it does not exist """
+        self._ensure_loaded()
+
+        values = self._values
+        if name in values:
+            return values[name]
+        if name.startswith(self.path + '/'):
+            # Every parameter under the path is in the snapshot so this one doesn't exist.
+            return None
+
+        with self._lock:
+            self._extra_names.add(name)
+        value = self._fetch_parameters([name]).get(name)
+        self._values = {**self._values, name: value}
+        return value
+
+    def get_all(self) -> Dict[str, Optional[str]]:
+        """ Returns all parameters in the snapshot by name """
+        self._ensure_loaded()
+        return dict(self._values)
+
+    def get_values(self, names: Union[str, List[str]]) -> List[Optional[str]]:
+        """ Returns values for parameters or None for parameters that don't exist or have the value 'NONE' """
+        if isinstance(names, str):
+            names = [ names ]
+
+        values = []
+        for name in names:
+            value = self.get(name)
+            values.append(value if value != 'NONE' else None)
+
+        return values
+
+    def refresh(self):
+        """ Reloads all parameters in the snapshot from SSM """
+        values = {}
+
+        paginator = self._client.get_paginator('get_parameters_by_path')
+        for page in paginator.paginate(Path = self.path, Recursive = True):
+            for param in page['Parameters']:
+                values[param['Name']] = param['Value']
+
+        with self._lock:
+            extra_names = list(self._extra_names)
+        values.update(self._fetch_parameters(extra_names))
+
+        self._values = values
+        log.debug('Refreshed snapshot of %s SSM parameters', len(values))
+
+    def stop(self):
+        self._worker.stop()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        # Only a single caller loads the snapshot while others wait for it.
+        with self._load_lock:
+            if not self._loaded:
+                self.refresh()
+                self._loaded = True
+                self._worker.start()
+
+    def _fetch_parameters(self, names: List[str]) -> Dict[str, Optional[str]]:
+        values = {name: None for name in names}
+        for i in range(0, len(names), GET_PARAMETERS_MAX_NAMES):
+            response = self._client.get_parameters(Names = names[i:i + GET_PARAMETERS_MAX_NAMES])
+            for param in response['Parameters']:
+                values[param['Name']] = param['Value']
+        return values
+
+parameters = ParameterSnapshot()
+
+def get_parameter(name: str) -> Optional[str]:
+    """ Returns the value of a parameter from the shared snapshot or None if it does not exist """
+    return parameters.get(name)
+
+def get_all_parameters() -> Dict[str, Optional[str]]:
+    """ Returns all parameters in the shared snapshot by name """
+    return parameters.get_all()
+
+def get_parameter_values(names: Union[str, List[str]]) -> List[Optional[str]]:
+    """ Returns values for parameters from the shared snapshot or None for params that don't exist or that have value equal 'NONE' """
+    return parameters.get_values(names)
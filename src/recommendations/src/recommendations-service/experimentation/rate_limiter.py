@@ -0,0 +1,44 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import threading
+import time
+
+class RateLimitExceeded(Exception):
+    pass
+
+class TokenBucket:
+    """ Thread-safe token bucket rate limiter
+
+    Tokens are added at rate per second up to capacity, so bursts of up to capacity
+    calls are allowed while the sustained rate is limited to rate calls per second.
+    """
+    def __init__(self, rate: float, capacity: float = None):
+        if rate <= 0:
+            raise ValueError('rate must be greater than zero')
+        self.rate = rate
+        self.capacity = capacity if capacity else rate
+
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1, timeout: float = None) -> bool:
+        """ Takes tokens from the bucket, waiting up to timeout seconds for them to be available
+
+        Returns False if the tokens could not be acquired within the timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
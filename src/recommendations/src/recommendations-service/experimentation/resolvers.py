@@ -3,24 +3,57 @@
 
 from abc import ABC, abstractmethod
 
+import os
+import json
 import requests
-import boto3
 import urllib.parse
 import logging
+import numpy as np
 
 from random import shuffle
+from functools import wraps
+from experimentation import concurrency, http_client, metrics, service_discovery
+from experimentation.cache import TTLCache
+from experimentation.deadline import personalize_runtime_client
 
 log = logging.getLogger(__name__)
-servicediscovery = boto3.client('servicediscovery')
+
+# Seconds to wait for both rankings compared by PersonalizeContextComparePickResolver.
+CONTEXT_COMPARE_TIMEOUT = float(os.environ.get('CONTEXT_COMPARE_TIMEOUT', 2.0))
+
+# Maximum number of resolver instances kept by ResolverFactory and seconds each is kept.
+# Not to be confused with RESOLVER_POOL_SIZE, the number of threads for resolver calls (see concurrency).
+RESOLVER_CACHE_SIZE = int(os.environ.get('RESOLVER_CACHE_SIZE', 256))
+RESOLVER_CACHE_TTL = float(os.environ.get('RESOLVER_CACHE_TTL', 60 * 60))
+
+def _check_deadline(get_items):
+    @wraps(get_items)
+    def wrapper(self, **kwargs):
+        deadline = kwargs.get('deadline')
+        if deadline is not None:
+            deadline.check()
+        return get_items(self, **kwargs)
+    return wrapper
 
 class Resolver(ABC):
-    """ Abstract base class for all resolvers"""
+    """ Abstract base class for all resolvers
+
+    The get_items method of each resolver is timed as a stage named after the resolver class.
+    If a deadline is passed to get_items and it has passed, DeadlineExceeded is raised
+    rather than resolving items.
+    """
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'get_items' in cls.__dict__:
+            cls.get_items = metrics.timed(cls.__name__)(_check_deadline(cls.get_items))
+
     @abstractmethod
     def get_items(self, **kwargs):
         """ Returns recommended items for this resolver
 
         Arguments:
             Parameters needed by resolver to return recommendations
+            deadline - Deadline by which items must be resolved (optional)
 
         Return:
             List of dictionaries where each dictionary minimally includes an 'itemId' key representing a recommended item
@@ -38,21 +71,11 @@ class DefaultProductResolver(Resolver):
     """
 
     def __init__(self, **params):
-        # All we need to initialize this resolver is the instance host/IP and port for the Product service
+        # All we need to initialize this resolver is the instance host/IP and port for the Product service.
+        # If the host/IP isn't provided, an instance is discovered for each call.
         self.products_service_host = params.get('products_service_host')
         self.products_service_port = params.get('products_service_port', 80)
-        if not self.products_service_host:
-            # host/IP wasn't provided so attempt to discover instance
-            response = servicediscovery.discover_instances(
-                NamespaceName='retaildemostore.local',
-                ServiceName='products',
-                MaxResults=1,
-                HealthStatus='HEALTHY'
-            )
-
-            self.products_service_host = response['Instances'][0]['Attributes']['AWS_INSTANCE_IPV4']
-            log.debug('DefaultProductResolver - fetched product service instance %s', self.products_service_host)
-        else:
+        if self.products_service_host:
             log.debug('DefaultProductResolver - using product service instance %s', self.products_service_host)
 
         self.fully_qualify_image_urls = params.get('fully_qualify_image_urls', False)
@@ -74,27 +97,31 @@ class DefaultProductResolver(Resolver):
 
         category = None
 
-        if product_id:
-            # Lookup product to determine if it belongs to a category
-            url = f'http://{self.products_service_host}:{self.products_service_port}/products/id/{product_id}'
-            log.debug('DefaultProductResolver - getting product details %s', url)
-            try:
-                response = requests.get(url)
-                if response.ok:
-                    category = response.json()['category']
-            except requests.ConnectionError as e:
-                log.error("Could not pull product information from URL %s - error: %s", url, e)
-
-        if category:
-            # Product belongs to a category so get list of products in same category
-            url = f'http://{self.products_service_host}:{self.products_service_port}/products/category/{category}?fullyQualifyImageUrls={self.fully_qualify_image_urls}'
-            log.debug('DefaultProductResolver - getting products for category %s', url)
-            response = requests.get(url)
-        else:
-            # Product not specified or does not belong to a category so fallback to featured products
-            url = f'http://{self.products_service_host}:{self.products_service_port}/products/featured?fullyQualifyImageUrls={self.fully_qualify_image_urls}'
-            log.debug('DefaultProductResolver - getting featured products %s', url)
-            response = requests.get(url)
+        products_service_host = self.products_service_host or service_discovery.get_instance('products')
+        base_url = f'http://{products_service_host}:{self.products_service_port}'
+
+        with service_discovery.evict_on_connection_error('products', products_service_host):
+            if product_id:
+                # Lookup product to determine if it belongs to a category
+                url = f'{base_url}/products/id/{product_id}'
+                log.debug('DefaultProductResolver - getting product details %s', url)
+                try:
+                    response = http_client.get(url, deadline = kwargs.get('deadline'))
+                    if response.ok:
+                        category = response.json()['category']
+                except requests.ConnectionError as e:
+                    log.error("Could not pull product information from URL %s - error: %s", url, e)
+
+            if category:
+                # Product belongs to a category so get list of products in same category
+                url = f'{base_url}/products/category/{category}?fullyQualifyImageUrls={self.fully_qualify_image_urls}'
+                log.debug('DefaultProductResolver - getting products for category %s', url)
+                response = http_client.get(url, deadline = kwargs.get('deadline'))
+            else:
+                # Product not specified or does not belong to a category so fallback to featured products
+                url = f'{base_url}/products/featured?fullyQualifyImageUrls={self.fully_qualify_image_urls}'
+                log.debug('DefaultProductResolver - getting featured products %s', url)
+                response = http_client.get(url, deadline = kwargs.get('deadline'))
 
         if response.ok:
             # Create response making sure not to include current product
@@ -105,7 +132,7 @@ class DefaultProductResolver(Resolver):
                     if len(items) >= num_results:
                         break
         else:
-            raise Exception(f'Error calling products service: {response.status_code}: {response.reason}')
+            raise requests.HTTPError(f'Error calling products service: {response.status_code}: {response.reason}', response = response)
 
         return items
 
@@ -119,21 +146,11 @@ class SearchSimilarProductsResolver(Resolver):
     but an improvement over the DefaultProductResolver.
     """
     def __init__(self, **params):
-        # All we need to initialize this resolver is the instance host/IP and port for the Search service
+        # All we need to initialize this resolver is the instance host/IP and port for the Search service.
+        # If the host/IP isn't provided, an instance is discovered for each call.
         self.search_service_host = params.get('search_service_host')
         self.search_service_port = params.get('search_service_port', 80)
-        if not self.search_service_host:
-            # host/IP wasn't provided so attempt to discover instance
-            response = servicediscovery.discover_instances(
-                NamespaceName='retaildemostore.local',
-                ServiceName='search',
-                MaxResults=1,
-                HealthStatus='HEALTHY'
-            )
-
-            self.search_service_host = response['Instances'][0]['Attributes']['AWS_INSTANCE_IPV4']
-            log.debug('SearchSimilarProductsResolver - fetched search service instance %s', self.search_service_host)
-        else:
+        if self.search_service_host:
             log.debug('SearchSimilarProductsResolver - using search service instance %s', self.search_service_host)
 
     def get_items(self, **kwargs):
@@ -151,9 +168,12 @@ class SearchSimilarProductsResolver(Resolver):
         if kwargs.get('num_results'):
             num_results = int(kwargs['num_results'])
 
-        url = f'http://{self.search_service_host}:{self.search_service_port}/similar/products?productId={product_id}'
+        search_service_host = self.search_service_host or service_discovery.get_instance('search')
+
+        url = f'http://{search_service_host}:{self.search_service_port}/similar/products?productId={product_id}'
         log.debug('SearchSimilarProductsResolver - getting similar products %s', url)
-        response = requests.get(url)
+        with service_discovery.evict_on_connection_error('search', search_service_host):
+            response = http_client.get(url, deadline = kwargs.get('deadline'))
 
         items = []
 
@@ -162,14 +182,13 @@ class SearchSimilarProductsResolver(Resolver):
             if len(items) > num_results:
                 items = items[:num_results]
         else:
-            raise Exception(f'Error calling products service: {response.status_code}: {response.reason}')
+            raise requests.HTTPError(f'Error calling products service: {response.status_code}: {response.reason}', response = response)
 
         return items
 
 
 class PersonalizeRecommendationsResolver(Resolver):
     """ Provides recommendations from an Amazon Personalize campaign """
-    __personalize_runtime = boto3.client('personalize-runtime')
 
     def __init__(self, **params):
         # All we need to initialize this resolver is the ARN for the Personalize campaign/recommender
@@ -200,10 +219,10 @@ class PersonalizeRecommendationsResolver(Resolver):
 
         is_recommender = self.inference_arn.split(':')[5].startswith('recommender/')
         if is_recommender:
-            log.info('Calling recommender %s', self.inference_arn)
+            log.debug('Calling recommender %s', self.inference_arn)
             params['recommenderArn'] = self.inference_arn
         else:
-            log.info('Calling campaign %s', self.inference_arn)
+            log.debug('Calling campaign %s', self.inference_arn)
             params['campaignArn'] = self.inference_arn
 
         if not user_id and not item_id:
@@ -234,7 +253,7 @@ class PersonalizeRecommendationsResolver(Resolver):
 
         log.debug('PersonalizeRecommendationsResolver - getting recommendations %s', params)
 
-        response = PersonalizeRecommendationsResolver.__personalize_runtime.get_recommendations(**params)
+        response = personalize_runtime_client(kwargs.get('deadline')).get_recommendations(**params)
 
         return response['itemList']
 
@@ -278,7 +297,7 @@ class HttpResolver(Resolver):
         url += urllib.parse.urlencode(params)
 
         log.debug('HttpResolver - calling ' + url)
-        response = requests.get(url)
+        response = http_client.get(url, deadline = kwargs.get('deadline'))
 
         items = []
 
@@ -292,7 +311,7 @@ class HttpResolver(Resolver):
                 if len(items) >= num_results:
                     break
         else:
-            raise Exception(f'Error calling HTTP endpoint service: {response.status_code}: {response.reason}')
+            raise requests.HTTPError(f'Error calling HTTP endpoint service: {response.status_code}: {response.reason}', response = response)
 
         return items
 
@@ -302,7 +321,6 @@ class PersonalizeRankingResolver(Resolver):
 
     The campaign must be trained using the Personalized-Ranking recipe
     """
-    __personalize_runtime = boto3.client('personalize-runtime')
 
     def __init__(self, **params):
         # All we need to initialize this resolver is the ARN for the Personalize campaign
@@ -356,7 +374,7 @@ class PersonalizeRankingResolver(Resolver):
 
         log.debug('PersonalizeRankingResolver - getting personalized ranking %s', params)
 
-        response = PersonalizeRankingResolver.__personalize_runtime.get_personalized_ranking(**params)
+        response = personalize_runtime_client(kwargs.get('deadline')).get_personalized_ranking(**params)
 
         return response['personalizedRanking']
 
@@ -399,9 +417,10 @@ class PersonalizeContextComparePickResolver(Resolver):
 
     def __init__(self, **params):
         with_context = params.get('with_context')
-        without_context = params.get('with_context')
+        without_context = params.get('without_context')
         self.with_resolver = PersonalizeRankingResolver(**params, context=with_context)
         self.without_resolver = PersonalizeRankingResolver(**params, context=without_context)
+        self.timeout = float(params.get('timeout', CONTEXT_COMPARE_TIMEOUT))
 
     def get_items(self, **kwargs):
         """ Returns reranking items from an Amazon Personalize campaign trained with Personalized-Ranking recipe
@@ -415,20 +434,29 @@ class PersonalizeContextComparePickResolver(Resolver):
         if top_n is None:
             raise Exception('num_results is required')
 
-        log.debug('PersonalizeContextComparePickResolver - comparing personalized rankings...')
-        with_ranked = self.with_resolver.get_items(**kwargs)
-        without_ranked = self.without_resolver.get_items(**kwargs)
-        without_id_to_item = {item['itemId']: item for item in without_ranked}
-        with_id_to_item = {item['itemId']: item for item in with_ranked}
-        score_increases_with_discount = {item_id: with_id_to_item[item_id]['score'] / (0.01 + without_id_to_item[item_id]['score'])
-                                         for item_id in with_id_to_item}
-        # Let us get the items sorted according to this score:
-        discount_improve_sorted_item_ids = sorted(score_increases_with_discount.keys(),
-                                                  key=lambda item_id: score_increases_with_discount[item_id])
+        deadline = kwargs.get('deadline')
+        timeout = self.timeout if deadline is None else deadline.timeout(self.timeout)
 
-        discount_improve_sorted_items = [with_id_to_item[item_id] for item_id in discount_improve_sorted_item_ids]
-
-        return discount_improve_sorted_items[:top_n]
+        log.debug('PersonalizeContextComparePickResolver - comparing personalized rankings...')
+        # Get both rankings concurrently so the comparison costs a single round trip.
+        results = concurrency.gather([
+            (self.with_resolver.get_items, kwargs),
+            (self.without_resolver.get_items, kwargs)
+        ], timeout = timeout)
+        for succeeded, result in results:
+            if not succeeded:
+                raise result
+        with_ranked, without_ranked = results[0][1], results[1][1]
+
+        without_scores_by_id = {item['itemId']: item['score'] for item in without_ranked}
+        with_scores = np.fromiter((item['score'] for item in with_ranked), dtype = float, count = len(with_ranked))
+        without_scores = np.fromiter((without_scores_by_id[item['itemId']] for item in with_ranked), dtype = float, count = len(with_ranked))
+        score_increases_with_discount = with_scores / (0.01 + without_scores)
+
+        # Let us get the items sorted according to this score (stable so ties keep their ranked order):
+        discount_improve_sorted = np.argsort(score_increases_with_discount, kind = 'stable')
+
+        return [with_ranked[i] for i in discount_improve_sorted[:top_n]]
 
 class RandomPickResolver(Resolver):
     """ Picks random N products.
@@ -464,7 +492,12 @@ class RandomPickResolver(Resolver):
 
 
 class ResolverFactory:
-    """ Provides resolver instance given a type and initialization arguments """
+    """ Provides resolver instance given a type and initialization arguments
+
+    Resolvers hold only their configuration, so a single instance is shared by all
+    callers that ask for the same type and arguments. Instances are kept in a bounded
+    pool so that they are built once per configuration rather than once per request.
+    """
     TYPE_HTTP = 'http'
     TYPE_PRODUCT = 'product'
     TYPE_SIMILAR = 'similar'
@@ -474,7 +507,11 @@ class ResolverFactory:
     TYPE_PERSONALIZE_PICK = 'personalize-pick'
     TYPE_RANDOM_PICK = 'random-pick'
 
+    # Experiment variation fields that are counted rather than passed to resolvers.
+    COUNTER_PARAMS = frozenset(['exposures', 'conversions'])
+
     __resolvers = {}
+    __pool = TTLCache(max_size = RESOLVER_CACHE_SIZE, ttl = RESOLVER_CACHE_TTL)
 
     @staticmethod
     def register_resolver(type, resolver):
@@ -484,11 +521,29 @@ class ResolverFactory:
     @staticmethod
     def get(type, **params):
         """ Returns an instance of a resolver given its type and initialization arguments """
-        log.debug('ResolverFactory - resolving type/params %s/%s', type, params)
-        resolver = ResolverFactory.__resolvers.get(type)
-        if not resolver:
+        resolver_class = ResolverFactory.__resolvers.get(type)
+        if not resolver_class:
             raise ValueError(type)
-        return resolver(**params)
+
+        # Variations of experiments are reloaded with updated counters, which don't affect the resolver.
+        pool_params = {key: value for key, value in params.items() if key not in ResolverFactory.COUNTER_PARAMS}
+        key = (type, json.dumps(pool_params, sort_keys = True, default = str))
+        resolver = ResolverFactory.__pool.get(key)
+        if resolver is None:
+            log.debug('ResolverFactory - creating resolver for type/params %s/%s', type, params)
+            resolver = resolver_class(**params)
+            ResolverFactory.__pool.put(key, resolver)
+        return resolver
+
+    @staticmethod
+    def clear():
+        """ Discards pooled resolvers so that they are created again on next use """
+        ResolverFactory.__pool.clear()
+
+    @staticmethod
+    def pool_stats():
+        """ Returns counters for the resolver pool """
+        return ResolverFactory.__pool.stats()
 
 # Register resolvers with factory
 
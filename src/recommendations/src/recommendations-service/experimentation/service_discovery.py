@@ -0,0 +1,141 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Cached AWS Cloud Map lookups for other Retail Demo Store services
+
+Discovering instances on every request adds an AWS API round trip to the hot path and
+is throttled by Cloud Map at peak. Instead, healthy instances for each service are
+cached and refreshed in the background once they are older than the TTL. Requests are
+spread across all cached instances and an instance is evicted as soon as a
+connection to it fails.
+"""
+
+import itertools
+import os
+import threading
+import time
+import logging
+import boto3
+import requests
+
+from contextlib import contextmanager
+from typing import Dict, List
+from experimentation.aws_clients import client_config
+
+log = logging.getLogger(__name__)
+
+NAMESPACE_NAME = 'retaildemostore.local'
+# Seconds after which cached instances are refreshed in the background.
+DISCOVERY_TTL = float(os.environ.get('SERVICE_DISCOVERY_TTL', 30))
+# Seconds after which cached instances are too old to use while a refresh is in progress.
+DISCOVERY_MAX_STALENESS = float(os.environ.get('SERVICE_DISCOVERY_MAX_STALENESS', 300))
+
+servicediscovery = boto3.client('servicediscovery', config = client_config())
+
+class _ServiceInstances:
+    def __init__(self):
+        self.hosts: List[str] = []
+        self.fetched = 0.0
+        self.refreshing = False
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+class ServiceDiscoveryCache:
+    """ Caches healthy instances for services registered in a Cloud Map namespace """
+
+    def __init__(self, namespace_name: str = NAMESPACE_NAME, ttl: float = DISCOVERY_TTL,
+                 max_staleness: float = DISCOVERY_MAX_STALENESS, client = None):
+        self.namespace_name = namespace_name
+        self.ttl = ttl
+        self.max_staleness = max(ttl, max_staleness)
+        self._client = client if client else servicediscovery
+        self._services: Dict[str, _ServiceInstances] = {}
+        self._lock = threading.Lock()
+
+    def get_instance(self, service_name: str) -> str:
+        """ Returns the host/IP of a healthy instance of a service
+
+        Consecutive calls rotate through all healthy instances of the service.
+        """
+        instances = self._get_service(service_name)
+        age = time.monotonic() - instances.fetched
+
+        if not instances.hosts or age > self.max_staleness:
+            with instances.lock:
+                # Another thread may have refreshed while we waited for the lock.
+                if not instances.hosts or time.monotonic() - instances.fetched > self.max_staleness:
+                    self._refresh(service_name, instances)
+        elif age > self.ttl and not instances.refreshing:
+            self._refresh_in_background(service_name, instances)
+
+        hosts = instances.hosts
+        if not hosts:
+            raise Exception(f'No healthy instances found for service {service_name}')
+
+        return hosts[next(instances.counter) % len(hosts)]
+
+    def evict(self, service_name: str, host: str):
+        """ Removes an instance that could not be reached so it is no longer handed out
+
+        Once all instances of a service have been evicted, the next lookup will
+        discover instances from Cloud Map again.
+        """
+        instances = self._services.get(service_name)
+        if instances and host in instances.hosts:
+            instances.hosts = [h for h in instances.hosts if h != host]
+            log.warning('Evicted unreachable %s service instance %s', service_name, host)
+
+    @contextmanager
+    def evict_on_connection_error(self, service_name: str, host: str):
+        """ Context manager that evicts host if a connection error is raised within it """
+        try:
+            yield
+        except requests.ConnectionError:
+            self.evict(service_name, host)
+            raise
+
+    def _get_service(self, service_name: str) -> _ServiceInstances:
+        instances = self._services.get(service_name)
+        if instances is None:
+            with self._lock:
+                instances = self._services.setdefault(service_name, _ServiceInstances())
+        return instances
+
+    def _refresh_in_background(self, service_name: str, instances: _ServiceInstances):
+        with instances.lock:
+            if instances.refreshing:
+                return
+            instances.refreshing = True
+
+        def refresh():
+            try:
+                self._refresh(service_name, instances)
+            except Exception as e:
+                log.warning('Unable to refresh instances for %s service; using cached instances: %s', service_name, e)
+            finally:
+                instances.refreshing = False
+
+        threading.Thread(target = refresh, name = f'discovery-{service_name}', daemon = True).start()
+
+    def _refresh(self, service_name: str, instances: _ServiceInstances):
+        response = self._client.discover_instances(
+            NamespaceName=self.namespace_name,
+            ServiceName=service_name,
+            HealthStatus='HEALTHY'
+        )
+
+        hosts = [instance['Attributes']['AWS_INSTANCE_IPV4'] for instance in response['Instances']]
+        log.debug('Discovered %s service instances: %s', service_name, hosts)
+
+        instances.hosts = hosts
+        instances.fetched = time.monotonic()
+
+discovery = ServiceDiscoveryCache()
+
+def get_instance(service_name: str) -> str:
+    """ Returns the host/IP of a healthy instance of a service from the shared cache """
+    return discovery.get_instance(service_name)
+
+def evict_on_connection_error(service_name: str, host: str):
+    """ Context manager that evicts host from the shared cache if a connection error is raised within it """
+    return discovery.evict_on_connection_error(service_name, host)
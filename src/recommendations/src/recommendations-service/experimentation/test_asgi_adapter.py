@@ -0,0 +1,233 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import asyncio
+import json
+import threading
+import unittest
+import boto3
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from experimentation.asgi_adapter import create_application
+from experimentation.aws_clients import client_config
+
+"""
+python -m unittest experimentation/test_asgi_adapter.py
+"""
+
+def echo_app(environ, start_response):
+    body = environ['wsgi.input'].read()
+    start_response('201 CREATED', [('Content-Type', 'text/plain'), ('X-Query', environ['QUERY_STRING']),
+                                   ('X-Header', environ.get('HTTP_X_TEST', ''))])
+    return [environ['REQUEST_METHOD'].encode(), b' ', environ['PATH_INFO'].encode(), b' ', body]
+
+def streaming_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'application/x-ndjson')])
+    return (f'{i}\n'.encode() for i in range(3))
+
+def failing_app(environ, start_response):
+    raise ValueError('failed')
+
+class PersonalizeHandler(BaseHTTPRequestHandler):
+    """ Answers Personalize runtime calls once all concurrent calls have arrived, recording their connections """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.connections.add(self.client_address)
+        self.server.barrier.wait(timeout = 5)
+        body = json.dumps({'itemList': []}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-amz-json-1.1')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def call(app, method = 'GET', path = '/', query_string = b'', headers = None, body = b''):
+    sent = []
+    requests = [{'type': 'http.request', 'body': body[:2], 'more_body': True},
+                {'type': 'http.request', 'body': body[2:], 'more_body': False}]
+
+    async def receive():
+        if requests:
+            return requests.pop(0)
+        # The client stays connected until the response is complete.
+        await asyncio.sleep(10)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query_string,
+             'headers': headers or [], 'http_version': '1.1', 'scheme': 'http'}
+
+    async def run():
+        try:
+            await app(scope, receive, send)
+        except Exception as e:
+            return e
+
+    error = asyncio.run(run())
+    return sent, error
+
+class TestCreateApplication(unittest.TestCase):
+
+    def test_request_and_response(self):
+        sent, error = call(create_application(echo_app, max_threads = 2), method = 'POST', path = '/rerank',
+                           query_string = b'a=1', headers = [(b'x-test', b'yes')], body = b'{"a": 1}')
+
+        self.assertIsNone(error)
+        self.assertEqual(sent[0]['status'], 201)
+        self.assertIn((b'x-query', b'a=1'), sent[0]['headers'])
+        self.assertIn((b'x-header', b'yes'), sent[0]['headers'])
+        self.assertEqual(b''.join(message.get('body', b'') for message in sent[1:]), b'POST /rerank {"a": 1}')
+        self.assertFalse(sent[-1].get('more_body', False))
+
+    def test_streaming_response(self):
+        sent, _ = call(create_application(streaming_app, max_threads = 2))
+
+        self.assertEqual([message['body'] for message in sent[1:]], [b'0\n', b'1\n', b'2\n', b''])
+
+    def test_error_before_response(self):
+        sent, error = call(create_application(failing_app, max_threads = 2))
+
+        # The server responds with a 500 error when the application raises before responding.
+        self.assertIsInstance(error, ValueError)
+        self.assertEqual(sent, [])
+
+    def test_disconnect_stops_response(self):
+        produced = []
+        closed = threading.Event()
+
+        def endless_app(environ, start_response):
+            def lines():
+                try:
+                    while True:
+                        produced.append(True)
+                        yield b'line\n'
+                finally:
+                    closed.set()
+
+            start_response('200 OK', [('Content-Type', 'application/x-ndjson')])
+            return lines()
+
+        app = create_application(endless_app, max_threads = 2, send_queue_size = 2)
+        sent = []
+        requested = [False]
+        produced_at_disconnect = []
+
+        async def receive():
+            if not requested[0]:
+                requested[0] = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            while len(sent) < 5:
+                await asyncio.sleep(0.01)
+            produced_at_disconnect.append(len(produced))
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'',
+                 'headers': [], 'http_version': '1.1', 'scheme': 'http'}
+        asyncio.run(asyncio.wait_for(app(scope, receive, send), 5))
+
+        # At most the queued chunks and the one being sent are produced after the disconnect.
+        self.assertTrue(closed.is_set())
+        self.assertLessEqual(len(produced), produced_at_disconnect[0] + 4)
+
+    def test_slow_client_holds_back_response(self):
+        produced = []
+
+        def streaming(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'application/x-ndjson')])
+            for i in range(100):
+                produced.append(i)
+                yield b'line\n'
+
+        app = create_application(streaming, max_threads = 2, send_queue_size = 2)
+        sent = []
+        produced_before_reading = []
+
+        async def receive():
+            await asyncio.sleep(10)
+
+        async def send(message):
+            if not produced_before_reading:
+                # The client doesn't read the response for a while.
+                await asyncio.sleep(0.2)
+                produced_before_reading.append(len(produced))
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'',
+                 'headers': [], 'http_version': '1.1', 'scheme': 'http'}
+        asyncio.run(app(scope, receive, send))
+
+        # Only the queued chunks were produced while the client wasn't reading.
+        self.assertLessEqual(produced_before_reading[0], 4)
+        self.assertEqual(len(sent), 102)
+
+    def test_concurrent_aws_calls_reuse_connections(self):
+        concurrent_requests = 20
+        server = ThreadingHTTPServer(('127.0.0.1', 0), PersonalizeHandler)
+        server.daemon_threads = True
+        server.connections = set()
+        server.barrier = threading.Barrier(concurrent_requests)
+        threading.Thread(target = server.serve_forever, daemon = True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        client = boto3.client('personalize-runtime', region_name = 'us-east-1', endpoint_url = f'http://127.0.0.1:{server.server_port}',
+                              aws_access_key_id = 'test', aws_secret_access_key = 'test', config = client_config())
+
+        def personalize_app(environ, start_response):
+            response = client.get_recommendations(campaignArn = 'arn:campaign', userId = environ['QUERY_STRING'])
+            start_response('200 OK', [('Content-Type', 'application/json')])
+            return [json.dumps(response['itemList']).encode()]
+
+        app = create_application(personalize_app, max_threads = concurrent_requests)
+
+        async def request(user_id):
+            sent = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {'type': 'http', 'method': 'GET', 'path': '/', 'query_string': user_id.encode(),
+                     'headers': [], 'http_version': '1.1', 'scheme': 'http'}
+            await app(scope, receive, send)
+            return sent[0]['status']
+
+        async def requests():
+            return await asyncio.gather(*(request(str(i)) for i in range(concurrent_requests)))
+
+        # All calls are in progress at once, then a second round is served by the same connections.
+        for _ in range(2):
+            self.assertEqual(asyncio.run(requests()), [200] * concurrent_requests)
+
+        self.assertEqual(len(server.connections), concurrent_requests)
+
+    def test_lifespan(self):
+        started = []
+        app = create_application(echo_app, max_threads = 2, on_startup = lambda: started.append(True))
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(app({'type': 'lifespan'}, receive, send))
+
+        self.assertEqual(started, [True])
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+import uuid
+import numpy as np
+
+from unittest.mock import MagicMock, patch
+from experimentation import bandit
+from experimentation.bandit import BanditPosterior
+from experimentation.counters import VariationCounterBuffer
+from experimentation.experiment_manager import ExperimentManager
+from experimentation.experiment_mab import MultiArmedBanditExperiment
+from experimentation.resolvers import ResolverFactory
+
+"""
+python -m unittest experimentation/test_bandit.py
+"""
+
+class TestBanditPosterior(unittest.TestCase):
+
+    def setUp(self):
+        self.counters = VariationCounterBuffer(flush_interval = 3600)
+        self.addCleanup(self.counters._worker.stop)
+        patch.object(bandit, 'variation_counters', self.counters).start()
+        self.addCleanup(patch.stopall)
+
+    def assertParameters(self, posterior, alpha, beta):
+        actual_alpha, actual_beta = posterior.parameters()
+        self.assertEqual(actual_alpha.tolist(), alpha)
+        self.assertEqual(actual_beta.tolist(), beta)
+
+    def test_local_counts_applied_immediately(self):
+        posterior = BanditPosterior('exp1', [10, 20], [1, 2])
+        posterior.add_exposures(0, 3)
+        posterior.add_conversions(1)
+
+        self.assertParameters(posterior, [2, 4], [14, 21])
+
+    def test_rebased_on_newer_counts_and_pending_increments(self):
+        posterior = BanditPosterior('exp1', [10, 20], [1, 2])
+        posterior.add_exposures(0, 5)
+        # Counts from this process that have not been written are still pending.
+        self.counters.increment(MagicMock(), 'exp1', 1, 'exposures', 4)
+        self.counters.increment(MagicMock(), 'exp1', 1, 'conversions', 1)
+
+        self.assertTrue(posterior.reconcile([15, 30], [1, 3]))
+        self.assertParameters(posterior, [2, 5], [16, 35])
+
+    def test_same_or_older_counts_ignored(self):
+        posterior = BanditPosterior('exp1', [10, 20], [1, 2])
+        posterior.add_exposures(0)
+
+        self.assertFalse(posterior.reconcile([10, 20], [1, 2]))
+        self.assertFalse(posterior.reconcile([5, 20], [1, 2]))
+        self.assertParameters(posterior, [2, 3], [12, 21])
+        self.assertEqual(posterior.rebases, 1)
+
+    def test_vectorized_sampling(self):
+        np.random.seed(0)
+        posterior = BanditPosterior('exp1', [1000, 1000, 1000], [10, 500, 10])
+
+        indexes = posterior.sample(5000)
+
+        self.assertEqual(indexes.shape, (5000,))
+        self.assertGreater(np.mean(indexes == 1), 0.99)
+        self.assertEqual(posterior.sample(), 1)
+
+class TestMultiArmedBanditExperiment(unittest.TestCase):
+
+    def setUp(self):
+        self.counters = VariationCounterBuffer(flush_interval = 3600)
+        self.addCleanup(self.counters._worker.stop)
+        patch.object(bandit, 'variation_counters', self.counters).start()
+        patch('experimentation.experiment.variation_counters', self.counters).start()
+        patch.dict(bandit._posteriors, clear = True).start()
+        self.addCleanup(patch.stopall)
+
+        self.exp_config = {
+            'id': uuid.uuid4().hex,
+            'feature': 'test-feature',
+            'name': 'test-mab-experiment',
+            'type': 'mab',
+            'status': 'ACTIVE',
+            'variations': [{
+                'type': ResolverFactory.TYPE_PRODUCT,
+                'products_service_host': '10.10.10.10',
+                'exposures': 100,
+                'conversions': 5
+            },{
+                'type': ResolverFactory.TYPE_PRODUCT,
+                'products_service_host': '10.10.10.10',
+                'exposures': 100,
+                'conversions': 10
+            }]
+        }
+
+    def test_posterior_shared_between_instances(self):
+        experiment = MultiArmedBanditExperiment(MagicMock(), **self.exp_config)
+        experiment._increment_exposure_count(0, 2)
+
+        # Outcomes may be tracked through another instance built from the same document.
+        other = MultiArmedBanditExperiment(MagicMock(), **self.exp_config)
+        other.track_conversion(f'{self.exp_config["id"]}~user1~1~1', None)
+
+        alpha, beta = experiment._posterior().parameters()
+        self.assertEqual(alpha.tolist(), [6, 12])
+        self.assertEqual(beta.tolist(), [103, 101])
+        self.assertEqual(self.counters.pending(self.exp_config['id']), {(0, 'exposures'): 2, (1, 'conversions'): 1})
+
+    def test_select_variation_indexes(self):
+        experiment = MultiArmedBanditExperiment(MagicMock(), **self.exp_config)
+
+        indexes = experiment.select_variation_indexes(1000)
+
+        self.assertEqual(len(indexes), 1000)
+        self.assertTrue(set(indexes.tolist()) <= {0, 1})
+        self.assertIn(experiment._select_variation_index(), (0, 1))
+
+    def test_posterior_follows_counts_refreshed_by_experiment_manager(self):
+        table = MagicMock()
+        table.query.return_value = {'Count': 1, 'Items': [self.exp_config]}
+        patch.object(ExperimentManager, '_ExperimentManager__table_name', 'ExperimentStrategy').start()
+        patch.object(ExperimentManager, '_ExperimentManager__table', table).start()
+        evidently = patch('experimentation.experiment_manager.EvidentlyFeatureResolver').start()
+        evidently.return_value.evaluate_feature.return_value = None
+        ExperimentManager.invalidate()
+        self.addCleanup(ExperimentManager.invalidate)
+
+        experiment = ExperimentManager().get_active('test-feature', '1')
+        experiment._increment_exposure_count(0)
+        self.assertEqual(experiment._posterior().parameters()[1].tolist(), [102, 101])
+
+        # Other processes' counts are written to the table and the local count is flushed.
+        self.counters.flush()
+        self.exp_config['variations'] = [dict(variation) for variation in self.exp_config['variations']]
+        self.exp_config['variations'][0].update(exposures = 5000, conversions = 400)
+        self.exp_config['variations'][1].update(exposures = 4000, conversions = 300)
+        ExperimentManager.invalidate('test-feature')
+
+        refreshed = ExperimentManager().get_active('test-feature', '1')
+        self.assertIs(refreshed, experiment)
+        alpha, beta = experiment._posterior().parameters()
+        self.assertEqual(alpha.tolist(), [401, 301])
+        self.assertEqual(beta.tolist(), [5001, 4001])
+
+if __name__ == '__main__':
+    unittest.main()
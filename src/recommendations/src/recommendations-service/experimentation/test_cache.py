@@ -0,0 +1,80 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+
+from unittest.mock import patch
+from experimentation.cache import TTLCache
+
+"""
+python -m unittest experimentation/test_cache.py
+"""
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_hit_and_miss(self):
+        cache = TTLCache(max_size = 10, ttl = 60)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['size'], 1)
+
+    def test_size_eviction(self):
+        cache = TTLCache(max_size = 2, ttl = 60)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')      # 'b' is now least recently used
+        cache.put('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_ttl_eviction(self):
+        cache = TTLCache(max_size = 10, ttl = 5)
+        with patch('experimentation.cache.time.monotonic', return_value = 100):
+            cache.put('a', 1)
+        with patch('experimentation.cache.time.monotonic', return_value = 104):
+            self.assertEqual(cache.get('a'), 1)
+        with patch('experimentation.cache.time.monotonic', return_value = 106):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_per_entry_ttl(self):
+        cache = TTLCache(max_size = 10, ttl = 5)
+        with patch('experimentation.cache.time.monotonic', return_value = 100):
+            cache.put('a', 1, ttl = 30)
+            cache.put('b', 2)
+        with patch('experimentation.cache.time.monotonic', return_value = 110):
+            self.assertEqual(cache.get('a'), 1)
+            self.assertIsNone(cache.get('b'))
+
+    def test_weight_eviction(self):
+        cache = TTLCache(max_size = 10, ttl = 60, max_weight = 10, weigher = lambda key, value: len(value))
+        cache.put('a', 'xxxx')
+        cache.put('b', 'xxxx')
+        cache.put('a', 'xxx')
+        self.assertEqual(cache.stats()['weight'], 7)
+
+        # Evicts the least recently used entry to make room
+        cache.put('c', 'xxxxx')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'xxx')
+        self.assertEqual(cache.stats()['weight'], 8)
+
+        # Entries heavier than the cache are not cached
+        cache.put('d', 'x' * 11)
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual(len(cache), 2)
+
+        cache.pop('a')
+        self.assertEqual(cache.stats()['weight'], 5)
+
+if __name__ == '__main__':
+    unittest.main()
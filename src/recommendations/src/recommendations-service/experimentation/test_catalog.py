@@ -0,0 +1,44 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import time
+import unittest
+
+from unittest.mock import MagicMock
+from experimentation.catalog import CatalogIndex
+
+"""
+python -m unittest experimentation/test_catalog.py
+"""
+
+class TestCatalogIndex(unittest.TestCase):
+
+    def test_loads_in_background(self):
+        loader = MagicMock(return_value = [{'id': '1', 'category': 'books'}, {'id': '2', 'category': 'footwear'}])
+        index = CatalogIndex(loader, refresh_interval = 3600)
+        self.addCleanup(index.stop)
+
+        # The first lookup doesn't wait for the catalog
+        index.get_category('1')
+
+        for _ in range(100):
+            if index.loaded:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(index.get_category('1'), 'books')
+        self.assertEqual(index.get_category('2'), 'footwear')
+        self.assertIsNone(index.get_category('3'))
+        loader.assert_called_once()
+
+    def test_add_and_refresh(self):
+        index = CatalogIndex(MagicMock(return_value = [{'id': '1', 'category': 'books'}]), refresh_interval = 3600)
+
+        index.add([{'id': '2', 'category': 'footwear'}, {'id': '3'}])
+        self.assertEqual(index._categories, {'2': 'footwear'})
+
+        index.refresh()
+        self.assertEqual(index._categories, {'1': 'books'})
+
+if __name__ == '__main__':
+    unittest.main()
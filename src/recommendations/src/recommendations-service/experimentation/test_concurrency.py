@@ -0,0 +1,116 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import contextvars
+import threading
+import time
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from experimentation import concurrency
+
+def sleep(seconds):
+    time.sleep(seconds)
+
+"""
+python -m unittest experimentation/test_concurrency.py
+"""
+
+class TestGather(unittest.TestCase):
+
+    def test_results_in_order(self):
+        def add(a, b):
+            time.sleep(0.05 * a)
+            return a + b
+
+        results = concurrency.gather([(add, {'a': 2, 'b': 1}), (add, {'a': 1, 'b': 1})], timeout = 5)
+
+        self.assertEqual(results, [(True, 3), (True, 2)])
+
+    def test_runs_concurrently(self):
+        started = time.monotonic()
+        concurrency.gather([(sleep, {'seconds': 0.2}) for _ in range(4)], timeout = 5)
+
+        self.assertLess(time.monotonic() - started, 0.6)
+
+    def test_exceptions_and_timeouts(self):
+        def fail():
+            raise ValueError('failed')
+
+        results = concurrency.gather([(fail, {}), (sleep, {'seconds': 1}), (lambda: 'ok', {})], timeout = 0.2)
+
+        self.assertFalse(results[0][0])
+        self.assertIsInstance(results[0][1], ValueError)
+        self.assertFalse(results[1][0])
+        self.assertIsInstance(results[1][1], TimeoutError)
+        self.assertEqual(results[2], (True, 'ok'))
+
+    def test_context_variables_propagated(self):
+        request_id = contextvars.ContextVar('request_id', default = None)
+        request_id.set('abc')
+
+        results = concurrency.gather([(request_id.get, {})], timeout = 5)
+
+        self.assertEqual(results, [(True, 'abc')])
+
+class TestMapCompleted(unittest.TestCase):
+
+    def test_bounded_concurrency(self):
+        lock = threading.Lock()
+        active = [0, 0]
+
+        def square(x):
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            time.sleep(0.01)
+            with lock:
+                active[0] -= 1
+            if x == 3:
+                raise ValueError('failed')
+            return x * x
+
+        results = {arg: future for wave in concurrency.map_completed(square, range(20), max_concurrency = 4) for arg, future in wave}
+
+        self.assertEqual(sorted(results), list(range(20)))
+        self.assertEqual(results[2].result(), 4)
+        self.assertIsInstance(results[3].exception(), ValueError)
+        self.assertLessEqual(active[1], 4)
+
+    def test_map_completed_yields_results_as_they_complete(self):
+        def delayed(seconds):
+            time.sleep(seconds)
+            return seconds
+
+        completed = [arg for wave in concurrency.map_completed(delayed, [0.3, 0.01, 0.1], max_concurrency = 3) for arg, _ in wave]
+
+        self.assertEqual(completed, [0.01, 0.1, 0.3])
+
+    def test_calls_completed_together_in_one_wave(self):
+        release = threading.Event()
+
+        def wait_for_release(x):
+            if x:
+                release.wait(5)
+            return x
+
+        waves = concurrency.map_completed(wait_for_release, range(4), max_concurrency = 4)
+        self.assertEqual([arg for arg, _ in next(waves)], [0])
+
+        release.set()
+        time.sleep(0.1)
+        self.assertEqual(sorted(arg for arg, _ in next(waves)), [1, 2, 3])
+
+    def test_map_completed_can_use_resolver_pool(self):
+        # Batch calls that wait on the resolver pool don't starve it, even with more calls than its threads.
+        def user(x):
+            return concurrency.gather([(lambda value: value, {'value': x})], timeout = 5)[0]
+
+        with patch.object(concurrency, '_executor', ThreadPoolExecutor(max_workers = 2)):
+            results = [future.result() for wave in concurrency.map_completed(user, range(10), max_concurrency = 8) for _, future in wave]
+
+        self.assertEqual(sorted(result for _, result in results), list(range(10)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+
+from unittest.mock import MagicMock
+from botocore.exceptions import ClientError, EndpointConnectionError
+from experimentation.counters import VariationCounterBuffer
+
+"""
+python -m unittest experimentation/test_counters.py
+"""
+
+class TestVariationCounterBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = VariationCounterBuffer(flush_interval = 3600, max_pending = 1000)
+        self.addCleanup(self.buffer._worker.stop)
+
+    def test_combined_update(self):
+        table = MagicMock()
+        for _ in range(3):
+            self.buffer.increment(table, 'exp1', 0, 'exposures')
+        self.buffer.increment(table, 'exp1', 1, 'exposures', 2)
+        self.buffer.increment(table, 'exp1', 1, 'conversions')
+
+        self.assertEqual(self.buffer.pending('exp1'), {(0, 'exposures'): 3, (1, 'exposures'): 2, (1, 'conversions'): 1})
+        table.update_item.assert_not_called()
+
+        self.buffer.flush()
+
+        table.update_item.assert_called_once_with(
+            Key={'id': 'exp1'},
+            UpdateExpression='ADD variations[0].exposures :incr0, variations[1].conversions :incr1, variations[1].exposures :incr2',
+            ExpressionAttributeValues={':incr0': 3, ':incr1': 1, ':incr2': 2}
+        )
+        self.assertEqual(self.buffer.pending('exp1'), {})
+
+    def test_failed_flush_is_retried(self):
+        table = MagicMock()
+        table.update_item.side_effect = ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException'}}, 'UpdateItem')
+
+        self.buffer.increment(table, 'exp1', 0, 'exposures')
+        self.buffer.flush()
+        self.assertEqual(self.buffer.pending('exp1'), {(0, 'exposures'): 1})
+        self.assertEqual(self.buffer.failed_flushes, 1)
+
+        table.update_item.side_effect = None
+        self.buffer.flush()
+        self.assertEqual(self.buffer.pending('exp1'), {})
+        self.assertEqual(table.update_item.call_count, 2)
+
+    def test_connection_error_retried_and_other_experiments_written(self):
+        failing = MagicMock()
+        failing.update_item.side_effect = EndpointConnectionError(endpoint_url = 'https://dynamodb')
+        table = MagicMock()
+
+        self.buffer.increment(failing, 'exp1', 0, 'exposures')
+        self.buffer.increment(table, 'exp2', 0, 'exposures')
+        self.buffer.flush()
+
+        self.assertEqual(self.buffer.pending('exp1'), {(0, 'exposures'): 1})
+        table.update_item.assert_called_once()
+
+    def test_counts_dropped_after_max_retries(self):
+        buffer = VariationCounterBuffer(flush_interval = 3600, max_retries = 2)
+        self.addCleanup(buffer._worker.stop)
+        table = MagicMock()
+        table.update_item.side_effect = ClientError({'Error': {'Code': 'ResourceNotFoundException'}}, 'UpdateItem')
+
+        buffer.increment(table, 'exp1', 0, 'exposures', 5)
+        for _ in range(3):
+            buffer.flush()
+        buffer.increment(table, 'exp1', 0, 'exposures')
+
+        self.assertEqual(table.update_item.call_count, 3)
+        self.assertEqual(buffer.pending('exp1'), {(0, 'exposures'): 1})
+        self.assertEqual(buffer.stats()['dropped'], 5)
+
+    def test_unexpected_error_keeps_unwritten_counts(self):
+        table = MagicMock()
+        table.update_item.side_effect = ValueError('unexpected')
+
+        self.buffer.increment(table, 'exp1', 0, 'exposures')
+        self.buffer.increment(table, 'exp2', 1, 'conversions')
+        with self.assertRaises(ValueError):
+            self.buffer.flush()
+
+        self.assertEqual(self.buffer.pending('exp1'), {(0, 'exposures'): 1})
+        self.assertEqual(self.buffer.pending('exp2'), {(1, 'conversions'): 1})
+
+    def test_max_pending_wakes_worker(self):
+        buffer = VariationCounterBuffer(flush_interval = 3600, max_pending = 2)
+        buffer._worker = MagicMock()
+
+        buffer.increment(MagicMock(), 'exp1', 0, 'exposures')
+        buffer._worker.wakeup.assert_not_called()
+        buffer.increment(MagicMock(), 'exp1', 0, 'exposures')
+        buffer._worker.wakeup.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+
+import requests
+
+from unittest.mock import MagicMock, patch
+from experimentation import deadline
+from experimentation.deadline import Deadline, DeadlineExceeded, is_timeout, personalize_runtime_client, personalize_runtime_settings
+from experimentation.resolvers import PersonalizeRecommendationsResolver, RankingProductsNoOpResolver
+
+"""
+python -m unittest experimentation/test_deadline.py
+"""
+
+class TestDeadline(unittest.TestCase):
+
+    def test_from_header(self):
+        self.assertEqual(Deadline.from_header('250', default = 2).budget, 0.25)
+        self.assertEqual(Deadline.from_header(None, default = 2).budget, 2)
+        self.assertEqual(Deadline.from_header('bogus', default = 2).budget, 2)
+        self.assertEqual(Deadline.from_header('60000', default = 2, maximum = 10).budget, 10)
+
+    def test_remaining_and_expired(self):
+        deadline = Deadline(10)
+        self.assertFalse(deadline.expired())
+        self.assertGreater(deadline.remaining(), 9)
+        self.assertEqual(deadline.timeout(1), 1)
+
+        expired = Deadline(0)
+        self.assertTrue(expired.expired())
+        self.assertEqual(expired.remaining(), 0)
+        with self.assertRaises(DeadlineExceeded):
+            expired.check()
+
+    def test_is_timeout(self):
+        self.assertTrue(is_timeout(DeadlineExceeded()))
+        self.assertTrue(is_timeout(TimeoutError()))
+        self.assertTrue(is_timeout(requests.ReadTimeout()))
+        self.assertFalse(is_timeout(ValueError()))
+
+    def test_resolver_checks_deadline(self):
+        resolver = RankingProductsNoOpResolver()
+        items = resolver.get_items(product_list = ['1', '2'], deadline = Deadline(10))
+        self.assertEqual([item['itemId'] for item in items], ['1', '2'])
+
+        with self.assertRaises(DeadlineExceeded):
+            resolver.get_items(product_list = ['1', '2'], deadline = Deadline(0))
+
+    def test_personalize_settings_fit_remaining_time(self):
+        for remaining in (10, 3, 2, 1, 0.5):
+            connect_timeout, read_timeout, attempts = personalize_runtime_settings(remaining)
+            backoff = 2 ** (attempts - 1) - 1
+            self.assertLessEqual(attempts * (connect_timeout + read_timeout) + backoff, remaining)
+
+        self.assertEqual(personalize_runtime_settings(10), (1.0, 2.0, 2))
+        # Retrying would leave too little time for each attempt.
+        self.assertEqual(personalize_runtime_settings(2), (0.5, 1.5, 1))
+        self.assertEqual(personalize_runtime_settings(0.01), (0.1, 0.1, 1))
+
+    def test_personalize_client_for_deadline(self):
+        with patch.object(deadline, 'boto3') as boto3, patch.dict(deadline._personalize_runtime_clients, clear = True):
+            boto3.client.side_effect = lambda service, config: config
+            config = personalize_runtime_client(Deadline(1.55))
+
+            self.assertEqual((config.connect_timeout, config.read_timeout, config.retries['max_attempts']), (0.3, 1.2, 1))
+            self.assertIs(personalize_runtime_client(Deadline(1.55)), config)
+            self.assertEqual(personalize_runtime_client().retries['max_attempts'], deadline.PERSONALIZE_MAX_ATTEMPTS)
+            with self.assertRaises(DeadlineExceeded):
+                personalize_runtime_client(Deadline(0))
+
+    def test_resolver_uses_client_for_deadline(self):
+        client = MagicMock()
+        client.get_recommendations.return_value = {'itemList': [{'itemId': '1'}]}
+        resolver = PersonalizeRecommendationsResolver(inference_arn = 'arn:aws:personalize:us-east-1:123456789:campaign/test')
+        request_deadline = Deadline(10)
+
+        with patch('experimentation.resolvers.personalize_runtime_client', return_value = client) as get_client:
+            self.assertEqual(resolver.get_items(user_id = '1', deadline = request_deadline), [{'itemId': '1'}])
+
+        get_client.assert_called_once_with(request_deadline)
+
+if __name__ == '__main__':
+    unittest.main()
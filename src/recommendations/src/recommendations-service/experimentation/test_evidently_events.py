@@ -0,0 +1,112 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import unittest
+
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import ClientError, EndpointConnectionError
+from experimentation import buffered_sender
+from experimentation.evidently_events import EvidentlyEventBuffer
+from experimentation.experiment_evidently import EvidentlyExperiment, CONVERSION_METRIC_VALUE
+
+"""
+python -m unittest experimentation/test_evidently_events.py
+"""
+
+TIMESTAMP = datetime(2023, 1, 1)
+
+def all_recorded(project, events):
+    return {'failedEventCount': 0, 'eventResults': [{} for _ in events]}
+
+class TestEvidentlyEventBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.put_project_events.side_effect = all_recorded
+        self.buffer = EvidentlyEventBuffer(buffer_size = 200, flush_interval = 3600, max_retries = 2, client = self.client)
+        self.addCleanup(self.buffer._worker.stop)
+
+    def test_batches_events_by_project(self):
+        self.buffer._worker = MagicMock()
+        for i in range(120):
+            self.buffer.put('project1', str(i), 'homeProductRecsClicked', 1.0, TIMESTAMP)
+        self.buffer.put('project2', 'user', 'homeProductRecsClicked', 1.0, TIMESTAMP)
+        self.client.put_project_events.assert_not_called()
+        # A full batch wakes the worker rather than waiting for the interval.
+        self.buffer._worker.wakeup.assert_called()
+
+        self.buffer.flush()
+
+        batches = [(call.kwargs['project'], len(call.kwargs['events'])) for call in self.client.put_project_events.call_args_list]
+        self.assertEqual(batches, [('project1', 50), ('project1', 50), ('project1', 20), ('project2', 1)])
+        first = self.client.put_project_events.call_args_list[0].kwargs['events'][0]
+        self.assertEqual(first['timestamp'], TIMESTAMP)
+        self.assertEqual(json.loads(first['data']), {
+            'details': {'homeProductRecsClicked': 1.0},
+            'userDetails': {'userId': '0'}
+        })
+        self.assertEqual(self.buffer.stats()['sent'], 121)
+
+    @patch.object(buffered_sender, 'RETRY_BACKOFF', 0)
+    def test_retries_failed_events(self):
+        self.client.put_project_events.side_effect = [
+            {'failedEventCount': 1, 'eventResults': [{}, {'errorCode': 'ThrottlingException'}]},
+            all_recorded('project1', [{}])
+        ]
+        self.buffer.put('project1', '1', 'metric', 1.0, TIMESTAMP)
+        self.buffer.put('project1', '2', 'metric', 1.0, TIMESTAMP)
+
+        self.buffer.flush()
+
+        retried = self.client.put_project_events.call_args.kwargs['events']
+        self.assertEqual(len(retried), 1)
+        self.assertEqual(json.loads(retried[0]['data'])['userDetails']['userId'], '2')
+        self.assertEqual(self.buffer.stats()['sent'], 2)
+
+    @patch.object(buffered_sender, 'RETRY_BACKOFF', 0)
+    def test_counts_events_that_cannot_be_sent(self):
+        self.client.put_project_events.side_effect = ClientError({'Error': {'Code': 'ServiceUnavailable'}}, 'PutProjectEvents')
+        self.buffer.put('project1', '1', 'metric', 1.0, TIMESTAMP)
+
+        self.buffer.flush()
+
+        self.assertEqual(self.client.put_project_events.call_count, 3)
+        self.assertEqual(self.buffer.stats()['failed'], 1)
+
+    @patch.object(buffered_sender, 'RETRY_BACKOFF', 0)
+    def test_retries_connection_errors(self):
+        self.client.put_project_events.side_effect = [
+            EndpointConnectionError(endpoint_url = 'https://evidently'),
+            all_recorded('project1', [{}])
+        ]
+        self.buffer.put('project1', '1', 'metric', 1.0, TIMESTAMP)
+
+        self.buffer.flush()
+
+        self.assertEqual(self.client.put_project_events.call_count, 2)
+        self.assertEqual(self.buffer.stats()['sent'], 1)
+        self.assertEqual(self.buffer.stats()['failed'], 0)
+
+    def test_drops_events_when_full(self):
+        buffer = EvidentlyEventBuffer(buffer_size = 2, flush_interval = 3600, client = self.client)
+        buffer._worker = MagicMock()
+        for i in range(3):
+            buffer.put('project1', str(i), 'metric', 1.0, TIMESTAMP)
+
+        self.assertEqual(buffer.stats()['buffered'], 2)
+        self.assertEqual(buffer.stats()['dropped'], 1)
+
+class TestEvidentlyExperimentEvents(unittest.TestCase):
+
+    def test_conversion_is_buffered(self):
+        experiment = EvidentlyExperiment(id = 'exp', name = 'exp', feature = 'home_product_recs',
+                                         project = 'retaildemostore', status = 'ACTIVE', type = 'evidently', variations = [])
+        with patch('experimentation.experiment_evidently.event_buffer') as event_buffer:
+            experiment.track_conversion('evidently~user1~home_product_recs', TIMESTAMP)
+
+        event_buffer.put.assert_called_once_with('retaildemostore', 'user1', 'homeProductRecsClicked', CONVERSION_METRIC_VALUE, TIMESTAMP)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import unittest
+
+from unittest.mock import patch
+from experimentation import evidently_feature_resolver
+from experimentation.cache import TTLCache
+from experimentation.evidently_feature_resolver import EvidentlyFeatureResolver
+from experimentation.features import FEATURE_NAMES
+
+"""
+python -m unittest experimentation/test_evidently_feature_resolver.py
+"""
+
+PROJECT_ARN = 'arn:aws:evidently:us-east-1:123456789:project/retaildemostore'
+
+def evaluation(feature: str, reason: str = 'DEFAULT') -> dict:
+    return {
+        'project': PROJECT_ARN,
+        'feature': f'{PROJECT_ARN}/feature/{feature}',
+        'variation': 'personalize',
+        'value': {'stringValue': json.dumps({'type': 'personalize-recommendations', 'arn': 'arn:campaign'})},
+        'reason': reason,
+        'details': json.dumps({'experiment': 'test-experiment'})
+    }
+
+class TestEvidentlyFeatureResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TTLCache(max_size = 2, ttl = 30, max_weight = 64 * 1024,
+                              weigher = evidently_feature_resolver._weigh_evaluations)
+        self.client = patch.object(evidently_feature_resolver, 'evidently').start()
+        self.client.batch_evaluate_feature.return_value = {'results': [
+            evaluation(FEATURE_NAMES[0], 'EXPERIMENT_RULE_MATCH'),
+            evaluation(FEATURE_NAMES[1])
+        ]}
+        patch.object(evidently_feature_resolver, 'eval_features_by_user_cache', self.cache).start()
+        self.addCleanup(patch.stopall)
+
+    def test_experiment_for_matching_rule(self):
+        experiment = EvidentlyFeatureResolver().evaluate_feature('user1', FEATURE_NAMES[0])
+
+        self.assertEqual(experiment.id, 'test-experiment')
+        self.assertEqual(experiment.project, 'retaildemostore')
+        self.assertEqual(experiment.variations[0].config['inference_arn'], 'arn:campaign')
+
+    def test_no_experiment_for_default_or_missing_feature(self):
+        resolver = EvidentlyFeatureResolver()
+
+        self.assertIsNone(resolver.evaluate_feature('user1', FEATURE_NAMES[1]))
+        self.assertIsNone(resolver.evaluate_feature('user1', 'not_a_feature'))
+
+    def test_evaluations_cached_per_user(self):
+        resolver = EvidentlyFeatureResolver()
+        resolver.evaluate_feature('user1', FEATURE_NAMES[0])
+        resolver.evaluate_feature('user1', FEATURE_NAMES[1])
+
+        self.assertEqual(self.client.batch_evaluate_feature.call_count, 1)
+        self.assertEqual(set(self.cache.get('user1')), {FEATURE_NAMES[0], FEATURE_NAMES[1]})
+
+    def test_cache_bounded_by_users(self):
+        resolver = EvidentlyFeatureResolver()
+        for user_id in ('user1', 'user2', 'user3'):
+            resolver.evaluate_feature(user_id, FEATURE_NAMES[0])
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get('user1'))
+        self.assertEqual(EvidentlyFeatureResolver.cache_stats()['evictions'], 1)
+        self.assertGreater(EvidentlyFeatureResolver.cache_stats()['weight'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,13 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
+import hashlib
 import unittest
 import uuid
 import json
+import time
+
+from unittest.mock import MagicMock, patch
 
 from experimentation.resolvers import ResolverFactory, PersonalizeRecommendationsResolver, DefaultProductResolver
 from experimentation.experiment_ab import ABExperiment
@@ -42,6 +46,29 @@ class TestExperiments(unittest.TestCase):
         self.assertTrue(type(experiment.variations[0].resolver) is PersonalizeRecommendationsResolver)
         self.assertTrue(type(experiment.variations[1].resolver) is DefaultProductResolver)
 
+    def ab_experiment(self, **config):
+        return ABExperiment('ExperimentStrategy', **{
+            'id': uuid.uuid4().hex,
+            'feature': 'test-feature',
+            'name': 'test-ab-experiment',
+            'type': 'ab',
+            'status': 'ACTIVE',
+            'variations': [{'type': ResolverFactory.TYPE_PRODUCT} for _ in range(3)],
+            **config
+        })
+
+    def test_ab_sha1_assignments_unchanged(self):
+        experiment = self.ab_experiment()
+        user_ids = [str(i) for i in range(1000)]
+
+        expected = []
+        for user_id in user_ids:
+            hash_str = f'experiments.test-feature.test-ab-experiment.{user_id}'.encode('ascii')
+            expected.append(int(hashlib.sha1(hash_str).hexdigest()[:15], 16) % 3)
+
+        self.assertEqual([experiment.calculate_variation_index(user_id) for user_id in user_ids], expected)
+        self.assertEqual(experiment.calculate_variation_indexes(user_ids).tolist(), expected)
+
     def test_interleaved_balanced(self):
         exp_config = {
             'id': uuid.uuid4().hex,
@@ -102,6 +129,68 @@ class TestExperiments(unittest.TestCase):
 
         self.assertEqual(len(results), 5)
 
+    def test_interleaved_deduplicates(self):
+        for method in (InterleavingExperiment.METHOD_BALANCED, InterleavingExperiment.METHOD_TEAM_DRAFT):
+            experiment = InterleavingExperiment('ExperimentStrategy', **{
+                'id': uuid.uuid4().hex,
+                'feature': 'test-feature',
+                'name': 'test-interleaved-experiment',
+                'type': 'interleaving',
+                'status': 'ACTIVE',
+                'method': method,
+                'variations': [{'type': ResolverFactory.TYPE_PRODUCT} for _ in range(3)]
+            })
+
+            # Every list contains the same items in a different order
+            list_of_item_lists = [[{'itemId': str((i * offset) % 30)} for i in range(30)] for offset in (1, 7, 11)]
+            interleave = experiment._interleave_team_draft if method == InterleavingExperiment.METHOD_TEAM_DRAFT else experiment._interleave_balanced
+
+            results = interleave('12', list_of_item_lists, 25, [0, 2, 3])
+
+            item_ids = [item['itemId'] for item in results]
+            self.assertEqual(len(item_ids), 25)
+            self.assertEqual(len(set(item_ids)), 25)
+            self.assertEqual([item['experiment']['resultRank'] for item in results], list(range(1, 26)))
+            self.assertTrue(set(item['experiment']['variationIndex'] for item in results) <= {0, 2, 3})
+
+    @patch('experimentation.experiment.variation_counters')
+    def test_interleaved_slow_variation(self, variation_counters):
+        exp_config = {
+            'id': uuid.uuid4().hex,
+            'feature': 'test-feature',
+            'name': 'test-interleaved-experiment',
+            'type': 'interleaving',
+            'status': 'ACTIVE',
+            'method': InterleavingExperiment.METHOD_BALANCED,
+            'variation_timeout': 0.2,
+            'variations': [{
+                'type': ResolverFactory.TYPE_PRODUCT,
+                'products_service_host': '10.10.10.10'
+            },{
+                'type': ResolverFactory.TYPE_PRODUCT,
+                'products_service_host': '10.10.10.11'
+            }]
+        }
+
+        experiment = InterleavingExperiment('ExperimentStrategy', **exp_config)
+
+        def slow_items(**kwargs):
+            time.sleep(1)
+            return [ {'itemId':'a'}, {'itemId':'b'} ]
+
+        # Resolvers are shared through ResolverFactory's pool, so replace them rather than patching them.
+        experiment.variations[0].resolver = MagicMock(get_items = slow_items)
+        experiment.variations[1].resolver = MagicMock(get_items = lambda **kwargs: [ {'itemId':'c'}, {'itemId':'d'}, {'itemId':'e'} ])
+
+        started = time.monotonic()
+        results = experiment.get_items('12', num_results = 3)
+        self.assertLess(time.monotonic() - started, 0.9)
+
+        # Only the variation that responded in time contributes and is counted as exposed
+        self.assertEqual([item['itemId'] for item in results], ['c', 'd', 'e'])
+        self.assertTrue(all(item['experiment']['variationIndex'] == 1 for item in results))
+        variation_counters.increment.assert_called_once_with('ExperimentStrategy', exp_config['id'], 1, 'exposures', 1)
+
     def test_evidently(self):
         feature = 'home_product_recs'
         eval_feature = {
@@ -0,0 +1,81 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+import uuid
+
+from unittest.mock import MagicMock, patch
+from experimentation.experiment_manager import ExperimentManager
+from experimentation.resolvers import ResolverFactory
+
+"""
+python -m unittest experimentation/test_experiment_manager.py
+"""
+
+class TestExperimentManager(unittest.TestCase):
+
+    def setUp(self):
+        self.exp_config = {
+            'id': uuid.uuid4().hex,
+            'feature': 'home_product_recs',
+            'name': 'test-ab-experiment',
+            'type': 'ab',
+            'status': 'ACTIVE',
+            'variations': [{
+                'type': ResolverFactory.TYPE_PERSONALIZE_RECOMMENDATIONS,
+                'inference_arn': 'arn:aws:personalize:us-east-1:123456789:campaign/some_name',
+                'exposures': 1
+            },{
+                'type': ResolverFactory.TYPE_PRODUCT,
+                'products_service_host': '10.10.10.10',
+                'exposures': 1
+            }]
+        }
+
+        self.table = MagicMock()
+        self.table.query.return_value = {'Count': 1, 'Items': [self.exp_config]}
+
+        patchers = [
+            patch.object(ExperimentManager, '_ExperimentManager__table_name', 'ExperimentStrategy'),
+            patch.object(ExperimentManager, '_ExperimentManager__table', self.table),
+            patch('experimentation.experiment_manager.EvidentlyFeatureResolver')
+        ]
+        for patcher in patchers:
+            mocked = patcher.start()
+            self.addCleanup(patcher.stop)
+        mocked.return_value.evaluate_feature.return_value = None
+
+        ExperimentManager.invalidate()
+        self.addCleanup(ExperimentManager.invalidate)
+
+    def test_active_experiment_is_cached(self):
+        experiment = ExperimentManager().get_active('home_product_recs', '1')
+        self.assertEqual(experiment.id, self.exp_config['id'])
+
+        self.assertIs(ExperimentManager().get_active('home_product_recs', '2'), experiment)
+        self.assertEqual(self.table.query.call_count, 1)
+
+    def test_no_active_experiment_is_cached(self):
+        self.table.query.return_value = {'Count': 0, 'Items': []}
+
+        self.assertIsNone(ExperimentManager().get_active('search_results', '1'))
+        self.assertIsNone(ExperimentManager().get_active('search_results', '1'))
+        self.assertEqual(self.table.query.call_count, 1)
+
+    def test_experiment_reused_when_only_counters_change(self):
+        experiment = ExperimentManager().get_active('home_product_recs', '1')
+
+        self.exp_config['variations'][0]['exposures'] = 10
+        ExperimentManager.invalidate('home_product_recs')
+
+        refreshed = ExperimentManager().get_active('home_product_recs', '1')
+        self.assertIs(refreshed, experiment)
+        self.assertEqual(refreshed.variations[0].config['exposures'], 10)
+        self.assertEqual(self.table.query.call_count, 2)
+
+        self.exp_config['name'] = 'renamed-experiment'
+        ExperimentManager.invalidate('home_product_recs')
+        self.assertIsNot(ExperimentManager().get_active('home_product_recs', '1'), experiment)
+
+if __name__ == '__main__':
+    unittest.main()
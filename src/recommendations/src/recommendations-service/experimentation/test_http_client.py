@@ -0,0 +1,45 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+
+from unittest.mock import patch
+from experimentation import http_client
+from experimentation.deadline import Deadline, DeadlineExceeded
+
+"""
+python -m unittest experimentation/test_http_client.py
+"""
+
+class TestHttpClient(unittest.TestCase):
+
+    def test_shared_session(self):
+        self.assertIs(http_client.get_session(), http_client.get_session())
+
+    def test_pooling_and_retries(self):
+        session = http_client.create_session(pool_connections = 3, pool_maxsize = 7, max_retries = 4)
+        adapter = session.get_adapter('http://products.retaildemostore.local/products/id/1')
+        self.assertEqual(adapter._pool_connections, 3)
+        self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertEqual(adapter.max_retries.total, 4)
+
+    def test_default_timeout(self):
+        with patch.object(http_client.get_session(), 'get') as mocked_get:
+            http_client.get('http://server.com/path')
+            mocked_get.assert_called_with('http://server.com/path', timeout = (http_client.CONNECT_TIMEOUT, http_client.READ_TIMEOUT))
+
+            http_client.get('http://server.com/path', timeout = 10)
+            mocked_get.assert_called_with('http://server.com/path', timeout = 10)
+
+    def test_deadline_limits_timeout(self):
+        with patch.object(http_client.get_session(), 'get') as mocked_get:
+            http_client.get('http://server.com/path', deadline = Deadline(0.5))
+            connect_timeout, read_timeout = mocked_get.call_args.kwargs['timeout']
+            self.assertLessEqual(connect_timeout, min(0.5, http_client.CONNECT_TIMEOUT))
+            self.assertLessEqual(read_timeout, 0.5)
+
+            with self.assertRaises(DeadlineExceeded):
+                http_client.get('http://server.com/path', deadline = Deadline(0))
+
+if __name__ == '__main__':
+    unittest.main()
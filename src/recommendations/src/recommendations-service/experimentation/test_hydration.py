@@ -0,0 +1,58 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+
+from experimentation import hydration
+
+"""
+python -m unittest experimentation/test_hydration.py
+"""
+
+class TestHydration(unittest.TestCase):
+
+    def test_tag_url(self):
+        self.assertEqual(hydration.tag_url('/product/1', 'abc'), '/product/1?exp=abc')
+        self.assertEqual(hydration.tag_url('/product/1?a=b', 'abc'), '/product/1?a=b&exp=abc')
+
+    def test_index_items(self):
+        items = [{'itemId': '1'}, {'id': '2'}, {'product': {'id': '3'}}]
+        item_map, item_ids = hydration.index_items(items)
+        self.assertEqual(item_ids, ['1', '2', '3'])
+        self.assertIs(item_map['3'], items[2])
+
+    def test_hydrate_items(self):
+        product = {'id': '2', 'url': '/product/2'}
+        products = [{'id': '1', 'url': '/product/1'}, product]
+        items = [
+            {'itemId': '2', 'experiment': {'correlationId': 'abc'}},
+            {'itemId': '1'},
+            {'itemId': '3'}
+        ]
+
+        hydrated = hydration.hydrate_items(items, products)
+
+        self.assertEqual([item.get('product') for item in hydrated], [
+            {'id': '2', 'url': '/product/2?exp=abc'},
+            {'id': '1', 'url': '/product/1'},
+            None
+        ])
+        self.assertTrue(all('itemId' not in item for item in hydrated))
+        # Products passed in are left untouched.
+        self.assertEqual(product['url'], '/product/2')
+
+    def test_merge_ranked_items(self):
+        items = [{'itemId': '1', 'url': '/product/1'}, {'itemId': '2'}]
+        item_map, _ = hydration.index_items(items)
+        ranked = [{'itemId': '2'}, {'itemId': '1', 'experiment': {'correlationId': 'abc'}}]
+
+        merged = hydration.merge_ranked_items(ranked, item_map)
+
+        self.assertEqual(merged, [
+            {'itemId': '2'},
+            {'itemId': '1', 'url': '/product/1?exp=abc', 'experiment': {'correlationId': 'abc'}}
+        ])
+        self.assertIs(merged[1], items[0])
+
+if __name__ == '__main__':
+    unittest.main()
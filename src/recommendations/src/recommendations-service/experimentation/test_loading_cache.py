@@ -0,0 +1,84 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import threading
+import time
+import unittest
+
+from unittest.mock import MagicMock, patch
+from experimentation.loading_cache import LoadingCache
+
+"""
+python -m unittest experimentation/test_loading_cache.py
+"""
+
+def wait_for(condition):
+    for _ in range(100):
+        if condition():
+            return
+        time.sleep(0.01)
+
+class TestLoadingCache(unittest.TestCase):
+
+    def test_single_flight(self):
+        calls = []
+
+        def loader(key):
+            calls.append(key)
+            time.sleep(0.1)
+            return key.upper()
+
+        cache = LoadingCache(loader, ttl = 60)
+        results = []
+        threads = [threading.Thread(target = lambda: results.append(cache.get('a'))) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(calls, ['a'])
+        self.assertEqual(results, ['A'] * 10)
+
+    def test_stale_while_revalidate(self):
+        loader = MagicMock(side_effect = ['v1', 'v2'])
+        cache = LoadingCache(loader, ttl = 10)
+
+        with patch('experimentation.loading_cache.time.monotonic', return_value = 100):
+            self.assertEqual(cache.get('a'), 'v1')
+        with patch('experimentation.loading_cache.time.monotonic', return_value = 120):
+            # The stale value is served while it is refreshed in the background
+            self.assertEqual(cache.get('a'), 'v1')
+            wait_for(lambda: loader.call_count == 2 and not cache._entries['a'].refreshing)
+            self.assertEqual(cache.get('a'), 'v2')
+
+        self.assertEqual(cache.stats()['staleHits'], 1)
+
+    def test_negative_caching(self):
+        loader = MagicMock(side_effect = [Exception('ThrottlingException'), 'v1'])
+        cache = LoadingCache(loader, ttl = 10, negative_ttl = 30)
+
+        with patch('experimentation.loading_cache.time.monotonic', return_value = 100):
+            self.assertIsNone(cache.get('a'))
+        with patch('experimentation.loading_cache.time.monotonic', return_value = 120):
+            self.assertEqual(cache.get('a', 'default'), 'default')
+        self.assertEqual(loader.call_count, 1)
+
+        with patch('experimentation.loading_cache.time.monotonic', return_value = 131):
+            self.assertEqual(cache.get('a'), 'v1')
+        self.assertEqual(cache.stats()['failures'], 1)
+
+    def test_failed_refresh_keeps_value(self):
+        loader = MagicMock(side_effect = ['v1', Exception('ThrottlingException')])
+        cache = LoadingCache(loader, ttl = 10, negative_ttl = 30)
+
+        with patch('experimentation.loading_cache.time.monotonic', return_value = 100):
+            cache.get('a')
+        with patch('experimentation.loading_cache.time.monotonic', return_value = 120):
+            self.assertEqual(cache.get('a'), 'v1')
+            wait_for(lambda: loader.call_count == 2 and not cache._entries['a'].refreshing)
+            self.assertEqual(cache.get('a'), 'v1')
+        # No further refresh is attempted until the negative TTL has passed
+        self.assertEqual(loader.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+
+from experimentation import metrics
+
+"""
+python -m unittest experimentation/test_metrics.py
+"""
+
+class TestHistogram(unittest.TestCase):
+
+    def test_cumulative_buckets(self):
+        histogram = metrics.Histogram(buckets = (0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+
+        snapshot = histogram.snapshot()
+
+        self.assertEqual(snapshot['buckets'], [(0.1, 2), (1.0, 3)])
+        self.assertEqual(snapshot['count'], 4)
+        self.assertAlmostEqual(snapshot['sum'], 2.65)
+
+class TestTimed(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(metrics.registry.clear)
+
+    def test_decorator_and_request_timings(self):
+        @metrics.timed('lookup')
+        def lookup():
+            return 'value'
+
+        metrics.start_request()
+        self.assertEqual(lookup(), 'value')
+        with metrics.timed('lookup'):
+            pass
+
+        self.assertEqual(metrics.registry.histogram('lookup').snapshot()['count'], 2)
+        self.assertEqual(list(metrics.request_timings().keys()), ['lookup'])
+        self.assertRegex(metrics.server_timing(metrics.request_timings()), r'^lookup;dur=\d+\.\d\d$')
+
+    def test_render(self):
+        metrics.registry.observe('products', 0.003)
+
+        text = metrics.registry.render()
+
+        self.assertIn('# TYPE recommendations_stage_duration_seconds histogram', text)
+        self.assertIn('recommendations_stage_duration_seconds_bucket{stage="products",le="0.0025"} 0', text)
+        self.assertIn('recommendations_stage_duration_seconds_bucket{stage="products",le="0.005"} 1', text)
+        self.assertIn('recommendations_stage_duration_seconds_bucket{stage="products",le="+Inf"} 1', text)
+        self.assertIn('recommendations_stage_duration_seconds_count{stage="products"} 1', text)
+
+    def test_counters(self):
+        metrics.registry.increment('fallbacks', stage = 'recommendations', source = 'cached')
+        metrics.registry.increment('fallbacks', source = 'cached', stage = 'recommendations')
+
+        self.assertEqual(metrics.registry.counter('fallbacks', stage = 'recommendations', source = 'cached'), 2)
+        self.assertIn('# TYPE recommendations_fallbacks_total counter\n'
+                      'recommendations_fallbacks_total{source="cached",stage="recommendations"} 2', metrics.registry.render())
+
+    def test_render_cache_stats(self):
+        text = metrics.render_cache_stats({'products': {'size': 3, 'hits': 10, 'staleHits': 1, 'ttl': None}})
+
+        self.assertIn('# TYPE recommendations_cache_size gauge\nrecommendations_cache_size{cache="products"} 3', text)
+        self.assertIn('# TYPE recommendations_cache_hits_total counter\nrecommendations_cache_hits_total{cache="products"} 10', text)
+        self.assertIn('recommendations_cache_stale_hits_total{cache="products"} 1', text)
+        self.assertNotIn('ttl', text)
+
+    def test_render_buffer_stats(self):
+        text = metrics.render_buffer_stats({'kinesis:events': {'buffered': 4, 'sent': 10, 'dropped': 2}})
+
+        self.assertIn('# TYPE recommendations_buffer_buffered gauge\nrecommendations_buffer_buffered{buffer="kinesis:events"} 4', text)
+        self.assertIn('# TYPE recommendations_buffer_dropped_total counter\nrecommendations_buffer_dropped_total{buffer="kinesis:events"} 2', text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+
+from unittest.mock import MagicMock
+from experimentation.offers import OfferCatalog, OfferIndex
+
+"""
+python -m unittest experimentation/test_offers.py
+"""
+
+OFFERS = [
+    {'id': 1, 'codes': ['A'], 'preference': 1},
+    {'id': 2, 'codes': ['B'], 'preference': 3},
+    {'id': 3, 'codes': ['C'], 'preference': 2}
+]
+
+class TestOfferCatalog(unittest.TestCase):
+
+    def test_choose_adjusts_for_preference(self):
+        catalog = OfferCatalog(OFFERS, 1)
+        recommendations = [{'itemId': '1', 'score': 0.5}, {'itemId': '2', 'score': 0.2}, {'itemId': '3', 'score': 0.3}]
+
+        offer_id, score, adjusted_score = catalog.choose(recommendations)
+
+        # Adjusted scores are 0.5, 0.6, and 0.6 before normalizing; ties go to the first recommended
+        self.assertEqual(offer_id, '2')
+        self.assertEqual(score, 0.2)
+        self.assertAlmostEqual(adjusted_score, 0.6 / 1.7)
+
+    def test_choose_ignores_unknown_offers(self):
+        catalog = OfferCatalog(OFFERS, 1)
+
+        self.assertEqual(catalog.choose([{'itemId': '9', 'score': 0.9}, {'itemId': '3', 'score': 0.1}])[0], '3')
+        self.assertIsNone(catalog.choose([{'itemId': '9', 'score': 0.9}])[0])
+
+    def test_get_returns_copy(self):
+        catalog = OfferCatalog(OFFERS, 1)
+        catalog.get(1)['score'] = 0.5
+        self.assertNotIn('score', catalog.get('1'))
+
+class TestOfferIndex(unittest.TestCase):
+
+    def test_versioned_refresh(self):
+        loader = MagicMock(return_value = OFFERS)
+        index = OfferIndex(loader, refresh_interval = 3600)
+        self.addCleanup(index.stop)
+
+        catalog = index.get()
+        self.assertEqual(catalog.version, 1)
+        self.assertEqual(catalog.offer_ids, ['1', '2', '3'])
+
+        # Unchanged offers keep the same snapshot
+        index.refresh()
+        self.assertIs(index.get(), catalog)
+
+        loader.return_value = OFFERS[:2]
+        index.refresh()
+        self.assertEqual(index.get().version, 2)
+        self.assertEqual(len(index.get()), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+
+from unittest.mock import MagicMock
+from experimentation.parameter_store import ParameterSnapshot
+
+"""
+python -m unittest experimentation/test_parameter_store.py
+"""
+
+class TestParameterSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.get_paginator.return_value.paginate.return_value = [
+            {'Parameters': [
+                {'Name': '/retaildemostore/personalize/recommended-for-you-arn', 'Value': 'arn:aws:personalize:us-east-1:123456789:recommender/some_name'},
+                {'Name': '/retaildemostore/personalize/filters/filter-purchased-arn', 'Value': 'NONE'}
+            ]}
+        ]
+        self.client.get_parameters.return_value = {
+            'Parameters': [{'Name': 'retaildemostore-kinesis-event-stream-name', 'Value': 'stream'}]
+        }
+        self.snapshot = ParameterSnapshot(refresh_interval = 3600, client = self.client)
+
+    def tearDown(self):
+        self.snapshot.stop()
+
+    def test_values_from_snapshot(self):
+        values = self.snapshot.get_values([
+            '/retaildemostore/personalize/recommended-for-you-arn',
+            '/retaildemostore/personalize/filters/filter-purchased-arn',
+            '/retaildemostore/personalize/does-not-exist'
+        ])
+        self.assertEqual(values, ['arn:aws:personalize:us-east-1:123456789:recommender/some_name', None, None])
+
+        self.snapshot.get_values('/retaildemostore/personalize/recommended-for-you-arn')
+        self.assertEqual(self.client.get_paginator.return_value.paginate.call_count, 1)
+        self.client.get_parameters.assert_not_called()
+
+    def test_get_all(self):
+        self.assertEqual(self.snapshot.get_all(), {
+            '/retaildemostore/personalize/recommended-for-you-arn': 'arn:aws:personalize:us-east-1:123456789:recommender/some_name',
+            '/retaildemostore/personalize/filters/filter-purchased-arn': 'NONE'
+        })
+
+    def test_parameter_outside_path(self):
+        self.assertEqual(self.snapshot.get('retaildemostore-kinesis-event-stream-name'), 'stream')
+        self.assertEqual(self.snapshot.get('retaildemostore-kinesis-event-stream-name'), 'stream')
+        self.assertEqual(self.client.get_parameters.call_count, 1)
+
+        # Parameters outside the path are refreshed along with the rest of the snapshot.
+        self.snapshot.refresh()
+        self.assertEqual(self.client.get_parameters.call_count, 2)
+        self.assertEqual(self.snapshot.get('retaildemostore-kinesis-event-stream-name'), 'stream')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+
+from unittest.mock import patch
+from experimentation.rate_limiter import TokenBucket
+
+"""
+python -m unittest experimentation/test_rate_limiter.py
+"""
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        with patch('experimentation.rate_limiter.time.monotonic', return_value = 100):
+            bucket = TokenBucket(rate = 10, capacity = 3)
+            for _ in range(3):
+                self.assertTrue(bucket.acquire(timeout = 0))
+            self.assertFalse(bucket.acquire(timeout = 0))
+
+        # One token is added every 0.1 seconds
+        with patch('experimentation.rate_limiter.time.monotonic', return_value = 100.25):
+            self.assertTrue(bucket.acquire(timeout = 0))
+            self.assertTrue(bucket.acquire(timeout = 0))
+            self.assertFalse(bucket.acquire(timeout = 0))
+
+    def test_waits_for_tokens(self):
+        bucket = TokenBucket(rate = 100, capacity = 1)
+        self.assertTrue(bucket.acquire())
+        self.assertTrue(bucket.acquire(timeout = 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,7 @@ import logging
 
 from unittest.mock import patch
 from experimentation.resolvers import (ResolverFactory, HttpResolver, DefaultProductResolver, PersonalizeRecommendationsResolver,
-    SearchSimilarProductsResolver, PersonalizeRankingResolver, RankingProductsNoOpResolver)
+    SearchSimilarProductsResolver, PersonalizeRankingResolver, RankingProductsNoOpResolver, PersonalizeContextComparePickResolver)
 
 """
 python -m unittest experimentation/test_resolvers.py
@@ -37,8 +37,23 @@ class TestResolvers(unittest.TestCase):
         with self.assertRaises(ValueError):
             ResolverFactory.get('bogus')
 
+    def test_factory_pools_resolvers(self):
+        ResolverFactory.clear()
+        hits = ResolverFactory.pool_stats()['hits']
+        arn = 'arn:aws:personalize:us-east-1:123456789:campaign/some_name'
+
+        resolver = ResolverFactory.get(ResolverFactory.TYPE_PERSONALIZE_RANKING, inference_arn = arn, exposures = 10, conversions = 1)
+        # Variation counters are not part of the resolver's configuration.
+        self.assertIs(ResolverFactory.get(ResolverFactory.TYPE_PERSONALIZE_RANKING, inference_arn = arn, exposures = 20, conversions = 2), resolver)
+        self.assertIsNot(ResolverFactory.get(ResolverFactory.TYPE_PERSONALIZE_RANKING, inference_arn = arn, filter_arn = 'arn:filter'), resolver)
+        self.assertIsNot(ResolverFactory.get(ResolverFactory.TYPE_PERSONALIZE_RANKING, inference_arn = arn, context = {'Discount': 'Yes'}), resolver)
+
+        stats = ResolverFactory.pool_stats()
+        self.assertEqual(stats['size'], 3)
+        self.assertEqual(stats['hits'] - hits, 1)
+
     def test_http_resolver(self):
-        with patch('experimentation.resolvers.requests.get') as mocked_get:
+        with patch('experimentation.resolvers.http_client.get') as mocked_get:
             mocked_get.return_value.ok = True
             mocked_get.return_value.json.return_value = [{'id':'1'},{'id':'2'},{'id':'3'},{'id':'4'} ]
 
@@ -50,10 +65,10 @@ class TestResolvers(unittest.TestCase):
             self.assertEqual(items[2]['itemId'], '3')
             self.assertEqual(items[3]['itemId'], '4')
 
-            mocked_get.assert_called_with('http://server.com/path?userId=1&numResults=10')
+            mocked_get.assert_called_with('http://server.com/path?userId=1&numResults=10', deadline=None)
 
     def test_product_resolver(self):
-        with patch('experimentation.resolvers.requests.get') as mocked_get:
+        with patch('experimentation.resolvers.http_client.get') as mocked_get:
             mocked_get.return_value.ok = True
             mocked_get.return_value.json.return_value = [{'id':'1'},{'id':'2'},{'id':'3'},{'id':'4'} ]
 
@@ -62,7 +77,7 @@ class TestResolvers(unittest.TestCase):
             self.assertEqual(len(items), 4)
 
     def test_similar_resolver(self):
-        with patch('experimentation.resolvers.requests.get') as mocked_get:
+        with patch('experimentation.resolvers.http_client.get') as mocked_get:
             mocked_get.return_value.ok = True
             mocked_get.return_value.json.return_value = [{'itemId':'1'},{'itemId':'2'},{'itemId':'3'},{'itemId':'4'} ]
 
@@ -74,7 +89,7 @@ class TestResolvers(unittest.TestCase):
             self.assertEqual(items[2]['itemId'], '3')
             self.assertEqual(items[3]['itemId'], '4')
 
-            mocked_get.assert_called_with('http://10.10.10.10:8000/similar/products?productId=100')
+            mocked_get.assert_called_with('http://10.10.10.10:8000/similar/products?productId=100', deadline=None)
 
     def test_personalize_recommendations_resolver(self):
         orig = botocore.client.BaseClient._make_api_call
@@ -111,6 +126,29 @@ class TestResolvers(unittest.TestCase):
             self.assertEqual(ranked_items[2]['itemId'], '2')
             self.assertEqual(ranked_items[3]['itemId'], '1')
 
+    def test_context_compare_pick_resolver(self):
+        orig = botocore.client.BaseClient._make_api_call
+        contexts = []
+
+        def mock_make_api_call(self, operation_name, kwarg):
+            if operation_name == 'GetPersonalizedRanking':
+                contexts.append(kwarg.get('context'))
+                if kwarg.get('context'):
+                    ranking = [{'itemId': '1', 'score': 0.4}, {'itemId': '2', 'score': 0.3}, {'itemId': '3', 'score': 0.2}, {'itemId': '4', 'score': 0.1}]
+                else:
+                    ranking = [{'itemId': '4', 'score': 0.4}, {'itemId': '1', 'score': 0.3}, {'itemId': '2', 'score': 0.2}, {'itemId': '3', 'score': 0.1}]
+                return {'personalizedRanking': ranking}
+            return orig(self, operation_name, kwarg)
+
+        with patch('botocore.client.BaseClient._make_api_call', new=mock_make_api_call):
+            resolver = PersonalizeContextComparePickResolver(inference_arn = 'arn:aws:personalize:us-east-1:123456789:campaign/some_name',
+                                                             with_context = {'Discount': 'Yes'}, without_context = {})
+            picked = resolver.get_items(user_id = '12', product_list = [ '1', '2', '3', '4' ], num_results = 2)
+
+            # Ratios of score with to without discount are 1: 1.29, 2: 1.43, 3: 1.82, 4: 0.24
+            self.assertEqual([item['itemId'] for item in picked], ['4', '1'])
+            self.assertCountEqual(contexts, [{'Discount': 'Yes'}, {}])
+
     def test_ranking_noop_resolver(self):
         resolver = ResolverFactory.get(ResolverFactory.TYPE_RANKING_NO_OP)
         unranked_items = [ '1', '2', '3', '4' ]
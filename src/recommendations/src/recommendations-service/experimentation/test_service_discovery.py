@@ -0,0 +1,64 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+import requests
+
+from unittest.mock import MagicMock, patch
+from experimentation.service_discovery import ServiceDiscoveryCache
+
+"""
+python -m unittest experimentation/test_service_discovery.py
+"""
+
+def discover_response(*hosts):
+    return {'Instances': [{'Attributes': {'AWS_INSTANCE_IPV4': host}} for host in hosts]}
+
+class TestServiceDiscoveryCache(unittest.TestCase):
+
+    def test_round_robin(self):
+        client = MagicMock()
+        client.discover_instances.return_value = discover_response('10.0.0.1', '10.0.0.2')
+
+        cache = ServiceDiscoveryCache(ttl = 60, client = client)
+        hosts = [cache.get_instance('products') for _ in range(4)]
+
+        self.assertEqual(hosts, ['10.0.0.1', '10.0.0.2', '10.0.0.1', '10.0.0.2'])
+        self.assertEqual(client.discover_instances.call_count, 1)
+
+    def test_evict_on_connection_error(self):
+        client = MagicMock()
+        client.discover_instances.return_value = discover_response('10.0.0.1', '10.0.0.2')
+
+        cache = ServiceDiscoveryCache(ttl = 60, client = client)
+        cache.get_instance('products')
+        with self.assertRaises(requests.ConnectionError):
+            with cache.evict_on_connection_error('products', '10.0.0.1'):
+                raise requests.ConnectionError()
+
+        self.assertEqual({cache.get_instance('products') for _ in range(4)}, {'10.0.0.2'})
+
+        # Once all instances are evicted, instances are discovered again.
+        cache.evict('products', '10.0.0.2')
+        self.assertIn(cache.get_instance('products'), ['10.0.0.1', '10.0.0.2'])
+        self.assertEqual(client.discover_instances.call_count, 2)
+
+    def test_background_refresh(self):
+        client = MagicMock()
+        client.discover_instances.return_value = discover_response('10.0.0.1')
+
+        cache = ServiceDiscoveryCache(ttl = 10, max_staleness = 100, client = client)
+        with patch('experimentation.service_discovery.time.monotonic', return_value = 1000):
+            self.assertEqual(cache.get_instance('search'), '10.0.0.1')
+
+        client.discover_instances.return_value = discover_response('10.0.0.3')
+        with patch('experimentation.service_discovery.threading.Thread') as mocked_thread:
+            with patch('experimentation.service_discovery.time.monotonic', return_value = 1020):
+                # Stale instance is served while the refresh is kicked off in the background.
+                self.assertEqual(cache.get_instance('search'), '10.0.0.1')
+            mocked_thread.call_args.kwargs['target']()
+
+        self.assertEqual(cache.get_instance('search'), '10.0.0.3')
+
+if __name__ == '__main__':
+    unittest.main()
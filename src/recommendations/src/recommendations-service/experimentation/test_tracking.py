@@ -0,0 +1,123 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import unittest
+
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import ClientError, ReadTimeoutError
+from experimentation import buffered_sender, tracking
+from experimentation.tracking import KinesisRecordBuffer
+
+"""
+python -m unittest experimentation/test_tracking.py
+"""
+
+def event(user_id, size = 0):
+    return {'attributes': {'user_id': user_id, 'experiment': {'name': 'exp'}}, 'padding': 'x' * size}
+
+class TestKinesisRecordBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.put_records.side_effect = lambda StreamName, Records: {'FailedRecordCount': 0, 'Records': [{} for _ in Records]}
+        self.buffer = KinesisRecordBuffer('stream', buffer_size = 2000, flush_interval = 3600, block_timeout = 0, max_retries = 2, client = self.client)
+        self.addCleanup(self.buffer._worker.stop)
+
+    def test_batches_records(self):
+        self.buffer._worker = MagicMock()
+        for i in range(1200):
+            self.buffer.put(event(str(i)), f'exp{i}')
+        self.client.put_records.assert_not_called()
+        # A full batch wakes the worker rather than waiting for the interval.
+        self.buffer._worker.wakeup.assert_called()
+
+        self.buffer.flush()
+
+        batch_sizes = [len(call.kwargs['Records']) for call in self.client.put_records.call_args_list]
+        self.assertEqual(batch_sizes, [500, 500, 200])
+        first = self.client.put_records.call_args_list[0].kwargs['Records'][0]
+        self.assertEqual(first['PartitionKey'], 'exp0')
+        self.assertEqual(json.loads(first['Data'])['attributes']['user_id'], '0')
+        self.assertEqual(self.buffer.stats()['sent'], 1200)
+
+    def test_batches_split_by_size(self):
+        for i in range(12):
+            self.buffer.put(event(str(i), 900 * 1024), 'key')
+
+        self.buffer.flush()
+
+        batch_sizes = [len(call.kwargs['Records']) for call in self.client.put_records.call_args_list]
+        self.assertEqual(batch_sizes, [5, 5, 2])
+
+    def test_oversized_record_dropped(self):
+        self.buffer.put(event('1', 2 * 1024 * 1024), 'key')
+        self.buffer.put(event('2'), 'key')
+
+        self.buffer.flush()
+
+        records = self.client.put_records.call_args.kwargs['Records']
+        self.assertEqual(len(records), 1)
+        self.assertEqual(self.buffer.stats()['dropped'], 1)
+
+    @patch.object(buffered_sender, 'RETRY_BACKOFF', 0)
+    def test_only_failed_records_retried(self):
+        self.client.put_records.side_effect = [
+            {'FailedRecordCount': 1, 'Records': [{}, {'ErrorCode': 'ProvisionedThroughputExceededException'}, {}]},
+            {'FailedRecordCount': 0, 'Records': [{}]}
+        ]
+        for i in range(3):
+            self.buffer.put(event(str(i)), f'key{i}')
+
+        self.buffer.flush()
+
+        retried = self.client.put_records.call_args_list[1].kwargs['Records']
+        self.assertEqual([r['PartitionKey'] for r in retried], ['key1'])
+        self.assertEqual(self.buffer.stats()['sent'], 3)
+        self.assertEqual(self.buffer.stats()['failed'], 0)
+
+    @patch.object(buffered_sender, 'RETRY_BACKOFF', 0)
+    def test_gives_up_after_retries(self):
+        self.client.put_records.side_effect = ClientError({'Error': {'Code': 'InternalFailure'}}, 'PutRecords')
+        self.buffer.put(event('1'), 'key')
+
+        self.buffer.flush()
+
+        self.assertEqual(self.client.put_records.call_count, 3)
+        self.assertEqual(self.buffer.stats()['failed'], 1)
+        self.assertEqual(self.buffer.stats()['buffered'], 0)
+
+    @patch.object(buffered_sender, 'RETRY_BACKOFF', 0)
+    def test_connection_errors_retried_and_counted(self):
+        self.client.put_records.side_effect = ReadTimeoutError(endpoint_url = 'https://kinesis')
+        self.buffer.put(event('1'), 'key')
+
+        self.buffer.flush()
+
+        self.assertEqual(self.client.put_records.call_count, 3)
+        self.assertEqual(self.buffer.stats()['failed'], 1)
+
+    def test_full_buffer_drops(self):
+        buffer = KinesisRecordBuffer('stream', buffer_size = 2, flush_interval = 3600, block_timeout = 0, client = self.client)
+        self.addCleanup(buffer._worker.stop)
+        for i in range(3):
+            buffer.put(event(str(i)), 'key')
+
+        self.assertEqual(buffer.stats()['buffered'], 2)
+        self.assertEqual(buffer.stats()['dropped'], 1)
+
+class TestBufferedKinesisTracker(unittest.TestCase):
+
+    def test_shares_buffer_per_stream(self):
+        with patch.dict(tracking._record_buffers, clear = True):
+            record_buffer = MagicMock()
+            tracking._record_buffers['stream'] = record_buffer
+
+            tracking.BufferedKinesisTracker('stream', 'stream').log_exposure(event('7'))
+            tracking.BufferedKinesisTracker('stream', 'stream').log_outcome(event('8'))
+
+            self.assertEqual(record_buffer.put.call_count, 2)
+            record_buffer.put.assert_any_call(event('7'), 'exp7')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,37 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
+import atexit
 import json
+import os
+import threading
+import logging
 import boto3
 
 from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Tuple
+from experimentation import metrics
+from experimentation.aws_clients import client_config
+from experimentation.buffered_sender import BufferedSender
 from experimentation.utils import CompatEncoder
 
-kinesis = boto3.client('kinesis')
+log = logging.getLogger(__name__)
+
+kinesis = boto3.client('kinesis', config = client_config())
+
+# Limits of the Kinesis PutRecords API.
+PUT_RECORDS_MAX_RECORDS = 500
+PUT_RECORDS_MAX_BYTES = 5 * 1024 * 1024
+RECORD_MAX_BYTES = 1024 * 1024
+
+# Maximum number of events held in memory per stream before new events are dropped.
+BUFFER_SIZE = int(os.environ.get('KINESIS_TRACKER_BUFFER_SIZE', 10000))
+# Seconds between writes of buffered events.
+FLUSH_INTERVAL = float(os.environ.get('KINESIS_TRACKER_FLUSH_INTERVAL', 1))
+# Seconds a request will wait for space when the buffer is full before the event is dropped (0 to drop immediately).
+BLOCK_TIMEOUT = float(os.environ.get('KINESIS_TRACKER_BLOCK_TIMEOUT', 0))
+# Number of times records that Kinesis failed to write are retried.
+MAX_RETRIES = int(os.environ.get('KINESIS_TRACKER_MAX_RETRIES', 3))
 
 class Tracker(ABC):
     """ Base class for tracking detailed exposure and outcome/conversion events """
@@ -34,6 +58,7 @@ class KinesisTracker(Tracker):
         self.exposure_stream_name = exposure_stream_name
         self.outcome_stream_name = outcome_stream_name
 
+    @metrics.timed('tracker')
     def log_exposure(self, event):
         user_id = event['attributes']['user_id']
         experiment_name = event['attributes']['experiment']['name']
@@ -44,6 +69,7 @@ class KinesisTracker(Tracker):
             PartitionKey=f'{experiment_name}{user_id}'
         )
 
+    @metrics.timed('tracker')
     def log_outcome(self, event):
         user_id = event['attributes']['user_id']
         experiment_name = event['attributes']['experiment']['name']
@@ -53,3 +79,103 @@ class KinesisTracker(Tracker):
             Data=json.dumps(event, cls=CompatEncoder),
             PartitionKey=f'{experiment_name}{user_id}'
         )
+
+class KinesisRecordBuffer(BufferedSender):
+    """ Buffers records for a Kinesis stream and writes them with PutRecords from a background worker
+
+    Records are written in batches of up to 500 records or 5 MB. Records larger than
+    the Kinesis record limit are dropped.
+    """
+    entry_name = 'records'
+    destination_name = 'Kinesis stream'
+
+    def __init__(self, stream_name: str, buffer_size: int = BUFFER_SIZE, flush_interval: float = FLUSH_INTERVAL,
+                 block_timeout: float = BLOCK_TIMEOUT, max_retries: int = MAX_RETRIES, client = None):
+        super().__init__(f'kinesis-tracker-{stream_name}', buffer_size, flush_interval, max_retries,
+                         batch_size = PUT_RECORDS_MAX_RECORDS, block_timeout = block_timeout)
+        self.stream_name = stream_name
+        self._client = client if client else kinesis
+
+    def put(self, event: Dict, partition_key: str):
+        """ Queues an event to be written to the stream; serialization happens on the background worker """
+        self._put((event, partition_key))
+
+    def _batches(self) -> Iterator[Tuple[str, List[Dict]]]:
+        records = []
+        batch_bytes = 0
+        for event, partition_key in self._drain():
+            record = {
+                'Data': json.dumps(event, cls=CompatEncoder).encode('utf-8'),
+                'PartitionKey': partition_key
+            }
+
+            record_bytes = len(record['Data']) + len(record['PartitionKey'].encode('utf-8'))
+            if record_bytes > RECORD_MAX_BYTES:
+                self._count('dropped', 1)
+                log.warning('Dropped event of %s bytes which exceeds the Kinesis record limit', record_bytes)
+                continue
+            if len(records) == PUT_RECORDS_MAX_RECORDS or batch_bytes + record_bytes > PUT_RECORDS_MAX_BYTES:
+                yield self.stream_name, records
+                records = []
+                batch_bytes = 0
+
+            records.append(record)
+            batch_bytes += record_bytes
+
+        if records:
+            yield self.stream_name, records
+
+    def _send_batch(self, stream_name: str, records: List[Dict]) -> List[Dict]:
+        response = self._client.put_records(StreamName = stream_name, Records = records)
+        if response.get('FailedRecordCount', 0) == 0:
+            return []
+        return [record for record, result in zip(records, response['Records']) if result.get('ErrorCode')]
+
+_record_buffers: Dict[str, KinesisRecordBuffer] = {}
+_record_buffers_lock = threading.Lock()
+
+def get_record_buffer(stream_name: str) -> KinesisRecordBuffer:
+    """ Returns the record buffer shared by all trackers writing to a stream """
+    record_buffer = _record_buffers.get(stream_name)
+    if record_buffer is None:
+        with _record_buffers_lock:
+            record_buffer = _record_buffers.get(stream_name)
+            if record_buffer is None:
+                record_buffer = _record_buffers[stream_name] = KinesisRecordBuffer(stream_name)
+    return record_buffer
+
+def record_buffer_stats() -> Dict[str, Dict]:
+    """ Returns the statistics of the record buffer of each stream """
+    return {stream_name: record_buffer.stats() for stream_name, record_buffer in list(_record_buffers.items())}
+
+def flush_record_buffers():
+    """ Writes all buffered records for all streams """
+    for record_buffer in list(_record_buffers.values()):
+        record_buffer.stop()
+
+# Write buffered events on a clean shutdown.
+atexit.register(flush_record_buffers)
+
+class BufferedKinesisTracker(Tracker):
+    """ Tracker that buffers exposure and outcome events in memory and writes them to Kinesis streams in batches
+
+    Logging an event only queues it, so it adds microseconds to a request rather than
+    a network round trip. Events are written by a background worker using PutRecords.
+    """
+    def __init__(self, exposure_stream_name, outcome_stream_name):
+        self.exposure_stream_name = exposure_stream_name
+        self.outcome_stream_name = outcome_stream_name
+
+    @metrics.timed('tracker')
+    def log_exposure(self, event):
+        user_id = event['attributes']['user_id']
+        experiment_name = event['attributes']['experiment']['name']
+
+        get_record_buffer(self.exposure_stream_name).put(event, f'{experiment_name}{user_id}')
+
+    @metrics.timed('tracker')
+    def log_outcome(self, event):
+        user_id = event['attributes']['user_id']
+        experiment_name = event['attributes']['experiment']['name']
+
+        get_record_buffer(self.outcome_stream_name).put(event, f'{experiment_name}{user_id}')
@@ -0,0 +1,81 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import logging
+import time
+import unittest
+
+import access_log
+
+"""
+python -m unittest test_access_log.py
+"""
+
+class CapturingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+def make_app(status = '200 OK'):
+    def app(environ, start_response):
+        with access_log.upstream('products'):
+            time.sleep(0.01)
+        start_response(status, [('Content-Type', 'text/plain')])
+        return [b'ok']
+    return app
+
+def call(middleware, path = '/recommendations'):
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': 'userID=1'}
+    response = middleware(environ, lambda status, headers, *args: None)
+    body = b''.join(response)
+    response.close()
+    return body
+
+class TestAccessLogMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = CapturingHandler()
+        access_log.log.addHandler(self.handler)
+        self.addCleanup(access_log.log.removeHandler, self.handler)
+
+    def test_logs_structured_entry(self):
+        middleware = access_log.AccessLogMiddleware(make_app(), sample_rate = 1, sample_rates = {})
+
+        self.assertEqual(call(middleware), b'ok')
+
+        self.assertEqual(len(self.handler.messages), 1)
+        entry = json.loads(self.handler.messages[0])
+        self.assertEqual(entry['method'], 'GET')
+        self.assertEqual(entry['path'], '/recommendations')
+        self.assertEqual(entry['query'], 'userID=1')
+        self.assertEqual(entry['status'], 200)
+        self.assertGreaterEqual(entry['upstreamMs']['products'], 10)
+        self.assertGreaterEqual(entry['durationMs'], entry['upstreamMs']['products'])
+
+    def test_sample_rates_by_prefix(self):
+        middleware = access_log.AccessLogMiddleware(make_app(), sample_rate = 1,
+                                                    sample_rates = access_log.parse_sample_rates('/health=0, /recommendations=0'))
+
+        call(middleware, '/health')
+        call(middleware, '/recommendations/batch')
+        call(middleware, '/related')
+
+        self.assertEqual([json.loads(message)['path'] for message in self.handler.messages], ['/related'])
+
+    def test_server_errors_always_logged(self):
+        middleware = access_log.AccessLogMiddleware(make_app('500 INTERNAL SERVER ERROR'), sample_rate = 0, sample_rates = {})
+
+        call(middleware)
+
+        self.assertEqual(json.loads(self.handler.messages[0])['status'], 500)
+
+    def test_upstream_outside_request(self):
+        with access_log.upstream('products'):
+            pass
+
+if __name__ == '__main__':
+    unittest.main()
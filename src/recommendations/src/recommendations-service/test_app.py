@@ -0,0 +1,115 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import threading
+import time
+import unittest
+
+import requests
+
+from unittest.mock import MagicMock, patch
+
+import app as service
+
+from experimentation.cache import TTLCache
+from experimentation.rate_limiter import TokenBucket
+
+"""
+python -m unittest test_app.py
+"""
+
+RECOMMENDED_ITEMS = {
+    'first': ['p1', 'p2'],
+    'b': ['p2', 'p3'],
+    'c': ['p3', 'p4'],
+    'd': ['p1'],
+    'last': ['p4', 'p5']
+}
+
+def read_lines(response):
+    return [json.loads(line) for line in response.get_data(as_text = True).splitlines()]
+
+class TestBatchEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.client = service.app.test_client()
+        patch.object(service, 'batch_rate_limiter', TokenBucket(rate = 1000)).start()
+        patch.object(service, 'product_cache', TTLCache(max_size = 100, ttl = 60)).start()
+        patch.object(service, 'get_parameter_values', return_value = [None]).start()
+        self.addCleanup(patch.stopall)
+
+    def test_recommendations_batch(self):
+        # 'first' completes on its own. The next users complete while its products are looked
+        # up, so they form one wave, and 'last' completes while theirs are looked up.
+        middle_released = threading.Event()
+        last_released = threading.Event()
+
+        def get_products(user_id, **kwargs):
+            if user_id == 'last':
+                last_released.wait(5)
+            elif user_id != 'first':
+                middle_released.wait(5)
+            if user_id == 'bad':
+                raise requests.ConnectionError('Personalize unavailable')
+            return [{'itemId': item_id} for item_id in RECOMMENDED_ITEMS[user_id]], {}
+
+        lookups = []
+
+        def request_product_details(item_ids, fully_qualify_image_urls = False):
+            lookups.append(sorted(item_ids))
+            if len(lookups) == 1:
+                middle_released.set()
+            elif len(lookups) == 2:
+                last_released.set()
+            # Give the users released by this lookup time to complete.
+            time.sleep(0.2)
+            return [{'id': item_id} for item_id in item_ids]
+
+        with patch.object(service, 'get_products', side_effect = get_products), \
+                patch.object(service, 'request_product_details', side_effect = request_product_details):
+            response = self.client.post('/recommendations/batch', json = {'userIDs': ['last', 'b', 'first', 'bad', 'c', 'd']})
+            lines = read_lines(response)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_type, 'application/x-ndjson')
+        # Lines are written in completion order.
+        self.assertEqual(lines[0]['userID'], 'first')
+        self.assertEqual({line['userID'] for line in lines[1:5]}, {'b', 'c', 'd', 'bad'})
+        self.assertEqual(lines[5]['userID'], 'last')
+
+        by_user = {line['userID']: line for line in lines}
+        self.assertEqual(by_user['bad'], {'userID': 'bad', 'error': 'Personalize unavailable'})
+        self.assertEqual([item['product']['id'] for item in by_user['c']['items']], ['p3', 'p4'])
+        # One products service lookup per wave, for the products not looked up by earlier waves.
+        self.assertEqual(lookups, [['p1', 'p2'], ['p3', 'p4'], ['p5']])
+
+    def test_coupon_offer_batch(self):
+        released = threading.Event()
+
+        def choose_offer(user_id, inference_arn, catalog):
+            if user_id == 'slow':
+                released.wait(5)
+            if user_id == 'bad':
+                released.set()
+                raise LookupError('None of the recommended offers are in the offers catalog')
+            return {'id': f'offer-{user_id}'}
+
+        with patch.object(service, 'choose_offer', side_effect = choose_offer), \
+                patch.object(service, 'offer_index', MagicMock()):
+            response = self.client.post('/coupon_offer/batch', json = {'userIDs': ['slow', 'bad', 'slow']})
+            lines = read_lines(response)
+
+        # Completion order is covered by test_recommendations_batch; 'slow' may finish in the same wave as 'bad'.
+        self.assertCountEqual(lines, [
+            {'userID': 'bad', 'error': 'None of the recommended offers are in the offers catalog'},
+            {'userID': 'slow', 'offer': {'id': 'offer-slow'}}
+        ])
+
+    def test_batch_requires_users(self):
+        response = self.client.post('/recommendations/batch', json = {'userIDs': []})
+
+        self.assertEqual(response.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
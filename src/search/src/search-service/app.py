@@ -12,7 +12,7 @@ from opensearchpy import OpenSearch, NotFoundError
 
 import json
 import os
-import pprint
+import access_log
 
 patch_all()
 
@@ -30,23 +30,6 @@ search_client = OpenSearch(
     port=search_domain_port,
 )
 
-# -- Logging
-class LoggingMiddleware(object):
-    def __init__(self, app):
-        self._app = app
-
-    def __call__(self, environ, resp):
-        errorlog = environ['wsgi.errors']
-        pprint.pprint(('REQUEST', environ), stream=errorlog)
-
-        def log_response(status, headers, *args):
-            pprint.pprint(('RESPONSE', status, headers), stream=errorlog)
-            return resp(status, headers, *args)
-
-        return self._app(environ, log_response)
-
-# -- End Logging
-
 app = Flask(__name__)
 corps = CORS(app)
 
@@ -112,36 +95,37 @@ def search_products():
         # To improve the diversity of hits across categories (particularly important when the search expression is
         # short/vague), the search is collapsed on the category keyword field. This ensures that the top hits are pulled
         # from all categories which are then aggregated into a unified response.
-        results = search_client.search(index = INDEX_PRODUCTS, body={
-            "from": offset,
-            "size": size,
-            "query": {
-                "dis_max" : {
-                    "queries" : [
-                        { "match_bool_prefix" : { "name" : { "query": search_term, "boost": 1.2 }}},
-                        { "match_bool_prefix" : { "category" : search_term }},
-                        { "match_bool_prefix" : { "style" : search_term }},
-                        { "match_bool_prefix" : { "description" : { "query": search_term, "boost": 0.6 }}}
-                    ],
-                    "tie_breaker" : 0.7
-                }
-            },
-            "fields":[
-                "_id"
-            ],
-            "_source": False,
-            "collapse": {
-                "field": "category.keyword",
-                "inner_hits": {
-                    "name": "category_hits",
-                    "size": collapse_size,
-                    "fields":[
-                        "_id"
-                    ],
-                    "_source": False
+        with access_log.upstream('opensearch'):
+            results = search_client.search(index = INDEX_PRODUCTS, body={
+                "from": offset,
+                "size": size,
+                "query": {
+                    "dis_max" : {
+                        "queries" : [
+                            { "match_bool_prefix" : { "name" : { "query": search_term, "boost": 1.2 }}},
+                            { "match_bool_prefix" : { "category" : search_term }},
+                            { "match_bool_prefix" : { "style" : search_term }},
+                            { "match_bool_prefix" : { "description" : { "query": search_term, "boost": 0.6 }}}
+                        ],
+                        "tie_breaker" : 0.7
+                    }
+                },
+                "fields":[
+                    "_id"
+                ],
+                "_source": False,
+                "collapse": {
+                    "field": "category.keyword",
+                    "inner_hits": {
+                        "name": "category_hits",
+                        "size": collapse_size,
+                        "fields":[
+                            "_id"
+                        ],
+                        "_source": False
+                    }
                 }
-            }
-        })
+            })
 
         app.logger.debug(json.dumps(results))
 
@@ -214,21 +198,22 @@ def similar_products():
     app.logger.info(f'Searching for similar products to "{product_id}" starting at {offset} and returning {size} hits')
 
     try:
-        results = search_client.search(index = INDEX_PRODUCTS, body={
-            "from": offset,
-            "size": size,
-                "query": {
-                    "more_like_this": {
-                        "fields": ["name", "category", "style", "description"],
-                        "like": [{
-                            "_index": INDEX_PRODUCTS,
-                            "_id": product_id
-                        }],
-                        "min_term_freq" : 1,
-                        "max_query_terms" : 10
+        with access_log.upstream('opensearch'):
+            results = search_client.search(index = INDEX_PRODUCTS, body={
+                "from": offset,
+                "size": size,
+                    "query": {
+                        "more_like_this": {
+                            "fields": ["name", "category", "style", "description"],
+                            "like": [{
+                                "_index": INDEX_PRODUCTS,
+                                "_id": product_id
+                            }],
+                            "min_term_freq" : 1,
+                            "max_query_terms" : 10
+                        }
                     }
-                }
-            })
+                })
 
         app.logger.debug(json.dumps(results))
 
@@ -251,5 +236,5 @@ def similar_products():
         raise BadRequest(message = 'Unhandled error', status_code = 500)
 
 if __name__ == '__main__':
-    app.wsgi_app = LoggingMiddleware(app.wsgi_app)
+    app.wsgi_app = access_log.AccessLogMiddleware(app.wsgi_app)
     app.run(debug=True,host='0.0.0.0', port=80)
\ No newline at end of file
@@ -10,7 +10,6 @@ import logging
 import json
 import os
 import pathlib
-import pprint
 import subprocess
 import threading
 import time
@@ -20,6 +19,8 @@ import srt
 from flask import Flask, jsonify, Response
 from flask_cors import CORS
 
+import access_log
+
 
 patch_all()
 
@@ -268,23 +269,6 @@ def stream(s3_video_key, ivs_channel_arn, channel_id):
 # -- End Video streaming
 
 
-# -- Logging
-class LoggingMiddleware(object):
-    def __init__(self, app):
-        self._app = app
-
-    def __call__(self, environ, resp):
-        errorlog = environ['wsgi.errors']
-        pprint.pprint(('REQUEST', environ), stream=errorlog)
-
-        def log_response(status, headers, *args):
-            pprint.pprint(('RESPONSE', status, headers), stream=errorlog)
-            return resp(status, headers, *args)
-
-        return self._app(environ, log_response)
-# -- End Logging
-
-
 # -- Exceptions
 class BadRequest(Exception):
     status_code = 400
@@ -341,7 +325,7 @@ def health():
 
 
 if __name__ == '__main__':
-    app.wsgi_app = LoggingMiddleware(app.wsgi_app)
+    app.wsgi_app = access_log.AccessLogMiddleware(app.wsgi_app)
     app.logger.setLevel(level=logging.INFO)
 
     app.logger.info(f"VIDEO_BUCKET: {VIDEO_BUCKET}")